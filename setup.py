@@ -108,7 +108,6 @@ setup(
         'xmltodict',
         'bs4',
         'regex',
-        'timeloop',
     ],
     extras_require = {
         'tests': [
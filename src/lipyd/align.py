@@ -19,7 +19,7 @@
 
 from past.builtins import xrange, range
 
-import itertools
+import collections
 
 import numpy as np
 
@@ -27,9 +27,46 @@ import lipyd.lookup as lookup
 
 
 def align(*arrays, tolerance = 5):
+    """
+    Aligns the values of one dimensional float arrays (e.g. m/z values
+    of features detected in different samples) by grouping the values
+    which are within the range of tolerance.
+    
+    The arrays are concatenated and sorted once, then groups are built
+    in a single sweep: a new group starts where the gap between two
+    consecutive values is larger than the tolerance or the group would
+    become wider than the tolerance. Within a group each array is
+    represented by at most one value; if an array has more values in
+    the same group they are distributed into separate groups: the values
+    of the array with the most values in the group are the centroids,
+    the values of the other arrays are assigned to the nearest centroid.
+    
+    Parameters
+    ----------
+    *arrays : numpy.ndarray
+        One dimensional float arrays, not necessarily sorted.
+        ``nan`` values are ignored.
+    tolerance : float
+        Range of tolerance in ppm.
+        (Default value = 5)
+    
+    Returns
+    -------
+    Tuple of two arrays: the mean value of each group and an integer
+    array with one row for each group and one column for each of the
+    input arrays, with the indices of the values within their original
+    arrays or -1 where an array has no value in the group.
+    Groups are ordered by their mean value.
+    """
     
     narrays = len(arrays)
     
+    if not narrays:
+        
+        return np.array([]), np.zeros((0, 0), dtype = np.int64)
+    
+    arrays = tuple(np.asarray(a, dtype = np.float64).ravel() for a in arrays)
+    
     array  = np.concatenate(arrays)
     # indices within arrays
     idx    = np.concatenate(tuple(
@@ -41,23 +78,190 @@ def align(*arrays, tolerance = 5):
         np.full(a.shape, i)
         for i, a in enumerate(arrays)
     ))
-    # keep track if elements have been used already
-    used = np.full(iarray.shape, False)
+    
+    valid  = ~np.isnan(array)
+    array  = array[valid]
+    idx    = idx[valid]
+    iarray = iarray[valid]
     
     # sort all arrays by values
-    isort  = array.argsort()
+    isort  = array.argsort(kind = 'mergesort')
     array  = array[isort]
     idx    = idx[isort]
     iarray = iarray[isort]
     
-    # here we collect the lines of the result array
-    result = []
+    if not len(array):
+        
+        return np.array([]), np.zeros((0, narrays), dtype = np.int64)
+    
+    segments = _segments(array, tolerance)
+    # position of the group within the segment
+    slots = np.zeros(len(array), dtype = np.int64)
     
-    # these are the array memberships
-    for i, val in enumerate(array):
+    # segments where an array has more than one value
+    counts = np.bincount(segments * narrays + iarray)
+    crowded = np.unique(np.where(counts > 1)[0] // narrays)
+    bounds = np.r_[0, np.where(np.diff(segments))[0] + 1, len(array)]
+    
+    for iseg in crowded:
         
-        partners = lookup.findall(array, val)
+        start, end = bounds[iseg], bounds[iseg + 1]
+        slots[start:end] = _nearest_slots(
+            array[start:end],
+            iarray[start:end],
+        )
+    
+    # group ids ordered by segment, then by slot
+    group_key = segments * (slots.max() + 1) + slots
+    ugroups, groups = np.unique(group_key, return_inverse = True)
+    
+    result = np.full((len(ugroups), narrays), -1, dtype = np.int64)
+    result[groups, iarray] = idx
+    
+    means = (
+        np.bincount(groups, weights = array, minlength = len(ugroups)) /
+        np.bincount(groups, minlength = len(ugroups))
+    )
+    
+    # as slots within a segment follow the centroids this is nearly sorted
+    isort = means.argsort(kind = 'mergesort')
+    
+    return means[isort], result[isort]
+
+
+def _segments(array, tolerance):
+    """
+    Assigns segment numbers to the values of a sorted array.
+    Consecutive values belong to the same segment unless their distance
+    is larger than the tolerance or the segment would exceed the tolerance
+    measured from its first value.
+    
+    Parameters
+    ----------
+    array : numpy.ndarray
+        Sorted one dimensional float array without ``nan`` values.
+    tolerance : float
+        Range of tolerance in ppm.
+    
+    Returns
+    -------
+    Integer array of segment numbers.
+    """
+    
+    gap = np.diff(array) > lookup.ppm_tolerance(tolerance, array[1:])
+    starts = np.r_[0, np.where(gap)[0] + 1, len(array)]
+    
+    # the widest allowed end of a segment starting at each value
+    limits = array.searchsorted(
+        array + lookup.ppm_tolerance(tolerance, array),
+        side = 'right',
+    )
+    
+    # segments narrower than the tolerance are kept as they are,
+    # only the few ones resulted by chaining are split further
+    wide = np.where(limits[starts[:-1]] < starts[1:])[0]
+    
+    if len(wide):
+        
+        extra = []
+        
+        for iseg in wide:
+            
+            start, end = starts[iseg], starts[iseg + 1]
+            
+            while limits[start] < end:
+                
+                start = limits[start]
+                extra.append(start)
+        
+        starts = np.union1d(starts, extra)
+    
+    segments = np.zeros(len(array), dtype = np.int64)
+    segments[starts[1:-1]] = 1
+    
+    return np.cumsum(segments)
+
+
+def _nearest_slots(array, iarray):
+    """
+    Distributes the values of a segment into groups. The values of the
+    array with the most values in the segment are the centroids of the
+    groups. The values of each other array are assigned to the centroids
+    greedily, closest pairs first, so exact and closer matches win.
+    
+    Parameters
+    ----------
+    array : numpy.ndarray
+        Sorted values of one segment.
+    iarray : numpy.ndarray
+        The array each value belongs to.
+    
+    Returns
+    -------
+    Integer array with the group number of each value, the groups are
+    numbered in the order of their centroids.
+    """
+    
+    # segments are short, plain Python is faster here than numpy
+    values = array.tolist()
+    arrays = iarray.tolist()
+    counts = collections.Counter(arrays)
+    ref = min(a for a in counts if counts[a] == max(counts.values()))
+    ref_values = [i for i, a in enumerate(arrays) if a == ref]
+    centroids = [values[i] for i in ref_values]
+    slots = [None] * len(values)
+    taken = set()
+    
+    for j, i in enumerate(ref_values):
+        
+        slots[i] = j
+    
+    # distances in ppm, closest pairs first
+    pairs = sorted(
+        (abs(v - c) / c, i, j)
+        for i, (v, a) in enumerate(zip(values, arrays))
+        if a != ref
+        for j, c in enumerate(centroids)
+    )
+    
+    for dist, i, j in pairs:
+        
+        if slots[i] is None and (arrays[i], j) not in taken:
+            
+            slots[i] = j
+            taken.add((arrays[i], j))
+    
+    return np.array(slots, dtype = np.int64)
+
+
+def values(idx, *arrays, fill = np.nan):
+    """
+    Creates a dense array from the values of the aligned arrays.
+    The result can be used as a variable in ``sample.SampleSet``, e.g.
+    ``mzs``, ``intensities`` or ``rts``.
+    
+    Parameters
+    ----------
+    idx : numpy.ndarray
+        Index array as returned by ``align``.
+    *arrays : numpy.ndarray
+        The arrays in the same order as they were passed to ``align``
+        (or other arrays of the same lengths).
+    fill : float
+        Value for the groups missing from an array.
+        (Default value = nan)
+    
+    Returns
+    -------
+    Float array of the same shape as ``idx``.
+    """
+    
+    result = np.full(idx.shape, fill, dtype = np.float64)
+    
+    for i, a in enumerate(arrays):
         
-        result.append((i, partners))
+        a = np.asarray(a)
+        present = idx[:,i] >= 0
+        result[present, i] = a[idx[present, i]]
     
-    return array, result
+    return result
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://denes.omnipathdb.org/
+#
+
+"""
+Append-only on-disk store of intermediate results, so long runs can be
+resumed after an interruption.
+
+Each result is stored under a key together with the digest of its
+inputs. A result is reused only if it has been stored with the same
+digest, i.e. from the same inputs. The file is a sequence of pickles,
+one for each result. Results are only appended, if a key occurs more
+than once the last one is valid. A partially written record at the end
+of the file, e.g. after the process has been killed, is dropped.
+"""
+
+import os
+import pickle
+import hashlib
+
+import lipyd.session as session
+
+
+def digest(*args):
+    """
+    MD5 digest of the string representation of the arguments.
+    """
+    
+    return hashlib.md5(repr(args).encode('utf-8')).hexdigest()
+
+
+def file_signature(fname):
+    """
+    Absolute path, size and modification time of a file, these tell
+    whether the file has been changed.
+    """
+    
+    stat = os.stat(fname)
+    
+    return os.path.abspath(fname), stat.st_size, stat.st_mtime
+
+
+class CheckpointStore(session.Logger):
+    
+    
+    def __init__(self, fname):
+        """
+        Append-only store of results in a file. Existing results
+        are loaded from the file.
+        
+        fname : str
+            Path to the file.
+        """
+        
+        session.Logger.__init__(self, name = 'checkpoint')
+        
+        self.fname = fname
+        self.records = {}
+        self.fp = None
+        
+        self.load()
+    
+    
+    def load(self):
+        """
+        Reads all complete records from the file. Removes the incomplete
+        record from the end of the file if there is one.
+        """
+        
+        self.records = {}
+        
+        if not os.path.exists(self.fname):
+            
+            return
+        
+        size = os.path.getsize(self.fname)
+        
+        with open(self.fname, 'rb') as fp:
+            
+            while True:
+                
+                pos = fp.tell()
+                
+                if pos >= size:
+                    
+                    break
+                
+                try:
+                    
+                    key, input_digest, value = pickle.load(fp)
+                
+                except Exception:
+                    
+                    self._log(
+                        'Incomplete record at the end of checkpoint file '
+                        '`%s` at byte %u, dropping %u bytes.' % (
+                            self.fname,
+                            pos,
+                            size - pos,
+                        )
+                    )
+                    break
+                
+                self.records[key] = (input_digest, value)
+        
+        if pos < size:
+            
+            with open(self.fname, 'r+b') as fp:
+                
+                fp.truncate(pos)
+        
+        self._log(
+            'Loaded %u records from checkpoint file `%s`.' % (
+                len(self.records),
+                self.fname,
+            )
+        )
+    
+    
+    def get(self, key, input_digest):
+        """
+        Returns the result stored under ``key`` if it has been calculated
+        from inputs with the same digest, otherwise ``None``.
+        """
+        
+        if key in self.records and self.records[key][0] == input_digest:
+            
+            return self.records[key][1]
+    
+    
+    def append(self, key, input_digest, value):
+        """
+        Writes a result to the end of the file.
+        """
+        
+        if self.fp is None or self.fp.closed:
+            
+            dirname = os.path.dirname(os.path.abspath(self.fname))
+            os.makedirs(dirname, exist_ok = True)
+            self.fp = open(self.fname, 'ab')
+        
+        pickle.dump(
+            (key, input_digest, value),
+            self.fp,
+            protocol = pickle.HIGHEST_PROTOCOL,
+        )
+        self.fp.flush()
+        self.records[key] = (input_digest, value)
+    
+    
+    def close(self):
+        
+        if self.fp is not None and not self.fp.closed:
+            
+            os.fsync(self.fp.fileno())
+            self.fp.close()
+    
+    
+    def __enter__(self):
+        
+        return self
+    
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        
+        self.close()
+    
+    
+    def __del__(self):
+        
+        self.close()
+    
+    
+    def __len__(self):
+        
+        return len(self.records)
+    
+    
+    def __contains__(self, key):
+        
+        return key in self.records
+    
+    
+    def __repr__(self):
+        
+        return '<Checkpoint store `%s`: %u records>' % (
+            self.fname,
+            len(self),
+        )
@@ -725,3 +725,94 @@ def to_number(value):
         except:
             
             pass
+
+
+def _table_format(fname, fmt = None):
+    
+    if fmt:
+        
+        return fmt.lower()
+    
+    return (
+        'parquet'
+            if os.path.splitext(fname)[1].lower() in {'.parquet', '.pq'} else
+        'tsv'
+    )
+
+
+def _str_column(col):
+    
+    if isinstance(col, np.ndarray) and col.dtype.kind in 'biuf':
+        
+        return col.astype(str)
+    
+    return [v if isinstance(v, basestring) else str(v) for v in col]
+
+
+def write_table(fname, header, columns, fmt = None, chunk_size = 10000):
+    """
+    Writes a table given as columns into a file.
+    
+    Parameters
+    ----------
+    fname : str
+        Path to the output file.
+    header : list
+        Column names.
+    columns : list
+        Sequences (lists or arrays) of equal length, one for each column.
+    fmt : str
+        Either ``tsv`` or ``parquet``; by default ``parquet`` if the file
+        name ends by ``.parquet`` or ``.pq``, otherwise ``tsv``. Writing
+        Parquet requires the ``pyarrow`` module.
+    chunk_size : int
+        Number of lines written to the TSV file at once.
+    """
+    
+    fmt = _table_format(fname, fmt)
+    
+    if fmt == 'parquet':
+        
+        import pyarrow
+        import pyarrow.parquet
+        
+        table = pyarrow.table(
+            dict(
+                (
+                    name,
+                    pyarrow.array(
+                        list(col)
+                            if not isinstance(col, np.ndarray) or
+                            col.dtype == object else
+                        col
+                    ),
+                )
+                for name, col in zip(header, columns)
+            )
+        )
+        pyarrow.parquet.write_table(table, fname)
+        
+    elif fmt == 'tsv':
+        
+        rows = zip(*(_str_column(col) for col in columns))
+        
+        with open(fname, 'w') as fp:
+            
+            _ = fp.write('\t'.join(header))
+            
+            while True:
+                
+                chunk = [
+                    '\n%s' % '\t'.join(row)
+                    for row in itertools.islice(rows, chunk_size)
+                ]
+                
+                if not chunk:
+                    
+                    break
+                
+                _ = fp.write(''.join(chunk))
+        
+    else:
+        
+        raise ValueError('Unknown table format: `%s`.' % fmt)
@@ -21,6 +21,7 @@ import imp
 import os
 
 import lipyd.session as session
+import lipyd.timing as timing
 import lipyd.msproc as msproc
 import lipyd.sample as sample
 
@@ -66,6 +67,7 @@ class Experiment(session.Logger):
         new = getattr(mod, self.__class__.__name__)
         setattr(self, '__class__', new)
 
+    @timing.timed('experiment.main')
     def main(self):
 
         self.preprocess()
@@ -91,6 +93,7 @@ class Experiment(session.Logger):
 
             RuntimeError('Lipyd doesn`t handle this format of file')
 
+    @timing.timed('experiment.preprocess')
     def preprocess_main(self): 
 
         self.check_input()
@@ -147,6 +150,7 @@ class Experiment(session.Logger):
             )
         )
 
+    @timing.timed('experiment.identification')
     def identification(self):
 
         self.samples.database_lookup()
@@ -20,12 +20,67 @@
 from future.utils import iteritems
 from past.builtins import xrange, range
 
+import itertools
+import operator
+import warnings
+
 import numpy as np
 
 import lipyd.sampleattrs as sampleattrs
 import lipyd.common as common
 
 
+def _nanreduce(method, a, axis = 1):
+    """
+    Applies a NaN-aware reduction along an axis without warning about
+    slices containing only NaNs (these result NaN) and returning NaNs
+    also for empty slices.
+    """
+    
+    a = np.asarray(a, dtype = np.float64)
+    
+    if a.shape[axis] == 0:
+        
+        shape = tuple(n for i, n in enumerate(a.shape) if i != axis)
+        
+        return np.full(shape, np.nan)
+    
+    with warnings.catch_warnings():
+        
+        warnings.simplefilter('ignore', category = RuntimeWarning)
+        
+        return method(a, axis = axis)
+
+
+def nanmax(a, axis = 1):
+    """
+    NaN-aware maximum along an axis, by default along the samples axis
+    of feature vs. sample arrays.
+    """
+    
+    return _nanreduce(np.nanmax, a, axis = axis)
+
+
+def nanmin(a, axis = 1):
+    """
+    NaN-aware minimum along an axis, by default along the samples axis
+    of feature vs. sample arrays.
+    """
+    
+    return _nanreduce(np.nanmin, a, axis = axis)
+
+
+def nanle(a, b):
+    """
+    Tells if ``a`` is less or equal than ``b``, considering the relation
+    true if any of them is NaN. Works on scalars and arrays alike.
+    """
+    
+    with np.errstate(invalid = 'ignore'):
+        
+        return np.isnan(a) | np.isnan(b) | (np.asarray(a) <= b)
+
+
 class Feature(object):
     
     
@@ -74,7 +129,14 @@ class Feature(object):
 class FeatureAnalyzer(object):
     
     
-    def __init__(self, names, samples, method, **variables):
+    def __init__(
+            self,
+            names,
+            samples,
+            method,
+            vectorized = False,
+            **variables
+        ):
         """
         Serves for analysis of features using data in the feature vs. sample
         data arrays in ``SampleSet`` objects and feature variables in
@@ -96,6 +158,13 @@ class FeatureAnalyzer(object):
             for each sample one by one. At the end the resulted array
             will be registered as a new variable in the ``FeatureAttrs``
             object of the ``SampleSet`` under the attribute name ``name``.
+        vectorized : bool
+            Call ``method`` only once with the whole arrays instead of
+            calling it for each feature. In this case the feature variables
+            are passed as arrays with their first dimension along the
+            features and the sampleset variables as feature vs. sample
+            arrays. The method should return an array (or a tuple of
+            arrays) with one element for each feature.
         **variables :
             Custom ``SampleData`` or derived objects. Will be provided to
             ``method`` by their argument name.
@@ -108,6 +177,7 @@ class FeatureAnalyzer(object):
         )
         self.samples = samples
         self.method = method
+        self.vectorized = vectorized
         self.variables = variables
         
         result = self.run()
@@ -117,26 +187,46 @@ class FeatureAnalyzer(object):
             self.samples.feattrs._add_var(res, name)
     
     
+    def featurevars(self):
+        """
+        Returns a dict with all feature variables and all sampleset
+        variables, i.e. all arrays with their first axis along the features.
+        """
+        
+        featurevars = dict(
+            (var, getattr(self.samples.feattrs, var))
+            for var in self.samples.feattrs.var
+        )
+        
+        # safe to do this as first axis is always the features
+        featurevars.update(
+            (var, getattr(self.samples, var))
+            for var in self.samples.var
+        )
+        
+        return featurevars
+    
+    
     def run(self):
         """
         Applies the method for each feature and returns an array of the
         results.
         """
         
+        if self.vectorized:
+            
+            return self.run_vectorized()
+        
         result = [[] for _ in xrange(len(self.names))]
         
+        allvars = self.featurevars()
+        
         for i in xrange(len(self.samples)):
             
-            featurevars = {}
-            
-            for var in self.samples.feattrs.var:
-                
-                featurevars[var] = getattr(self.samples.feattrs, var)[i]
-            
-            for var in self.samples.var:
-                
-                # safe to do this as first axis is always the features
-                featurevars[var] = getattr(self.samples, var)[i]
+            featurevars = dict(
+                (var, data[i])
+                for var, data in iteritems(allvars)
+            )
             
             this_result = self.method(**featurevars, **self.variables)
             
@@ -144,13 +234,28 @@ class FeatureAnalyzer(object):
                 
                 this_result = (this_result,)
             
-            for i, value in enumerate(this_result):
+            for j, value in enumerate(this_result):
                 
-                result[i].append(value)
+                result[j].append(value)
         
         result = tuple(np.array(r) for r in result)
         
         return result
+    
+    
+    def run_vectorized(self):
+        """
+        Calls the method once with the whole feature and feature vs. sample
+        arrays and returns a tuple of arrays.
+        """
+        
+        result = self.method(**self.featurevars(), **self.variables)
+        
+        if not isinstance(result, tuple):
+            
+            result = (result,)
+        
+        return tuple(np.asarray(r) for r in result)
 
 
 class ProfileAnalyzer(FeatureAnalyzer):
@@ -161,16 +266,22 @@ class ProfileAnalyzer(FeatureAnalyzer):
             protein = None,
             condition = None,
             profile_filter_args = (),
+            vectorized = True,
         ):
         
         self.protein = protein
         self.condition = condition
         
-        feature.FeatureAnalyzer.__init__(
+        FeatureAnalyzer.__init__(
             self,
             names = ('profile',),
             samples = samples,
-            method = self.profile_method,
+            method = (
+                self.profile_method_vectorized
+                    if vectorized else
+                self.profile_method
+            ),
+            vectorized = vectorized,
             _samples = samples,
             profile_filter_args = profile_filter_args,
             protein = protein,
@@ -271,6 +382,84 @@ class ProfileAnalyzer(FeatureAnalyzer):
                 return False
         
         return True
+    
+    @staticmethod
+    def profile_method_vectorized(
+            intens_norm,
+            _samples,
+            profile_filter_args = (),
+            protein = None,
+            condition = None,
+            **kwargs,
+        ):
+        """
+        Does the same as ``profile_method`` for all features at once,
+        ``intens_norm`` is a feature vs. sample array.
+        Returns a boolean array.
+        """
+        
+        def sample_idx(*labels):
+            
+            return np.array([
+                _samples.attrs.get_sample_index(sample_id)
+                for sample_id in
+                itertools.chain(*(
+                    profile_filter_args[label][0]
+                    for label in labels
+                ))
+            ], dtype = np.int64)
+        
+        # intensities in fraction categories
+        high_protein = intens_norm[:,sample_idx('peak')]
+        some_protein = intens_norm[:,sample_idx('small', 'tiny')]
+        no_protein = intens_norm[:,sample_idx('none')]
+        
+        # exclude those completely missing from the peak
+        result = np.logical_not(np.all(np.isnan(high_protein), axis = 1))
+        
+        # apply single fraction operators
+        
+        with np.errstate(invalid = 'ignore'):
+            
+            for (
+                label,
+                (sample_ids, threshold, op)
+            ) in iteritems(profile_filter_args):
+                
+                for sample_id in sample_ids:
+                    
+                    i = _samples.attrs.get_sample_index(sample_id)
+                    
+                    this_ok = op(intens_norm[:,i], threshold)
+                    
+                    if op == operator.le:
+                        
+                        this_ok = this_ok | np.isnan(intens_norm[:,i])
+                    
+                    result &= this_ok
+        
+        # additional constraints
+        
+        some_protein_min = np.where(
+            np.any(np.isnan(some_protein), axis = 1),
+            np.nan,
+            nanmin(some_protein),
+        )
+        
+        result &= nanle(nanmax(no_protein) * .6, some_protein_min)
+        
+        # exclude hollow shape profiles
+        
+        with np.errstate(invalid = 'ignore'):
+            
+            for i in sample_idx('peak', 'small')[1:-1]:
+                
+                result &= np.logical_not(
+                    (intens_norm[:,i] * 2 < intens_norm[:,i - 1]) &
+                    (intens_norm[:,i] * 2 < intens_norm[:,i + 1])
+                )
+        
+        return result
 
 
 class PeakSize(FeatureAnalyzer):
@@ -283,6 +472,7 @@ class PeakSize(FeatureAnalyzer):
             threshold = 2.0,
             names = ('peaksize', 'peaksize_value'),
             min_max = 'min',
+            vectorized = True,
         ):
         """
 
@@ -304,6 +494,9 @@ class PeakSize(FeatureAnalyzer):
             selection must be `threshold` times higher than the highest in
             the background. If `max` the `highest` element in the selection
             considered.
+        vectorized : bool
+            Process all features at once. If ``False`` the method is
+            called for each feature.
         """
         
         self.threshold = threshold
@@ -312,7 +505,12 @@ class PeakSize(FeatureAnalyzer):
             self,
             names = names,
             samples = samples,
-            method = self.peak_size,
+            method = (
+                self.peak_size_vectorized
+                    if vectorized else
+                self.peak_size
+            ),
+            vectorized = vectorized,
             sample_selection = sample_selection,
             min_max = min_max,
         )
@@ -339,6 +537,41 @@ class PeakSize(FeatureAnalyzer):
                 np.inf
             ),
         )
+    
+    def peak_size_vectorized(
+            self,
+            intensities,
+            sample_selection,
+            min_max,
+            **kwargs
+        ):
+        """
+        Does the same as ``peak_size`` for all features at once,
+        ``intensities`` is a feature vs. sample array.
+        """
+        
+        _method = nanmax if min_max == 'max' else nanmin
+        sample_selection = np.asarray(sample_selection, dtype = bool)
+        protein   = intensities[:,sample_selection]
+        noprotein = intensities[:,np.logical_not(sample_selection)]
+        
+        protein_nan = np.any(np.isnan(protein), axis = 1)
+        noprotein_nan = np.all(np.isnan(noprotein), axis = 1)
+        
+        highest = _method(protein)
+        backg = nanmax(noprotein)
+        
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            
+            passed = highest > backg * self.threshold
+            value = np.where(backg > 0, highest / backg, np.inf)
+        
+        passed[noprotein_nan] = True
+        value[noprotein_nan] = np.inf
+        passed[protein_nan] = False
+        value[protein_nan] = 0.0
+        
+        return passed, value
 
 
 class Slope(FeatureAnalyzer):
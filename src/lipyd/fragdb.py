@@ -33,6 +33,8 @@ import lipyd.formula as formula
 import lipyd.settings as settings
 import lipyd.lookup as lookup_
 import lipyd.session as session
+import lipyd.records as records
+import lipyd.shared as shared
 
 
 class FragmentDatabaseAggregator(object):
@@ -159,11 +161,141 @@ class FragmentDatabaseAggregator(object):
             (frag[1], i)
             for i, frag in enumerate(self.fragments)
         )
+        # the m/z's of the neutral losses and the charged ions separately
+        # for the vectorized lookups
+        self.nl_index = np.where(self.fragments[:,6] == 0)[0]
+        self.charged_index = np.where(self.fragments[:,6] != 0)[0]
+        self.nl_mzs = self.fragments[self.nl_index,0].astype(np.float64)
+        self.charged_mzs = (
+            self.fragments[self.charged_index,0].astype(np.float64)
+        )
     
     def __iter__(self):
         
         return self.fragments.__iter__()
     
+    def share(self, fname = None):
+        """
+        Writes the database into a memory mapped file so other processes
+        can use it by ``attach`` without building it. The columns of the
+        fragment table are stored as arrays and the strings in a string
+        table, the indexes for the vectorized lookups are shared by the
+        attached processes.
+        
+        Parameters
+        ----------
+        fname : str
+            Path to the file, by default a new file in ``/dev/shm``.
+            The file is not removed automatically.
+        
+        Returns
+        -------
+        The path to the file.
+        """
+        
+        strings = records.StringTable()
+        
+        def string_ids(col, dedup = False):
+            
+            return np.array(
+                [
+                    strings.add(s if isinstance(s, str) else None, dedup)
+                    for s in self.fragments[:,col]
+                ],
+                dtype = np.int64,
+            )
+        
+        arrays = {
+            'mzs': self.fragments[:,0].astype(np.float64),
+            'names': string_ids(1),
+            'fragtypes': string_ids(2, dedup = True),
+            'chaintypes': string_ids(3, dedup = True),
+            'c': self.fragments[:,4].astype(np.float64),
+            'u': self.fragments[:,5].astype(np.float64),
+            'charges': self.fragments[:,6].astype(np.int64),
+            'nl_index': self.nl_index,
+            'charged_index': self.charged_index,
+            'nl_mzs': self.nl_mzs,
+            'charged_mzs': self.charged_mzs,
+        }
+        strings.freeze()
+        arrays.update(
+            ('strings_%s' % name, arr)
+            for name, arr in iteritems(strings.arrays())
+        )
+        
+        meta = dict(
+            (attr, getattr(self, attr))
+            for attr in (
+                'ionmode', 'tolerance', 'files', 'include', 'exclude',
+                'fa_default', 'sph_default', 'fal_default', 'constraints',
+            )
+        )
+        
+        return shared.save(
+            fname or shared.new_fname('fragdb_%s' % self.ionmode),
+            arrays,
+            meta,
+        )
+    
+    @classmethod
+    def attach(cls, fname):
+        """
+        Creates a database from a file written by ``share``. The fragment
+        table is small, it is created right away, while the indexes
+        for the lookups are mapped read only from the file.
+        """
+        
+        arrays, meta = shared.load(fname)
+        constraints = meta.pop('constraints')
+        
+        new = cls(build = False, **meta)
+        new.constraints = constraints
+        
+        strings = records.StringTable.from_arrays(
+            arrays['strings_buffer'],
+            arrays['strings_offsets'],
+        )
+        
+        def get_strings(name):
+            
+            return [
+                np.nan if i < 0 else strings[i]
+                for i in arrays[name].tolist()
+            ]
+        
+        def get_numbers(name):
+            
+            return [
+                x if np.isnan(x) else int(x)
+                for x in arrays[name].tolist()
+            ]
+        
+        new.fragments = np.empty((len(arrays['mzs']), 7), dtype = np.object)
+        
+        for col, values in enumerate((
+            arrays['mzs'].tolist(),
+            get_strings('names'),
+            get_strings('fragtypes'),
+            get_strings('chaintypes'),
+            get_numbers('c'),
+            get_numbers('u'),
+            arrays['charges'].tolist(),
+        )):
+            
+            new.fragments[:,col] = values
+        
+        new.frags_by_name = dict(
+            (frag[1], i)
+            for i, frag in enumerate(new.fragments)
+        )
+        
+        for attr in ('nl_index', 'charged_index', 'nl_mzs', 'charged_mzs'):
+            
+            setattr(new, attr, arrays[attr])
+        
+        return new
+    
     def set_filenames(self):
         """Sets the `files` attribute to be a list of filenames.
         If no `files` argument provided the built in default
@@ -502,6 +634,71 @@ class FragmentDatabaseAggregator(object):
         
         return self.fragments[idx,:]
     
+    def lookup_many(self, mzs, nl = False, tolerance = None):
+        """Searches for fragments in the database matching each of the
+        m/z's. The result is the same as calling `lookup` for each m/z
+        but the searches are vectorized.
+        
+        Parameters
+        ----------
+        mzs : numpy.array
+            The m/z values.
+        nl : bool
+            The m/z's are neutral losses.
+        tolerance : float,numpy.array
+            Tolerance in ppm, one value for all or one for each m/z.
+            By default the `tolerance` attribute.
+        
+        Returns
+        -------
+        List of arrays of fragment data.
+        """
+        
+        index, mzs_db = (
+            (self.nl_index, self.nl_mzs)
+                if nl else
+            (self.charged_index, self.charged_mzs)
+        )
+        
+        tolerance = (
+            self.tolerance
+                if tolerance is None else
+            # zero means default as in `lookup`
+            np.where(tolerance == 0, self.tolerance, tolerance)
+        )
+        
+        return [
+            self.fragments[index[idx],:]
+            for idx in lookup_.findall_each(mzs_db, mzs, tolerance)
+        ]
+    
+    def lookup_nl_many(self, mzs, precursor, tolerance = None):
+        """Searches for neutral loss fragments in the database matching
+        each of the m/z's. The vectorized version of `lookup_nl`.
+        
+        Parameters
+        ----------
+        mzs : numpy.array
+            The m/z values.
+        precursor : float
+            The precursor m/z.
+        tolerance : float
+            Tolerance in ppm, by default the `tolerance` attribute.
+        
+        Returns
+        -------
+        List of arrays of fragment data.
+        """
+        
+        mzs = np.asarray(mzs, dtype = np.float64)
+        nlmzs = precursor - mzs
+        
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            
+            nl_tolerance = mzs / nlmzs * (tolerance or self.tolerance)
+        
+        return self.lookup_many(nlmzs, nl = True, tolerance = nl_tolerance)
+    
     def lookup_nl(self, mz, precursor, tolerance = None):
         """Searches for neutral loss fragments in the database matching the
         m/z within the actual range of tolerance.
@@ -574,6 +771,18 @@ class FragmentDatabaseAggregator(object):
         return self.fragments[i][0] if i is not None else None
 
 
+#: Incremented each time a fragment database is created by ``init_db``
+#: or set by ``attach_db``, for the caches depending on the databases.
+version = 0
+
+
+def _changed():
+    
+    global version
+    
+    version += 1
+
+
 def init_db(ionmode, **kwargs):
     """Creates a fragment database.
 
@@ -593,6 +802,32 @@ def init_db(ionmode, **kwargs):
     attr = 'db_%s' % ionmode
     
     setattr(mod, attr, FragmentDatabaseAggregator(ionmode, **kwargs))
+    _changed()
+
+def share_db(ionmode, fname = None, **kwargs):
+    """
+    Writes the fragment database for the ion mode into a memory mapped
+    file for other processes, see ``FragmentDatabaseAggregator.share``.
+    The keyword arguments are passed to ``get_db``.
+    
+    Returns
+    -------
+    The path to the file.
+    """
+    
+    return get_db(ionmode, **kwargs).share(fname)
+
+def attach_db(fname):
+    """
+    Sets the fragment database of the ion mode to the one shared in
+    a file by ``share_db``, e.g. in the initializer of worker processes.
+    """
+    
+    mod = sys.modules[__name__]
+    db = FragmentDatabaseAggregator.attach(fname)
+    
+    setattr(mod, 'db_%s' % db.ionmode, db)
+    _changed()
 
 def get_db(ionmode, **kwargs):
     """Returns fragment database for the ion mode requested.
@@ -677,6 +912,52 @@ def lookup_nl(mz, precursor, ionmode, tolerance = None):
     db = get_db(ionmode)
     return db.lookup_nl(mz, precursor, tolerance = tolerance)
 
+def lookup_many(mzs, ionmode, nl = False, tolerance = None):
+    """Looks up many m/z's in the fragment database, the vectorized
+    version of `lookup`.
+    
+    Parameters
+    ----------
+    mzs : numpy.array
+        Measured MS2 fragment m/z values.
+    ionmode : str
+        MS ion mode; `pos` or `neg`.
+    nl : bool
+        Look up charged ion or neutral loss m/z's.
+    tolerance :
+         (Default value = None)
+    
+    Returns
+    -------
+    List of arrays of fragment data.
+    """
+    
+    db = get_db(ionmode)
+    return db.lookup_many(mzs, nl = nl, tolerance = tolerance)
+
+def lookup_nl_many(mzs, precursor, ionmode, tolerance = None):
+    """Looks up many MS2 neutral losses in the fragment database,
+    the vectorized version of `lookup_nl`.
+    
+    Parameters
+    ----------
+    mzs : numpy.array
+        Measured MS2 fragment m/z values.
+    precursor : float
+        The precursor m/z.
+    ionmode : str
+        MS ion mode; `pos` or `neg`.
+    tolerance :
+         (Default value = None)
+    
+    Returns
+    -------
+    List of arrays of fragment data.
+    """
+    
+    db = get_db(ionmode)
+    return db.lookup_nl_many(mzs, precursor, tolerance = tolerance)
+
 def lookup_pos(mz, tolerance = None):
     """
 
@@ -851,9 +1132,53 @@ class FragmentAnnotator(object):
     
     def __iter__(self):
         
-        for mz in self.mzs:
+        for nl_annot, annot in zip(self.neutral_losses(), self.charged()):
+            
+            yield nl_annot + annot
+    
+    def charged(self):
+        """Annotates all fragments with the charged ion identities from
+        the fragment database. These do not depend on the precursor.
+        
+        Returns
+        -------
+        List of tuples of `FragmentAnnotation` objects.
+        """
+        
+        return [
+            tuple(FragmentAnnotation(*a) for a in annot)
+            for annot in lookup_many(
+                self.mzs, self.ionmode, tolerance = self.tolerance
+            )
+        ]
+    
+    def neutral_losses(self, precursor = None):
+        """Annotates all fragments with the neutral loss identities from
+        the fragment database.
+        
+        Parameters
+        ----------
+        precursor : float
+            The precursor m/z, by default the `precursor` attribute.
+            If no precursor available the annotations are empty.
+        
+        Returns
+        -------
+        List of tuples of `FragmentAnnotation` objects.
+        """
+        
+        precursor = precursor or self.precursor
+        
+        if not precursor:
             
-            yield self.annotate(mz)
+            return [()] * len(self.mzs)
+        
+        return [
+            tuple(FragmentAnnotation(*a) for a in nl_annot)
+            for nl_annot in lookup_nl_many(
+                self.mzs, precursor, self.ionmode, tolerance = self.tolerance
+            )
+        ]
     
     def annotate(self, mz):
         """Annotates the fragments in MS2 scan with possible identities taken
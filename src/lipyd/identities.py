@@ -0,0 +1,631 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://denes.omnipathdb.org/
+#
+
+"""
+Columnar storage of MS2 identification results (``ms2.MS2Identity``
+objects) of many features.
+
+The identities of all features are stored in one table of arrays, the
+lipids (headgroup and chains) and the grouping keys are interned.
+Sorting, grouping and selecting the top identities of the features
+are done by array operations, strings are formatted only for the rows
+to be exported.
+"""
+
+from future.utils import iteritems
+
+import array
+import collections
+
+import numpy as np
+
+import lipyd.lipproc as lipproc
+import lipyd.common as common
+
+
+#: Levels of grouping and representation of the identities
+levels = ('species', 'subspecies', 'subclass', 'class')
+
+#: Rank of identities without chain fragments
+_NORANK = 9999
+
+
+class IdentityTable(object):
+    """
+    MS2 identities of many features as columns of arrays.
+    """
+    
+    
+    # columns: name, typecode, dtype
+    _columns = (
+        ('feature', 'q', np.int64),
+        # order of the identity within the feature as the
+        # ``MS2Feature.identities_group_by`` method iterates them
+        ('order', 'q', np.int64),
+        ('lipid', 'i', np.int32),
+        ('species', 'i', np.int32),
+        ('score', 'd', np.float64),
+        ('max_score', 'd', np.float64),
+        ('score_pct', 'd', np.float64),
+        ('deltart', 'd', np.float64),
+        ('rank', 'q', np.int64),
+        ('scan_id', 'q', np.int64),
+        ('sample', 'i', np.int32),
+        ('adduct', 'i', np.int32),
+        ('error', 'd', np.float64),
+    )
+    
+    
+    def __init__(self, features = None):
+        """
+        Stores the identities of ``ms2.MS2Feature`` objects.
+        
+        Features are added by ``add_feature`` and the table becomes
+        accessible after ``freeze`` has been called.
+        
+        Parameters
+        ----------
+        features : iterable
+            ``ms2.MS2Feature`` objects with identification results;
+            if provided they are added with their position as feature
+            ID and the table is frozen right away.
+        """
+        
+        for name, typecode, dtype in self._columns:
+            
+            setattr(self, name, array.array(typecode))
+        
+        # interned strings: group keys, sample labels, adducts
+        self.strings = []
+        self._strings = {}
+        # interned lipids: (hg, chainsum, chains)
+        self.lipids = []
+        self._lipids = {}
+        # string representations of the lipids at each level
+        self.lipid_str = dict((level, []) for level in levels)
+        self.lipid_key = {'subspecies': [], 'subclass': [], 'class': []}
+        self.precursor_details = array.array('b')
+        self.nfeatures = 0
+        self._frozen = False
+        
+        if features is not None:
+            
+            for i, fe in enumerate(features):
+                
+                self.add_feature(fe, i)
+            
+            self.freeze()
+    
+    
+    def _intern(self, s):
+        
+        if s not in self._strings:
+            
+            self._strings[s] = len(self.strings)
+            self.strings.append(s)
+        
+        return self._strings[s]
+    
+    
+    def _intern_lipid(self, ident):
+        
+        key = (ident.hg, ident.chainsum, ident.chains)
+        
+        if key not in self._lipids:
+            
+            self._lipids[key] = len(self.lipids)
+            self.lipids.append(key)
+            
+            for level in levels:
+                
+                self.lipid_str[level].append(
+                    getattr(ident, '%s_str' % level)()
+                )
+            
+            # the keys ``MS2Feature.identities_group_by`` uses
+            self.lipid_key['subspecies'].append(
+                self._intern(lipproc.full_str(ident.hg, ident.chains))
+            )
+            self.lipid_key['subclass'].append(
+                self._intern(lipproc.subclass_str(ident.hg))
+            )
+            self.lipid_key['class'].append(
+                self._intern(lipproc.class_str(ident.hg))
+            )
+        
+        return self._lipids[key]
+    
+    
+    @staticmethod
+    def _sample_str(sample_id):
+        
+        # the same as in ``MS2Feature.format_ms2id``
+        return '%s%u' % (
+            sample_id[0],
+            sample_id[1] if len(sample_id) > 1 else 0,
+        )
+    
+    
+    def add_feature(self, feature, feature_id = None):
+        """
+        Adds the identities of one feature.
+        
+        Parameters
+        ----------
+        feature : ms2.MS2Feature
+            A feature after identification, i.e. its ``identities``
+            attribute is a list of dicts as returned by ``Scan.identify``.
+        feature_id : int
+            ID of the feature, by default the next integer.
+        """
+        
+        feature_id = self.nfeatures if feature_id is None else feature_id
+        self.nfeatures = max(self.nfeatures, feature_id + 1)
+        
+        while len(self.precursor_details) < self.nfeatures:
+            
+            self.precursor_details.append(0)
+        
+        self.precursor_details[feature_id] = int(
+            bool(getattr(feature, 'add_precursor_details', False))
+        )
+        
+        order = 0
+        
+        for scan in getattr(feature, 'identities', None) or ():
+            
+            for sum_str, varieties in iteritems(scan):
+                
+                for ident in varieties:
+                    
+                    self.add_identity(ident, feature_id, order, sum_str)
+                    order += 1
+    
+    
+    def add_identity(self, ident, feature_id, order = 0, sum_str = None):
+        """
+        Adds one ``ms2.MS2Identity``.
+        
+        Parameters
+        ----------
+        ident : ms2.MS2Identity
+            Identification result.
+        feature_id : int
+            ID of the feature.
+        order : int
+            Order of the identity within the feature, used at ties.
+        sum_str : str
+            The species level key of the identity; by default the
+            species string of the identity.
+        """
+        
+        scan_details = ident.scan_details
+        precursor_details = ident.precursor_details
+        
+        rank = (
+            min(
+                (r for r in ident.chain_details.rank if r is not None),
+                default = _NORANK,
+            )
+                if ident.chain_details else
+            _NORANK
+        )
+        
+        self.feature.append(feature_id)
+        self.order.append(order)
+        self.lipid.append(self._intern_lipid(ident))
+        self.species.append(
+            self._intern(
+                ident.species_str() if sum_str is None else sum_str
+            )
+        )
+        self.score.append(ident.score)
+        self.max_score.append(ident.max_score)
+        self.score_pct.append(ident.score_pct)
+        self.rank.append(rank)
+        
+        if scan_details:
+            
+            self.deltart.append(
+                np.nan
+                    if scan_details.deltart is None else
+                scan_details.deltart
+            )
+            self.scan_id.append(
+                -1 if scan_details.scan_id is None else
+                int(scan_details.scan_id)
+            )
+            self.sample.append(
+                -1 if scan_details.sample_id is None else
+                self._intern(self._sample_str(scan_details.sample_id))
+            )
+        
+        else:
+            
+            self.deltart.append(np.nan)
+            self.scan_id.append(-1)
+            self.sample.append(-1)
+        
+        if precursor_details:
+            
+            self.adduct.append(
+                -1 if precursor_details.adduct is None else
+                self._intern(precursor_details.adduct)
+            )
+            self.error.append(
+                np.nan
+                    if precursor_details.error is None else
+                precursor_details.error
+            )
+        
+        else:
+            
+            self.adduct.append(-1)
+            self.error.append(np.nan)
+    
+    
+    def freeze(self):
+        """
+        Converts the columns to ``numpy`` arrays.
+        """
+        
+        if self._frozen:
+            
+            return
+        
+        for name, typecode, dtype in self._columns:
+            
+            setattr(
+                self,
+                name,
+                np.frombuffer(getattr(self, name), dtype = dtype).copy(),
+            )
+        
+        for level in levels:
+            
+            self.lipid_str[level] = np.array(
+                self.lipid_str[level],
+                dtype = object,
+            )
+        
+        for level, keys in iteritems(self.lipid_key):
+            
+            self.lipid_key[level] = np.array(keys, dtype = np.int32)
+        
+        self.precursor_details = np.frombuffer(
+            self.precursor_details,
+            dtype = np.int8,
+        ).astype(bool)
+        self._frozen = True
+    
+    
+    def __len__(self):
+        
+        return len(self.feature)
+    
+    
+    def group_key(self, by = 'subspecies'):
+        """
+        Returns the integer key of the group of each identity.
+        
+        Parameters
+        ----------
+        by : str
+            Level of grouping: ``species``, ``subspecies``, ``subclass``
+            or ``class``.
+        """
+        
+        return (
+            self.species
+                if by == 'species' else
+            self.lipid_key[by][self.lipid]
+        )
+    
+    
+    def sort_keys(self):
+        """
+        Returns the keys to sort identities within a feature or a group:
+        the same as ``MS2Feature.identities_sort`` i.e. score, absolute
+        delta RT, rank of chain fragments and finally the original order.
+        Suitable for ``numpy.lexsort``, hence the last is the primary key.
+        """
+        
+        absdrt = np.abs(self.deltart)
+        absdrt[np.isnan(absdrt)] = 0.
+        
+        return (self.order, self.rank, absdrt, -self.score_pct)
+    
+    
+    def groups(self, by = 'subspecies'):
+        """
+        Groups the identities within each feature.
+        
+        Parameters
+        ----------
+        by : str
+            Level of grouping: ``species``, ``subspecies``, ``subclass``
+            or ``class``.
+        
+        Returns
+        -------
+        Tuple of three arrays: the row indices sorted by feature, group
+        and the sort keys of ``sort_keys``; the start of each group in
+        this order and the order of the first appearance of each group
+        within its feature.
+        """
+        
+        key = self.group_key(by)
+        idx = np.lexsort(self.sort_keys() + (key, self.feature))
+        
+        new_group = np.ones(len(idx), dtype = bool)
+        new_group[1:] = np.logical_or(
+            np.diff(self.feature[idx]) != 0,
+            np.diff(key[idx]) != 0,
+        )
+        starts = np.where(new_group)[0]
+        first = (
+            np.minimum.reduceat(self.order[idx], starts)
+                if len(idx) else
+            np.zeros(0, dtype = np.int64)
+        )
+        
+        return idx, starts, first
+    
+    
+    def top(self, n = 1, by = 'species'):
+        """
+        Selects the best ``n`` groups of identities for each feature.
+        
+        Parameters
+        ----------
+        n : int
+            Number of groups to select for each feature.
+        by : str
+            Level of grouping: ``species``, ``subspecies``, ``subclass``
+            or ``class``.
+        
+        Returns
+        -------
+        Array of row indices of the best identity in each selected
+        group, sorted by feature and then by the sort keys.
+        """
+        
+        idx, starts, first = self.groups(by)
+        heads = idx[starts]
+        
+        heads = heads[
+            np.lexsort(
+                tuple(k[heads] for k in self.sort_keys()) +
+                (self.feature[heads],)
+            )
+        ]
+        
+        new_feature = np.ones(len(heads), dtype = bool)
+        new_feature[1:] = np.diff(self.feature[heads]) != 0
+        fstarts = np.where(new_feature)[0]
+        ranks = (
+            np.arange(len(heads)) -
+            np.repeat(fstarts, np.diff(np.append(fstarts, len(heads))))
+        )
+        
+        return heads[ranks < n]
+    
+    
+    def format(self, rows, repr_level = 'subspecies'):
+        """
+        Formats identities as ``MS2Feature.format_ms2id`` does.
+        
+        Parameters
+        ----------
+        rows : numpy.ndarray
+            Row indices.
+        repr_level : str
+            Level of representation: ``species``, ``subspecies``,
+            ``subclass`` or ``class``.
+        
+        Returns
+        -------
+        List of strings.
+        """
+        
+        # -1 stands for missing values
+        strings = self.strings + ['']
+        lipid_str = self.lipid_str[repr_level][self.lipid[rows]]
+        
+        return [
+            '%s[score=%u,deltart=%.02f,fraction=%s,scan=%u%s]' % (
+                lipid,
+                score_pct,
+                deltart,
+                strings[sample],
+                scan_id,
+                (
+                    ',adduct=%s,ms1ppm=%0.1f' % (strings[adduct], error)
+                        if details else
+                    ''
+                ),
+            )
+            for lipid, score_pct, deltart, sample, scan_id, adduct, error,
+                details in zip(
+                    lipid_str,
+                    self.score_pct[rows],
+                    self.deltart[rows],
+                    self.sample[rows],
+                    self.scan_id[rows],
+                    self.adduct[rows],
+                    self.error[rows],
+                    self.precursor_details[self.feature[rows]],
+                )
+        ]
+    
+    
+    def feature_strings(
+            self,
+            only_best = True,
+            only_top = True,
+            group_by = 'subspecies',
+            repr_level = 'subspecies',
+        ):
+        """
+        Creates the string representations of the identities for all
+        features. The equivalent of ``MS2Feature.identities_str``.
+        
+        Parameters
+        ----------
+        only_best : bool
+            Only the ones with highest score.
+        only_top : bool
+            Only the first one for each group.
+        group_by : str
+            Group by lipid identification level ``subspecies``,
+            ``species``, ``subclass`` or ``class``.
+        repr_level : str
+            The level of representation.
+        
+        Returns
+        -------
+        Array of strings, one for each feature.
+        """
+        
+        idx, starts, first = self.groups(group_by)
+        sizes = np.diff(np.append(starts, len(idx)))
+        heads = idx[starts]
+        keep = np.ones(len(starts), dtype = bool)
+        
+        if only_best:
+            
+            best = np.zeros(self.nfeatures)
+            np.maximum.at(best, self.feature[heads], self.score_pct[heads])
+            keep = np.logical_and(
+                self.score_pct[heads] > 0,
+                self.score_pct[heads] >= best[self.feature[heads]],
+            )
+        
+        if only_top:
+            
+            rows = heads[keep]
+            group_first = first[keep]
+        
+        else:
+            
+            keep_rows = np.repeat(keep, sizes)
+            rows = idx[keep_rows]
+            group_first = np.repeat(first, sizes)[keep_rows]
+        
+        labels = np.array(self.format(rows, repr_level = repr_level))
+        # groups in order of their first appearance,
+        # identities within the groups in alphabetic order
+        srt = np.lexsort((labels, group_first, self.feature[rows]))
+        labels = labels[srt]
+        features = self.feature[rows][srt]
+        
+        result = np.full(self.nfeatures, '', dtype = object)
+        bounds = np.searchsorted(features, np.arange(self.nfeatures + 1))
+        
+        for i in np.where(np.diff(bounds))[0]:
+            
+            result[i] = ';'.join(labels[bounds[i]:bounds[i + 1]])
+        
+        return result
+    
+    
+    def feature_strings_best(self, repr_level = 'subspecies'):
+        """
+        The identities with the highest score for each feature, the
+        equivalent of ``MS2Feature.identities_str_best``.
+        """
+        
+        return self.feature_strings(
+            only_best  = True,
+            only_top   = True,
+            group_by   = 'species',
+            repr_level = repr_level,
+        )
+    
+    
+    def feature_strings_all(self, repr_level = 'subspecies'):
+        """
+        All identities of each feature, the equivalent of
+        ``MS2Feature.identities_str_all``.
+        """
+        
+        return self.feature_strings(
+            only_best  = False,
+            only_top   = False,
+            group_by   = 'subspecies',
+            repr_level = repr_level,
+        )
+    
+    
+    def columns(self, rows = None):
+        """
+        Returns the table as an ordered dict of column arrays.
+        
+        Parameters
+        ----------
+        rows : numpy.ndarray
+            Row indices, e.g. from ``top``; by default all rows sorted
+            by feature and the sort keys.
+        """
+        
+        if rows is None:
+            
+            rows = np.lexsort(self.sort_keys() + (self.feature,))
+        
+        strings = np.array(self.strings + [''], dtype = object)
+        lipid = self.lipid[rows]
+        
+        return collections.OrderedDict((
+            ('feature', self.feature[rows]),
+            ('scan', self.scan_id[rows]),
+            ('fraction', strings[self.sample[rows]]),
+            ('class', self.lipid_str['class'][lipid]),
+            ('species', self.lipid_str['species'][lipid]),
+            ('subspecies', self.lipid_str['subspecies'][lipid]),
+            ('score', self.score_pct[rows]),
+            ('deltart', self.deltart[rows]),
+            ('chain_rank', self.rank[rows]),
+            ('adduct', strings[self.adduct[rows]]),
+            ('ms1ppm', self.error[rows]),
+        ))
+    
+    
+    def export(self, fname, rows = None, fmt = None):
+        """
+        Writes the identities into a TSV or Parquet file.
+        
+        Parameters
+        ----------
+        fname : str
+            Path to the output file.
+        rows : numpy.ndarray
+            Row indices, e.g. ``top(n = 3)`` to export the best 3
+            identities of each feature. By default all rows.
+        fmt : str
+            ``tsv`` or ``parquet``, by default guessed from the file name.
+        """
+        
+        columns = self.columns(rows)
+        
+        common.write_table(
+            fname,
+            list(columns.keys()),
+            list(columns.values()),
+            fmt = fmt,
+        )
@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://denes.omnipathdb.org/
+#
+
+"""
+Isotope patterns of molecular formulas calculated from the isotope
+masses and abundances in ``mass.db``.
+
+The pattern is coarse, i.e. it has one peak for each nominal mass shift
+from the monoisotopic peak, with the abundance weighted mean mass of all
+isotopologues at that nominal mass. The distribution of each element is
+the convolution power of its isotope table; these are calculated by
+repeated squaring and cached, hence the pattern of a formula costs only
+a few short convolutions once its elements have been seen.
+"""
+
+from future.utils import iteritems
+
+import functools
+
+import numpy as np
+
+import lipyd.mass as mass
+import lipyd.settings as settings
+
+
+#: Mass difference between the 13C and 12C isotopes, used as the
+#: distance of peaks which are not populated by any isotopologue
+c13_shift = 1.0033548378
+
+
+def _prune(abundance, mass_sum, threshold):
+    """
+    Removes the trailing peaks with abundances below the threshold
+    from the end of a pattern.
+    """
+    
+    if threshold:
+        
+        keep = np.where(abundance >= threshold)[0]
+        end = keep[-1] + 1 if len(keep) else 1
+        abundance = abundance[:end]
+        mass_sum = mass_sum[:end]
+    
+    return abundance, mass_sum
+
+
+def _convolve(pattern1, pattern2, npeaks, threshold):
+    """
+    Combines two patterns, keeps only the first ``npeaks`` peaks.
+    A pattern is a tuple of the abundances and the abundance weighted
+    masses of its peaks.
+    """
+    
+    a1, m1 = pattern1
+    a2, m2 = pattern2
+    
+    abundance = np.convolve(a1, a2)[:npeaks]
+    mass_sum = (np.convolve(m1, a2) + np.convolve(a1, m2))[:npeaks]
+    
+    return _prune(abundance, mass_sum, threshold)
+
+
+@functools.lru_cache(maxsize = None)
+def element_table(elem):
+    """
+    Isotope table of one element.
+    
+    Parameters
+    ----------
+    elem : str
+        Element symbol.
+    
+    Returns
+    -------
+    Tuple of two arrays indexed by the nominal mass shift from the
+    lightest isotope: the abundances (summing up to one) and the
+    abundance weighted masses of the isotopes.
+    """
+    
+    isotopes = mass.db.isotopes[elem]
+    
+    abundance = np.zeros(max(isotopes.keys()) + 1)
+    mass_sum = np.zeros(len(abundance))
+    
+    for shift, (isotope_mass, freq) in iteritems(isotopes):
+        
+        abundance[shift] = freq
+        mass_sum[shift] = isotope_mass * freq
+    
+    total = abundance.sum()
+    
+    return abundance / total, mass_sum / total
+
+
+@functools.lru_cache(maxsize = 4096)
+def element_pattern(elem, count, npeaks):
+    """
+    Isotope pattern of ``count`` atoms of one element.
+    
+    Parameters
+    ----------
+    elem : str
+        Element symbol.
+    count : int
+        Number of atoms.
+    npeaks : int
+        Number of peaks to calculate.
+    
+    Returns
+    -------
+    Tuple of two arrays: the abundances and the abundance weighted masses.
+    """
+    
+    threshold = settings.get('isotope_prune_threshold')
+    
+    if count == 0:
+        
+        return np.ones(1), np.zeros(1)
+    
+    if count == 1:
+        
+        abundance, mass_sum = element_table(elem)
+        
+        return _prune(abundance[:npeaks], mass_sum[:npeaks], threshold)
+    
+    half = element_pattern(elem, count // 2, npeaks)
+    pattern = _convolve(half, half, npeaks, threshold)
+    
+    if count % 2:
+        
+        pattern = _convolve(
+            pattern,
+            element_pattern(elem, 1, npeaks),
+            npeaks,
+            threshold,
+        )
+    
+    return pattern
+
+
+@functools.lru_cache(maxsize = 65536)
+def _pattern(atoms, npeaks):
+    
+    threshold = settings.get('isotope_prune_threshold')
+    pattern = (np.ones(1), np.zeros(1))
+    
+    for elem, count in atoms:
+        
+        pattern = _convolve(
+            pattern,
+            element_pattern(elem, count, npeaks),
+            npeaks,
+            threshold,
+        )
+    
+    abundance, mass_sum = pattern
+    
+    return _masses(abundance, mass_sum), abundance
+
+
+def _masses(abundance, mass_sum):
+    """
+    Mean masses of the peaks from the abundance weighted masses.
+    Peaks without any isotopologue are placed by the 13C shift.
+    """
+    
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        
+        masses = mass_sum / abundance
+    
+    empty = abundance == 0
+    
+    if empty.any():
+        
+        shifts = np.arange(abundance.shape[-1]) * c13_shift
+        masses[empty] = (
+            masses[...,:1] + shifts
+        )[empty]
+    
+    return masses
+
+
+@functools.lru_cache(maxsize = 65536)
+def _formula_atoms(formula):
+    
+    return _atoms_tuple(mass.formula_to_atoms(formula))
+
+
+def _atoms_tuple(atoms):
+    
+    return tuple(sorted(
+        (elem, int(count))
+        for elem, count in iteritems(atoms)
+        if count
+    ))
+
+
+def _atoms(formula):
+    
+    return (
+        _formula_atoms(formula)
+            if hasattr(formula, 'lower') else
+        _atoms_tuple(formula)
+    )
+
+
+def _mz(masses, charge):
+    
+    masses = masses - charge * mass.electron
+    
+    return masses / abs(charge) if charge else masses
+
+
+def pattern(formula, npeaks = None, charge = 0):
+    """
+    Calculates the isotope pattern of a formula.
+    
+    Parameters
+    ----------
+    formula : str,dict
+        Chemical formula as string (e.g. ``C6H12O6``) or dict of element
+        counts.
+    npeaks : int
+        Number of peaks to calculate. By default the value of the
+        ``isotope_peaks`` setting.
+    charge : int
+        Charge of the ion. If not zero m/z values are returned.
+    
+    Returns
+    -------
+    Tuple of two arrays: the m/z values (or masses) and the abundances
+    of the peaks, starting from the monoisotopic peak. The abundances are
+    probabilities of the isotopologues, they are not normalized after
+    leaving out the further peaks. Peaks with abundances below the
+    ``isotope_prune_threshold`` are removed from the end of the pattern.
+    """
+    
+    npeaks = npeaks or settings.get('isotope_peaks')
+    
+    masses, abundance = _pattern(_atoms(formula), npeaks)
+    
+    return _mz(masses, charge), abundance.copy()
+
+
+def patterns(formulas, npeaks = None, charge = 0):
+    """
+    Calculates the isotope patterns of many formulas.
+    
+    Parameters
+    ----------
+    formulas : list
+        Formulas as strings or dicts of element counts.
+    npeaks : int
+        Number of peaks to calculate. By default the value of the
+        ``isotope_peaks`` setting.
+    charge : int,list
+        Charge of the ions, either one value for all or one for each
+        formula.
+    
+    Returns
+    -------
+    Tuple of two arrays with one row for each formula and ``npeaks``
+    columns: the m/z values (or masses) and the abundances. Where the
+    pattern is shorter the m/z values are ``nan`` and the abundances are
+    zero.
+    """
+    
+    npeaks = npeaks or settings.get('isotope_peaks')
+    threshold = settings.get('isotope_prune_threshold')
+    
+    atoms = [dict(_atoms(formula)) for formula in formulas]
+    elements = sorted(set(elem for a in atoms for elem in a.keys()))
+    
+    abundances = np.zeros((len(formulas), npeaks))
+    abundances[:,0] = 1.0
+    mass_sums = np.zeros((len(formulas), npeaks))
+    
+    for elem in elements:
+        
+        counts = np.array([a.get(elem, 0) for a in atoms])
+        # patterns of each distinct number of atoms of the element
+        ucounts, icounts = np.unique(counts, return_inverse = True)
+        elem_abundances = np.zeros((len(ucounts), npeaks))
+        elem_mass_sums = np.zeros((len(ucounts), npeaks))
+        
+        for i, count in enumerate(ucounts):
+            
+            abundance, mass_sum = element_pattern(elem, int(count), npeaks)
+            elem_abundances[i,:len(abundance)] = abundance
+            elem_mass_sums[i,:len(mass_sum)] = mass_sum
+        
+        abundances, mass_sums = _convolve_rows(
+            (abundances, mass_sums),
+            (elem_abundances[icounts], elem_mass_sums[icounts]),
+        )
+    
+    mzs = _masses(abundances, mass_sums)
+    
+    if threshold:
+        
+        # removing the low abundance peaks from the end of the patterns
+        low = abundances < threshold
+        low[:,0] = False
+        trailing = np.logical_and.accumulate(low[:,::-1], axis = 1)[:,::-1]
+        mzs[trailing] = np.nan
+        abundances[trailing] = 0.0
+    
+    charge = np.asarray(charge)
+    
+    if charge.ndim:
+        
+        charge = charge[:,None]
+    
+    mzs -= charge * mass.electron
+    mzs /= np.where(charge == 0, 1, np.abs(charge))
+    
+    return mzs, abundances
+
+
+def _convolve_rows(patterns1, patterns2):
+    """
+    Combines two sets of patterns row by row, the arrays have the same
+    shape and the peaks beyond the number of columns are dropped.
+    """
+    
+    a1, m1 = patterns1
+    a2, m2 = patterns2
+    
+    abundance = np.zeros(a1.shape)
+    mass_sum = np.zeros(a1.shape)
+    
+    for k in range(a1.shape[1]):
+        
+        for j in range(k + 1):
+            
+            abundance[:,k] += a1[:,j] * a2[:,k - j]
+            mass_sum[:,k] += m1[:,j] * a2[:,k - j] + a1[:,j] * m2[:,k - j]
+    
+    return abundance, mass_sum
+
+
+def isotope_mass(formula, isotope = 1):
+    """
+    Returns the mass of one peak of the isotope pattern.
+    
+    Parameters
+    ----------
+    formula : str,dict
+        Chemical formula.
+    isotope : int
+        Nominal mass shift from the monoisotopic peak.
+    """
+    
+    masses, abundance = _pattern(_atoms(formula), isotope + 1)
+    
+    return (
+        masses[isotope]
+            if len(masses) > isotope else
+        masses[0] + isotope * c13_shift
+    )
+
+
+def clear_cache():
+    """
+    Clears the cached patterns, e.g. after the mass database has been
+    reloaded or the ``isotope_prune_threshold`` setting changed.
+    """
+    
+    element_table.cache_clear()
+    element_pattern.cache_clear()
+    _pattern.cache_clear()
+    _formula_atoms.cache_clear()
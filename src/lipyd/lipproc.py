@@ -531,12 +531,14 @@ def str2chains(chainsstr, iso = False):
     )
 
 
+@functools.lru_cache(maxsize = 65536)
 def str2lipid(lipidstr, iso = False):
     """
     Converts a string representation of a lipid into ``Headgroup`` and
     ``Chain`` objects. This method serves for conversion of string
     representations used in this module. To process database name
     varieties use the ``lipyd.name.LipidNameProcessor`` class.
+    The results are cached as the same names are processed many times.
     
     Parameters
     ----------
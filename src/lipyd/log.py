@@ -18,21 +18,21 @@
 
 import os
 import sys
+import json
+import queue
+import atexit
+import weakref
 import textwrap
+import threading
 import time
-import datetime
-
-import timeloop
-# we use this for simple little tasks only
-# and don't want engage another logger
-timeloop.app.logging.disable(level = 9999)
 
 import lipyd.settings as settings
 
 __all__ = ['new_logger', 'Logger']
 
 
-_log_flush_timeloop = timeloop.Timeloop()
+# loggers to be flushed and closed at exit
+_loggers = weakref.WeakSet()
 
 
 def new_logger(name = None, logdir = None, verbosity = None, **kwargs):
@@ -62,7 +62,7 @@ def new_logger(name = None, logdir = None, verbosity = None, **kwargs):
             name,
             Logger.timestamp().replace(' ', '_').replace(':', '.'),
         ),
-        verbosity = 0,
+        verbosity = verbosity,
         logdir = logdir,
         **kwargs,
     )
@@ -80,8 +80,18 @@ class Logger(object):
             console_level = None,
             logdir = None,
             max_width = 200,
+            log_format = None,
         ):
         """
+        Messages are put into a queue and a background thread formats
+        and writes them into the log file. Messages above the verbosity
+        level are dropped at the cost of one comparison. Arguments for
+        the message are formatted only if the message will be written.
+        The log file is created and the thread is started only when
+        a number of messages accumulated or the flush interval elapsed
+        since the first message; until then (e.g. in short lived
+        processes) messages are kept in the queue and written at exit.
+        
         fname : str
             Log file name.
         logdir : name
@@ -92,26 +102,22 @@ class Logger(object):
         console_level : int
             Messages below this log level will be printed not only into
             logfile but also to the console.
+        log_format : str
+            Either ``text`` (timestamped, wrapped lines) or ``jsonl``
+            (one JSON object per line with the time, level, label and
+            message).
         """
         
-        @_log_flush_timeloop.job(
-            interval = datetime.timedelta(
-                seconds = settings.get('log_flush_interval')
-            )
-        )
-        def _flush():
-            
-            self.flush()
-        
-        _log_flush_timeloop.start(block = False)
-        
         self.wrapper = textwrap.TextWrapper(
             width = max_width,
             subsequent_indent = ' ' * 22,
             break_long_words = False,
         )
-        self.logdir = self.get_logdir(logdir)
+        self.logdir = logdir or '%s_log' % settings.get('module_name')
         self.fname  = os.path.join(self.logdir, fname)
+        self.log_format = log_format or settings.get('log_format')
+        self.flush_interval = settings.get('log_flush_interval')
+        self.buffer_size = settings.get('log_buffer_size')
         self.verbosity = (
             verbosity
                 if verbosity is not None else
@@ -122,35 +128,121 @@ class Logger(object):
                 if console_level is not None else
             settings.get('console_verbosity')
         )
-        self.open_logfile()
+        self._queue = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._closed = False
+        self._buffer_start = None
+        
+        _loggers.add(self)
         
         # sending some greetings
         self.msg('Welcome!')
-        self.msg('Logger started, logging into `%s`.' % self.fname)
+        self.msg('Logger started, logging into `%s`.', self.fname)
+    
+    
+    @property
+    def verbosity(self):
+        
+        return self._verbosity
+    
+    
+    @verbosity.setter
+    def verbosity(self, value):
+        
+        self._verbosity = value
+        self._update_max_level()
+    
     
+    @property
+    def console_level(self):
+        
+        return self._console_level
+    
+    
+    @console_level.setter
+    def console_level(self, value):
+        
+        self._console_level = value
+        self._update_max_level()
+    
+    
+    def _update_max_level(self):
+        
+        self._max_level = max(
+            getattr(self, '_verbosity', -1),
+            getattr(self, '_console_level', -1),
+        )
     
-    def msg(self, msg = '', label = None, level = 0):
+    
+    def msg(self, msg = '', *args, label = None, level = 0):
         """
         Writes a message into the log file.
 
         Parameters
         ----------
         msg : str
-            Text of the message.
+            Text of the message. If ``args`` provided this is a format
+            string and it is formatted only if the message is not dropped.
+        *args :
+            Arguments for ``msg``, applied by the ``%`` operator.
+        label : str
+            A label in front of the message, e.g. the name of the module
+            or class sending the message.
         level : int
             The loglevel. Decides if the message will be written or dropped.
         """
         
+        if level > self._max_level:
+            
+            return
+        
         if level <= self.verbosity:
             
-            msg = self.label_message(msg, label = label)
-            msg = self.wrapper.fill(msg)
-            msg = self.timestamp_message(msg)
-            self.fp.write(msg)
+            now = time.time()
+            self._queue.put((now, label, level, msg, args))
+            
+            if not self._writer_running():
+                
+                self._buffered(now)
         
         if level <= self.console_level:
             
-            self._console(msg)
+            self._console(
+                self.format_message(time.time(), label, level, msg, args)
+            )
+    
+    
+    def format_message(self, timestamp, label, level, msg, args = ()):
+        """
+        Creates the line(s) to be written into the log from the message
+        and its attributes.
+        """
+        
+        if args:
+            
+            try:
+                
+                msg = msg % args
+                
+            except (TypeError, ValueError, KeyError):
+                
+                # a wrong format string should never stop the logging
+                pass
+        
+        if self.log_format == 'jsonl':
+            
+            return '%s\n' % json.dumps({
+                'time': self.timestamp(timestamp),
+                'level': level,
+                'label': label,
+                'msg': str(msg),
+            })
+        
+        msg = self.label_message(msg, label = label)
+        msg = self.wrapper.fill(msg)
+        
+        return self.timestamp_message(msg, timestamp)
     
     
     def label_message(self, msg, label = None):
@@ -163,12 +255,12 @@ class Logger(object):
         return '%s%s' % (label, msg)
     
     
-    def timestamp_message(self, msg):
+    def timestamp_message(self, msg, timestamp = None):
         """
         Adds a timestamp in front of the message.
         """
         
-        return '[%s] %s\n' % (self.timestamp(), msg)
+        return '[%s] %s\n' % (self.timestamp(timestamp), msg)
     
     
     def _console(self, msg):
@@ -177,7 +269,7 @@ class Logger(object):
         sys.stdout.flush()
     
     
-    def console(self, msg = '', label = None):
+    def console(self, msg = '', *args, label = None):
         """
         Prints a message to the console and also to the logfile.
         
@@ -185,29 +277,193 @@ class Logger(object):
             Text of the message.
         """
         
-        self.msg(msg = msg, label = label, level = self.console_level)
+        self.msg(msg, *args, label = label, level = self.console_level)
     
     
     @classmethod
-    def timestamp(cls):
+    def timestamp(cls, timestamp = None):
         """
-        Returns a timestamp of the current time.
+        Returns a timestamp of the current time (or the time provided
+        as seconds since the epoch).
         """
         
-        return cls.strftime('%Y-%m-%d %H:%M:%S')
+        return cls.strftime(
+            '%Y-%m-%d %H:%M:%S',
+            time.localtime(timestamp),
+        )
     
     
-    def __del__(self):
+    def _buffered(self, now):
+        """
+        Starts the writer thread if enough messages accumulated in the
+        queue or the first of them waits longer than the flush interval.
+        """
         
-        if hasattr(_log_flush_timeloop, 'stop'):
+        if self._buffer_start is None:
             
-            _log_flush_timeloop.stop()
+            self._buffer_start = now
         
-        self.msg('Logger shut down, logfile `%s` closed.' % self.fname)
+        if (
+            self._queue.qsize() >= self.buffer_size or
+            now - self._buffer_start >= self.flush_interval
+        ):
+            
+            self._ensure_writer()
+    
+    
+    def _ensure_writer(self):
+        """
+        Starts the background thread writing the log file unless it is
+        running already. Also restarts it in forked processes and if
+        the thread has died.
+        """
+        
+        if self._closed or self._writer_running():
+            
+            return
+        
+        with self._writer_lock:
+            
+            if self._writer_running():
+                
+                return
+            
+            if self._writer is not None and self._writer_pid != os.getpid():
+                
+                # forked process: the thread and the queue's
+                # state are not valid any more
+                self._queue = queue.Queue()
+            
+            self._writer_pid = os.getpid()
+            self._writer = threading.Thread(
+                target = self._write_loop,
+                name = 'lipyd-log-writer',
+                daemon = True,
+            )
+            self._writer.start()
+    
+    
+    def _write_loop(self):
+        """
+        Takes messages from the queue, formats them and writes them into
+        the log file. Flushes the file if no new message arrives within
+        the flush interval.
+        """
+        
+        while True:
+            
+            try:
+                
+                item = self._queue.get(timeout = self.flush_interval)
+                
+            except queue.Empty:
+                
+                self._flush_file()
+                continue
+            
+            try:
+                
+                if item is None:
+                    
+                    self._flush_file()
+                    return
+                
+                self._write(item)
+                
+            finally:
+                
+                self._queue.task_done()
+    
+    
+    def _write(self, item):
+        """
+        Writes one message into the log file, opens the file at the
+        first message.
+        """
+        
+        if not hasattr(self, 'fp'):
+            
+            self.open_logfile()
+        
+        if not self.fp.closed:
+            
+            self.fp.write(self.format_message(*item))
+    
+    
+    def _writer_running(self):
+        
+        return (
+            self._writer is not None and
+            self._writer_pid == os.getpid() and
+            self._writer.is_alive()
+        )
+    
+    
+    def _drain(self):
+        """
+        Writes the queued messages in the current thread. Only to be used
+        if the writer thread is not running.
+        """
+        
+        while True:
+            
+            try:
+                
+                item = self._queue.get_nowait()
+                
+            except queue.Empty:
+                
+                break
+            
+            try:
+                
+                if item is not None:
+                    
+                    self._write(item)
+                
+            finally:
+                
+                self._queue.task_done()
+    
+    
+    def _stop_writer(self):
+        """
+        Writes all queued messages and stops the background thread.
+        """
+        
+        if self._writer_running():
+            
+            self._queue.put(None)
+            self._writer.join()
+            
+        else:
+            
+            self._drain()
+        
+        self._writer = None
+    
+    
+    def close(self):
+        """
+        Writes the last messages and closes the logfile.
+        """
+        
+        if self._closed:
+            
+            return
+        
+        self.msg('Logger shut down, logfile `%s` closed.', self.fname)
         self.msg('Bye.')
+        self._stop_writer()
+        self._closed = True
         self.close_logfile()
     
     
+    def __del__(self):
+        
+        self.close()
+    
+    
     def get_logdir(self, dirname = None):
         """
         Returns the path to log directory.
@@ -227,6 +483,7 @@ class Logger(object):
         """
         
         self.close_logfile()
+        self.get_logdir(self.logdir)
         self.fp = open(self.fname, 'w')
     
     
@@ -240,11 +497,33 @@ class Logger(object):
             self.fp.close()
     
     
+    def _flush_file(self):
+        
+        if hasattr(self, 'fp') and not self.fp.closed:
+            
+            self.fp.flush()
+    
+    
     def flush(self):
         """
-        Flushes the log file.
+        Waits until all queued messages are written and flushes the
+        log file.
         """
         
-        if hasattr(self, 'fp') and not self.fp.closed:
+        if self._writer_running():
             
-            self.fp.flush()
+            self._queue.join()
+            
+        else:
+            
+            self._drain()
+        
+        self._flush_file()
+
+
+@atexit.register
+def _close_loggers():
+    
+    for logger in list(_loggers):
+        
+        logger.close()
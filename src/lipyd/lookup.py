@@ -17,6 +17,8 @@
 #  Website: http://denes.omnipathdb.org/
 #
 
+import numpy as np
+
 
 def ppm_tolerance(ppm, m):
     """
@@ -45,6 +47,18 @@ def absolute_tolerance(da, m):
     return da / m * 1e6
 
 
+def _tolerance_bounds(a, ms, t):
+    """
+    Lower and upper index bounds of the windows of absolute tolerance
+    ``t`` around the values ``ms`` in the sorted array ``a``.
+    """
+    
+    lo = a.searchsorted(ms - t, side = 'left')
+    hi = a.searchsorted(ms + t, side = 'right')
+    
+    return lo, hi
+
+
 def findall(a, m, t = 20):
     """
     Finds all values within a given range of tolerance around a reference
@@ -63,7 +77,8 @@ def findall(a, m, t = 20):
 
     Returns
     -------
-    A list of array indices.
+    A list of array indices: first the ones at and above the value in
+    increasing order, then the ones below in decreasing order.
     """
     
     t_abs = ppm_tolerance(t, m)
@@ -73,42 +88,96 @@ def findall(a, m, t = 20):
 
 def _findall(a, m, t):
     
-    result = []
-    
     # the upper closest index
     iu = a.searchsorted(m)
+    lo, hi = _tolerance_bounds(a, m, t)
     
-    if a.shape[0] > iu:
-        
-        u = 0
-        
-        while True:
-            
-            if iu + u < a.shape[0] and a[iu + u] - m <= t:
-                
-                result.append(iu + u)
-                u += 1
-                
-            else:
-                
-                break
-    
-    if iu > 0:
-        
-        l = 1
-        
-        while True:
-            
-            if iu - l >= 0 and m - a[iu - l] <= t:
-                
-                result.append(iu - l)
-                l += 1
-                
-            else:
-                
-                break
+    return list(range(iu, max(iu, hi))) + list(range(iu - 1, lo - 1, -1))
+
+
+def findall_many(a, ms, t = 20):
+    """
+    Finds all values within a given range of tolerance around each of
+    many reference values in a one dimensional sorted array.
+    The vectorized version of ``findall``.
     
-    return result
+    Parameters
+    ----------
+    a : numpy.array
+        Sorted one dimensional float array.
+    ms : numpy.array
+        Values to lookup.
+    t : float,numpy.array
+        Range of tolerance (highest accepted difference) in ppm, either
+        one value for all or one for each value.
+        (Default value = 20)
+    
+    Returns
+    -------
+    Tuple of two integer arrays in compressed sparse row format: the
+    offsets (one longer than ``ms``) and the array indices. The indices
+    for the i-th value are ``indices[offsets[i]:offsets[i + 1]]``, in
+    increasing order.
+    """
+    
+    ms = np.asarray(ms, dtype = np.float64)
+    t_abs = ppm_tolerance(np.asarray(t), ms)
+    
+    return _findall_many(a, ms, t_abs)
+
+
+def _findall_many(a, ms, t):
+    
+    lo, hi = _tolerance_bounds(a, ms, t)
+    counts = np.maximum(hi - lo, 0)
+    
+    offsets = np.zeros(len(ms) + 1, dtype = np.int64)
+    np.cumsum(counts, out = offsets[1:])
+    
+    # for each index its distance from the start of its window
+    # plus the lower bound of the window
+    indices = (
+        np.arange(offsets[-1], dtype = np.int64) +
+        np.repeat(lo - offsets[:-1], counts)
+    )
+    
+    return offsets, indices
+
+
+def findall_each(a, ms, t = 20):
+    """
+    Finds all values within a given range of tolerance around each of
+    many reference values in a one dimensional sorted array. The searches
+    in the array are vectorized, while the result is the same as calling
+    ``findall`` for each value.
+    
+    Parameters
+    ----------
+    a : numpy.array
+        Sorted one dimensional float array.
+    ms : numpy.array
+        Values to lookup.
+    t : float,numpy.array
+        Range of tolerance (highest accepted difference) in ppm, either
+        one value for all or one for each value.
+        (Default value = 20)
+    
+    Returns
+    -------
+    List of lists of array indices, for each value in the same order as
+    ``findall`` returns them.
+    """
+    
+    ms = np.asarray(ms, dtype = np.float64)
+    t_abs = ppm_tolerance(np.asarray(t), ms)
+    
+    iu = a.searchsorted(ms)
+    lo, hi = _tolerance_bounds(a, ms, t_abs)
+    
+    return [
+        list(range(u, max(u, h))) + list(range(u - 1, l - 1, -1))
+        for u, l, h in zip(iu.tolist(), lo.tolist(), hi.tolist())
+    ]
 
 
 def find(a, m, t = 20):
@@ -142,9 +211,11 @@ def find(a, m, t = 20):
 
 def _find(a, m, t):
     
+    # the same as `_find_many` but avoids the array
+    # overhead for a single value
     iu = a.searchsorted(m)
     
-    dl = du = 9999.
+    dl = du = np.inf
     
     if iu < len(a):
         
@@ -165,6 +236,61 @@ def _find(a, m, t):
         return iu
 
 
+def find_many(a, ms, t = 20):
+    """
+    Finds the closest value to each of many reference values in a one
+    dimensional sorted array. The vectorized version of ``find``.
+    
+    Parameters
+    ----------
+    a : numpy.array
+        Sorted one dimensional float array.
+    ms : numpy.array
+        Values to lookup.
+    t : float,numpy.array
+        Range of tolerance (highest accepted difference) in ppm, either
+        one value for all or one for each value.
+        (Default value = 20)
+    
+    Returns
+    -------
+    Integer array with the index of the closest value for each of the
+    values, -1 where nothing found within the range of tolerance.
+    """
+    
+    ms = np.asarray(ms, dtype = np.float64)
+    t_abs = ppm_tolerance(np.asarray(t), ms)
+    
+    return _find_many(a, ms, t_abs)
+
+
+def _find_many(a, ms, t):
+    
+    n = len(a)
+    iu = a.searchsorted(ms)
+    
+    # distances to the closest values below and above,
+    # infinite if the value is beyond the end of the array
+    du = np.full(ms.shape, np.inf)
+    dl = np.full(ms.shape, np.inf)
+    
+    upper = iu < n
+    lower = iu > 0
+    
+    du[upper] = np.abs(a[iu[upper]] - ms[upper])
+    dl[lower] = np.abs(ms[lower] - a[iu[lower] - 1])
+    
+    # the lower neighbour only if strictly closer and strictly
+    # within the tolerance, the upper one at equal distance
+    result = np.where(
+        dl < du,
+        np.where(dl < t, iu - 1, -1),
+        np.where(np.logical_and(du <= t, upper), iu, -1),
+    )
+    
+    return result.astype(np.int64)
+
+
 def match(observed, theoretical, tolerance = 20):
     """
 
@@ -20,8 +20,10 @@
 from past.builtins import xrange, range
 from future.utils import iteritems
 
-import bs4
+import os
 import re
+import pickle
+import hashlib
 import warnings
 import imp
 import sys
@@ -33,12 +35,8 @@ import collections
 
 import numpy as np
 
-try:
-    import pyopenms as oms
-except:
-    pass
-
 import lipyd._curl as _curl
+import lipyd.settings as settings
 
 
 #: Mass of a proton
@@ -114,16 +112,83 @@ class MassDatabase(object):
     
     def setup(self):
         """
-        Populates the mass database.
+        Populates the mass database. The tables parsed from the CIAAW
+        webpages are cached, the pages are downloaded and parsed only
+        if the cache is not available.
         """
         
-        self.load_mass_monoiso()
-        self.load_freq_iso()
+        if not self.load_cache():
+            
+            self.load_mass_monoiso()
+            self.load_freq_iso()
+            self.save_cache()
+        
         self.setup_mass_first_iso()
         # self.get_weights() # this does not work at the moment
         self.setup_isotopes()
     
     
+    def cachefile(self):
+        """
+        Path to the cache file of the parsed mass and abundance tables.
+        """
+        
+        key = repr((self.url_masses, self.url_abundances))
+        
+        return os.path.join(
+            settings.get('cachedir'),
+            'mass_db__%s.pickle' % (
+                hashlib.md5(key.encode('utf-8')).hexdigest()
+            ),
+        )
+    
+    
+    def load_cache(self):
+        """
+        Loads the mass and abundance tables from the cache.
+        Returns ``False`` if the cache is not available.
+        """
+        
+        cachefile = self.cachefile()
+        
+        if not os.path.exists(cachefile):
+            
+            return False
+        
+        try:
+            
+            with open(cachefile, 'rb') as fp:
+                
+                self.mass_monoiso, self.freq_iso = pickle.load(fp)
+            
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            
+            return False
+        
+        return True
+    
+    
+    def save_cache(self):
+        """
+        Writes the mass and abundance tables into the cache.
+        """
+        
+        cachefile = self.cachefile()
+        os.makedirs(os.path.dirname(cachefile), exist_ok = True)
+        # other processes might read the same file
+        tmpfile = '%s.%u.tmp' % (cachefile, os.getpid())
+        
+        with open(tmpfile, 'wb') as fp:
+            
+            pickle.dump(
+                (self.mass_monoiso, self.freq_iso),
+                fp,
+                protocol = pickle.HIGHEST_PROTOCOL,
+            )
+        
+        os.replace(tmpfile, cachefile)
+    
+    
     @staticmethod
     def load_masses(url):
         """
@@ -140,6 +205,8 @@ class MassDatabase(object):
         Dict of masses or weights.
         """
         
+        import bs4
+        
         c = _curl.Curl(url, silent = False)
         req_masses = c.result
         
@@ -195,6 +262,8 @@ class MassDatabase(object):
         Stores the result in :py:attr:`.freqIso` attribute of the module.
         """
         
+        import bs4
+        
         c = _curl.Curl(self.url_abundances, silent = False)
         req_abundances = c.result.split('\n')
         
@@ -391,8 +460,35 @@ def init_db():
     globals()['db'] = MassDatabase()
 
 
-# databases set up at module loading
-init_db()
+def get_db():
+    """
+    Returns the mass database, builds it at the first access.
+    """
+    
+    if 'db' not in globals():
+        
+        init_db()
+    
+    return globals()['db']
+
+
+def __getattr__(name):
+    
+    # the database is built only when used, not at module loading,
+    # as this requires the HTML parser and possibly downloads
+    if name == 'db':
+        
+        return get_db()
+    
+    if name in parts:
+        
+        globals()[name] = MassBase(parts[name])
+        
+        return globals()[name]
+    
+    raise AttributeError(
+        'module `%s` has no attribute `%s`' % (__name__, name)
+    )
 
 
 class MassBase(object):
@@ -436,7 +532,7 @@ class MassBase(object):
         Isotopic Abundances and Atomic Weights (CIAAW), http://www.ciaaw.org/
         """
         
-        self.exmass = db.mass_first_iso
+        self.exmass = get_db().mass_first_iso
         self.charge = charge
         self.isotope = isotope
         
@@ -571,15 +667,15 @@ class MassBase(object):
                 
                 if self.isotope:
                     
-                    oms_formula = oms.EmpiricalFormula(self.formula)
-                    iso_pattern_gen = oms.CoarseIsotopePatternGenerator(
-                        self.isotope + 1
-                    )
-                    isotopes = oms_formula.getIsotopeDistribution(
-                        iso_pattern_gen
+                    # imported here as it depends on this module
+                    import lipyd.isotope as isotope
+                    
+                    m = isotope.isotope_mass(
+                        self._atoms
+                            if hasattr(self, '_atoms') else
+                        self.formula,
+                        self.isotope,
                     )
-                    this_isotope = list(isotopes.getContainer())[-1].getMZ()
-                    m = this_isotope
                     
                 m -= self.charge * electron
                 self.mass = m
@@ -591,6 +687,27 @@ class MassBase(object):
             self.mass_calculated = False
     
     
+    def isotope_pattern(self, npeaks = None):
+        """
+        Calculates the isotope pattern of the formula.
+        
+        Parameters
+        ----------
+        npeaks : int
+            Number of peaks. By default the value of the ``isotope_peaks``
+            setting.
+        
+        Returns
+        -------
+        Tuple of two arrays: masses (m/z values if ``charge`` is not zero)
+        and abundances. See ``lipyd.isotope.pattern``.
+        """
+        
+        import lipyd.isotope as isotope
+        
+        return isotope.pattern(self.atoms, npeaks, self.charge)
+    
+    
     def has_mass(self):
         
         return self.mass > 0.0 or (self.formula == '' and self.mass == 0.0)
@@ -701,6 +818,8 @@ class ElementComposition(object):
         return iteritems(self.composition)
 
 
+#: Masses available as module attributes, created at the first access
+#: by the module level ``__getattr__`` as they require the mass database
 parts = {
     'water': 'H2O',
     'twowater': 'H4O2',
@@ -709,11 +828,6 @@ parts = {
 }
 
 
-for name, form in parts.items():
-    
-    setattr(sys.modules[__name__], name, MassBase(form))
-
-
 def calculate(formula):
     """
     Evaluates a string as formula.
@@ -748,7 +862,10 @@ def calculate(formula):
         if refloat.match(step):
             step = float(step)
         
-        if (
+        if step in parts:
+            step = __getattr__(step)
+        
+        elif (
             step in globals() and
             isinstance(globals()[step], (float, int, MassBase))
         ):
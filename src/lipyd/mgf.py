@@ -21,11 +21,13 @@ import os
 import sys
 import re
 import imp
+import collections
 import numpy as np
 
 import lipyd.lookup as lookup
 import lipyd.session as session
 import lipyd.settings as settings
+import lipyd.timing as timing
 
 
 class MgfReader(session.Logger):
@@ -96,6 +98,7 @@ class MgfReader(session.Logger):
         setattr(self, '__class__', new)
     
     
+    @timing.timed('mgf.index')
     def index(self):
         """
         Indexing offsets in one MS2 MGF file.
@@ -258,12 +261,11 @@ class MgfReader(session.Logger):
 
         """
         
-        if self._log_verbosity > 4:
-            
-            self._log.msg(
-                'Recalibrated m/z: %.08f; drift = %.08f; '
-                'measured m/z: %.08f' % (mz, self.drift, mz / self.drift)
-            )
+        self._log(
+            'Recalibrated m/z: %.08f; drift = %.08f; measured m/z: %.08f',
+            mz, self.drift, mz / self.drift,
+            level = 5,
+        )
         
         rt = rt or np.nan
         mz_uncorr = mz / self.drift
@@ -274,15 +276,13 @@ class MgfReader(session.Logger):
         ))
         rtdiff = np.array([self.mgfindex[i,2] - rt for i in idx])
         
-        if self._log_verbosity > 4:
-            
-            self._log(
-                'Looking up MS1 m/z %.08f. '
-                'MS2 scans with matching precursor mass: %u' % (
-                    mz_uncorr,
-                    len(idx),
-                )
-            )
+        self._log(
+            'Looking up MS1 m/z %.08f. '
+            'MS2 scans with matching precursor mass: %u',
+            mz_uncorr,
+            len(idx),
+            level = 5,
+        )
         
         if self.ms2_rt_within_range:
             
@@ -293,27 +293,25 @@ class MgfReader(session.Logger):
                     'difference of MS2 scans.'
                 )
             
-            idx = idx[
-                np.logical_or(
-                    np.isnan(rtdiff),
-                    np.abs(rtdiff) < self.rt_tolerance
-                )
-            ]
+            within_range = np.logical_or(
+                np.isnan(rtdiff),
+                np.abs(rtdiff) < self.rt_tolerance
+            )
+            idx = idx[within_range]
+            rtdiff = rtdiff[within_range]
             
-            if self._log_verbosity > 4:
-                
-                self._log(
+            self._log(
                 'RT range: %.03f--%.03f; '
-                'Matching MS2 scans within this range: %u' % (
-                    rtlower,
-                    rtupper,
-                    len(idx),
-                )
+                'Matching MS2 scans within this range: %u',
+                rt - self.rt_tolerance,
+                rt + self.rt_tolerance,
+                len(idx),
+                level = 5,
             )
             
-        elif self._log_verbosity > 4:
+        else:
             
-            self._log('Not checking RT.')
+            self._log('Not checking RT.', level = 5)
         
         return idx, rtdiff
     
@@ -393,16 +391,13 @@ class MgfReader(session.Logger):
                         intensity     # intensity
                     ])
         
-        if self._log_verbosity > 4:
-            
-            self._log(
-                'Read scan #%u from file `%s`;'
-                '%u peaks retrieved.' % (
-                    self.mgfindex[i, 3],
-                    self.fname,
-                    len(scan),
-                )
-            )
+        self._log(
+            'Read scan #%u from file `%s`; %u peaks retrieved.',
+            self.mgfindex[i, 3],
+            self.fname,
+            len(scan),
+            level = 5,
+        )
         
         return np.array(scan)
     
@@ -515,3 +510,248 @@ class MgfReader(session.Logger):
             self.fname,
             len(self),
         )
+
+
+class PrecursorMatches(collections.namedtuple(
+        'PrecursorMatchesBase',
+        ['feature', 'file', 'row', 'rtdiff', 'bounds'],
+    )):
+    """
+    Sparse table of feature and MS2 scan pairs, as returned by
+    ``PrecursorIndex.join``. The first 4 fields are arrays with one
+    element for each pair: the index of the feature, the index of the
+    file, the row number of the scan in the ``mgfindex`` of the file and
+    the RT difference. The pairs of the ``i``th feature are between
+    ``bounds[i]`` and ``bounds[i + 1]``.
+    """
+    
+    
+    def of_feature(self, i):
+        """
+        Returns 3 arrays: the file indices, row numbers and RT differences
+        of the scans matching the ``i``th feature.
+        """
+        
+        slc = slice(self.bounds[i], self.bounds[i + 1])
+        
+        return self.file[slc], self.row[slc], self.rtdiff[slc]
+
+
+class PrecursorIndex(object):
+    
+    
+    def __init__(self, readers, labels = None):
+        """
+        Merged index of the MS2 scans in a number of MGF files by their
+        precursor m/z and retention time. One lookup in this index gives
+        the same scans as calling ``MgfReader.lookup`` for each file
+        in turn.
+        
+        The drift, the tolerances and the RT settings of the readers
+        are read when the index is built, if they change the index
+        should be rebuilt by ``build``.
+        
+        readers : list
+            ``MgfReader`` objects.
+        labels : list
+            A label for each file, e.g. sample IDs. By default the
+            ``label`` attribute of the readers.
+        """
+        
+        self.readers = list(readers)
+        self.labels = (
+            list(labels)
+                if labels is not None else
+            [reader.label for reader in self.readers]
+        )
+        
+        self.build()
+    
+    
+    @timing.timed('mgf.precursor_index')
+    def build(self):
+        """
+        Builds the arrays of the index, all sorted by the drift corrected
+        precursor m/z: ``mzs`` (precursor m/z as in the file), ``rts``
+        (retention times, ``nan`` if not available), ``files`` (index
+        of the file in ``readers``) and ``rows`` (row numbers in the
+        ``mgfindex`` of the readers).
+        """
+        
+        mzs, rts, files, rows = [], [], [], []
+        
+        for ifile, reader in enumerate(self.readers):
+            
+            if not len(reader):
+                
+                continue
+            
+            mzs.append(reader.mgfindex[:,0].astype(np.float64))
+            rts.append(np.array(
+                [np.nan if rt is None else rt for rt in reader.mgfindex[:,2]],
+                dtype = np.float64,
+            ))
+            files.append(np.full(len(reader), ifile, dtype = np.int64))
+            rows.append(np.arange(len(reader), dtype = np.int64))
+        
+        # settings of the files
+        self.drift = np.array(
+            [reader.drift for reader in self.readers],
+            dtype = np.float64,
+        )
+        self.tolerance = np.array(
+            [reader.tolerance for reader in self.readers],
+            dtype = np.float64,
+        )
+        self.rt_tolerance = np.array(
+            [reader.rt_tolerance for reader in self.readers],
+            dtype = np.float64,
+        )
+        self.rt_within_range = np.array(
+            [bool(reader.ms2_rt_within_range) for reader in self.readers],
+            dtype = bool,
+        )
+        self.max_tolerance = (
+            self.tolerance.max() if len(self.readers) else 0.0
+        )
+        
+        self.mzs, self.rts, self.files, self.rows = (
+            np.concatenate(a)
+                if a else
+            np.array([], dtype = dtype)
+            for a, dtype in (
+                (mzs, np.float64),
+                (rts, np.float64),
+                (files, np.int64),
+                (rows, np.int64),
+            )
+        )
+        
+        self.mzs_corrected = self.mzs * self.drift[self.files]
+        isort = np.argsort(self.mzs_corrected, kind = 'mergesort')
+        
+        for attr in ('mzs', 'mzs_corrected', 'rts', 'files', 'rows'):
+            
+            setattr(self, attr, getattr(self, attr)[isort])
+    
+    
+    def lookup(self, mz, rt = None):
+        """
+        Looks up an MS1 m/z and returns the MS2 scans in all files.
+        
+        mz : float
+            The precursor m/z.
+        rt : float
+            Retention time of the precursor.
+        
+        Returns
+        -------
+        3 arrays of the same length: the file indices, the row numbers
+        in the ``mgfindex`` of the files and the RT differences.
+        The scans are in the order of the files and within one file in the
+        order ``MgfReader.lookup`` returns them.
+        """
+        
+        return self.join([mz], [rt]).of_feature(0)
+    
+    
+    @timing.timed('mgf.precursor_index.join')
+    def join(self, mzs, rts = None):
+        """
+        Looks up many MS1 features at once and assigns the MS2 scans to
+        them in one vectorized pass. The result for each feature is the
+        same as ``lookup`` would give.
+        
+        mzs : list
+            The precursor m/z values of the features.
+        rts : list
+            Retention times of the features, ``None`` if not known.
+        
+        Returns
+        -------
+        ``PrecursorMatches`` object with one element for each matching
+        feature and scan pair, sorted by the features.
+        """
+        
+        mzs = np.asarray(mzs, dtype = np.float64)
+        rts = (
+            np.full(len(mzs), np.nan)
+                if rts is None else
+            np.array([rt or np.nan for rt in rts], dtype = np.float64)
+        )
+        
+        # a window surely wider than the tolerance of any of the files,
+        # the exact tolerance of each file is checked afterwards
+        margin = lookup.ppm_tolerance(self.max_tolerance * 2, mzs)
+        lo = self.mzs_corrected.searchsorted(mzs - margin, side = 'left')
+        hi = self.mzs_corrected.searchsorted(mzs + margin, side = 'right')
+        
+        # all candidate feature and scan pairs
+        counts = np.maximum(hi - lo, 0)
+        feature = np.repeat(np.arange(len(mzs)), counts)
+        pos = (
+            np.arange(counts.sum()) -
+            np.repeat(np.cumsum(counts) - counts - lo, counts)
+        )
+        
+        files = self.files[pos]
+        rows = self.rows[pos]
+        scan_mzs = self.mzs[pos]
+        rtdiff = self.rts[pos] - rts[feature]
+        
+        # the same calculation as in `MgfReader.lookup`
+        mz_uncorr = mzs[feature] / self.drift[files]
+        t_abs = lookup.ppm_tolerance(self.tolerance[files], mz_uncorr)
+        
+        keep = np.logical_and(
+            scan_mzs >= mz_uncorr - t_abs,
+            scan_mzs <= mz_uncorr + t_abs,
+        )
+        
+        rt_check = self.rt_within_range[files]
+        
+        if rt_check.any():
+            
+            keep = np.logical_and(
+                keep,
+                np.logical_or.reduce((
+                    np.logical_not(rt_check),
+                    np.isnan(rtdiff),
+                    np.abs(rtdiff) < self.rt_tolerance[files],
+                )),
+            )
+        
+        # the order of `lookup.findall`: first the ones at and above
+        # the value in increasing, then the ones below in decreasing order
+        below = scan_mzs < mz_uncorr
+        order = np.lexsort((
+            np.where(below, -rows, rows)[keep],
+            below[keep],
+            files[keep],
+            feature[keep],
+        ))
+        feature = feature[keep][order]
+        
+        return PrecursorMatches(
+            feature = feature,
+            file = files[keep][order],
+            row = rows[keep][order],
+            rtdiff = rtdiff[keep][order],
+            bounds = np.concatenate((
+                [0],
+                np.cumsum(np.bincount(feature, minlength = len(mzs))),
+            )),
+        )
+    
+    
+    def __len__(self):
+        
+        return len(self.mzs)
+    
+    
+    def __repr__(self):
+        
+        return '<MS2 precursor index of %u MGF files, %u spectra>' % (
+            len(self.readers),
+            len(self),
+        )
@@ -25,15 +25,19 @@ from future.utils import iteritems
 import os
 import sys
 import imp
+import shutil
 import re
 import copy
+import array
+import pickle
+import hashlib
 import itertools
 import collections
 import functools
+import concurrent.futures
 from argparse import Namespace
 
 import numpy as np
-import pandas as pd
 
 try:
     import openbabel.pybel as pybel
@@ -54,8 +58,10 @@ except:
     sys.stdout.write(':: Module `pybel` not available.\n')
 
 import lipyd._curl as _curl
+import lipyd._version as _version
 import lipyd.common as common
 import lipyd.settings as settings
+import lipyd.timing as timing
 import lipyd.mz as mzmod
 import lipyd.progress as progress
 import lipyd.sdf as sdf
@@ -64,6 +70,8 @@ import lipyd.lookup as _lookup
 import lipyd.name as lipidname
 import lipyd.formula as formula
 import lipyd.lipproc as lipproc
+import lipyd.records as records
+import lipyd.shared as shared
 
 
 class Reader(object):
@@ -131,19 +139,11 @@ class LipidMaps(sdf.SdfReader):
                 self.fname.split('/')[-1]
             )
             
-            with open(self.efname, 'wb') as efp:
+            if not self.extracted_up_to_date():
                 
-                for l in self.curl.result[self.fname]:
-                    
-                    efp.write(l)
+                self.extract()
             
-            efp = open(
-                os.path.join(
-                    settings.get('cachedir'),
-                    self.fname.split('/')[-1]
-                ),
-                'rb'
-            )
+            efp = open(self.efname, 'rb')
             sdf.SdfReader.__init__(self, efp)
         
         else:
@@ -154,6 +154,71 @@ class LipidMaps(sdf.SdfReader):
             iso = True
         )
     
+    def _member_checksum(self):
+        """
+        Returns the CRC and size of the SDF file as recorded in the zip
+        archive, or `None` if the download is not a zip file.
+        """
+        
+        if not hasattr(self.curl, 'zipfile'):
+            
+            return None
+        
+        info = self.curl.zipfile.getinfo(self.fname)
+        
+        return '%08x\t%u' % (info.CRC, info.file_size)
+    
+    def extracted_up_to_date(self):
+        """
+        Tells if the SDF file has been extracted already from the same
+        archive: the checksum stored at the last extraction agrees with
+        the one in the archive and the extracted file has the same size.
+        """
+        
+        checksum = self._member_checksum()
+        checksum_fname = '%s.checksum' % self.efname
+        
+        if (
+            checksum is None or
+            not os.path.exists(self.efname) or
+            not os.path.exists(checksum_fname)
+        ):
+            
+            return False
+        
+        with open(checksum_fname, 'r') as fp:
+            
+            stored = fp.read().strip()
+        
+        return (
+            stored == checksum and
+            os.path.getsize(self.efname) == int(checksum.split('\t')[1])
+        )
+    
+    def extract(self):
+        """
+        Extracts the SDF file from the archive into the cache directory
+        and records the checksum of the archive member next to it.
+        """
+        
+        checksum_fname = '%s.checksum' % self.efname
+        
+        if os.path.exists(checksum_fname):
+            
+            os.remove(checksum_fname)
+        
+        with open(self.efname, 'wb') as efp:
+            
+            shutil.copyfileobj(self.curl.result[self.fname], efp, 1048576)
+        
+        checksum = self._member_checksum()
+        
+        if checksum is not None:
+            
+            with open(checksum_fname, 'w') as fp:
+                
+                fp.write(checksum)
+    
     def __iter__(self):
         
         for rec in sdf.SdfReader.__iter__(self):
@@ -813,9 +878,10 @@ class MoleculeDatabaseAggregator(object):
     
     
     def init_rebuild(self):
-        """Creates an empty list where this object collects the masses and
-        molecule annotations. This needs to be done before (re)building the
-        database in order to start from an empty array.
+        """Creates an empty array and record store where this object
+        collects the masses and molecule annotations. This needs to be done
+        before (re)building the database in order to start from an empty
+        array.
 
         Parameters
         ----------
@@ -825,9 +891,29 @@ class MoleculeDatabaseAggregator(object):
 
         """
         
-        self._mass_data = []
+        self._masses = array.array('d')
+        self._records = records.RecordStore()
+        # masses and records of the autogenerated series, each sorted
+        self._series = []
     
     
+    def add_mass_data(self, mass_data):
+        """
+        Adds masses and records to the database being built.
+        
+        Parameters
+        ----------
+        mass_data : iterable
+            Tuples of exact masses and ``lipproc.LipidRecord`` objects.
+        """
+        
+        for mass, rec in mass_data:
+            
+            self._masses.append(mass)
+            self._records.append(rec)
+    
+    
+    @timing.timed('moldb.build')
     def build(self):
         """
         Executes the workflow of the entire database building process.
@@ -858,24 +944,30 @@ class MoleculeDatabaseAggregator(object):
             
             resource = cls(**resargs)
             
-            self._mass_data.extend(resource)
+            self.add_mass_data(resource)
     
     
     def mass_data_arrays(self):
-        """ """
+        """
+        Creates the ``masses`` array and the ``data`` record store from
+        the collected masses and records. The records from the databases
+        are sorted, then merged with the already sorted series of the
+        autogenerated metabolites.
+        """
         
-        if hasattr(self, '_mass_data'):
+        if hasattr(self, '_records'):
             
-            self.masses = np.array(
-                [i[0] for i in self._mass_data],
-                dtype = np.float
-            )
-            self.data = np.zeros(len(self._mass_data), dtype = np.object)
-            self.data[:] = [i[1] for i in self._mass_data]
+            masses = np.frombuffer(self._masses, dtype = np.float64)
+            isort = masses.argsort(kind = 'stable')
             
-            self.sort()
+            self.masses, self.data = merge_sorted(
+                [(masses[isort], self._records.freeze().take(isort))] +
+                self._series
+            )
         
-        delattr(self, '_mass_data')
+        delattr(self, '_masses')
+        delattr(self, '_records')
+        delattr(self, '_series')
     
     
     def auto_metabolites(
@@ -884,9 +976,13 @@ class MoleculeDatabaseAggregator(object):
             sph_args = None,
             sum_only = True,
             classes = None,
+            processes = None,
             **kwargs
         ):
         """
+        Generates the metabolites of many classes. The classes are
+        independent, hence they can be generated in parallel processes.
+        The series are cached on disk, see ``metabolite_series``.
 
         Parameters
         ----------
@@ -898,6 +994,10 @@ class MoleculeDatabaseAggregator(object):
              (Default value = True)
         classes :
              (Default value = None)
+        processes : int
+            Number of processes; by default the value of the
+            ``moldb_processes`` setting. If 1 all classes are generated
+            in the current process.
         **kwargs :
             
 
@@ -908,29 +1008,35 @@ class MoleculeDatabaseAggregator(object):
         
         fa_args  = fa_args  or self.fa_args
         sph_args = sph_args or self.sph_args
+        processes = processes or settings.get('moldb_processes')
         
-        masses = []
-        data   = []
+        jobs = [
+            (clsname, fa_args, sph_args, sum_only, kwargs)
+            for clsname in classes
+        ]
         
         prg = progress.Progress(len(classes), 'Generating metabolites', 1)
         
-        for clsname in classes:
+        if processes > 1 and len(jobs) > 1:
             
-            prg.step()
-            
-            if self.verbose:
+            with concurrent.futures.ProcessPoolExecutor(processes) as pool:
                 
-                sys.stdout.write('\t:: Generating `%s`\n' % clsname)
+                for series in pool.map(_metabolite_series_job, jobs):
+                    
+                    prg.step()
+                    self._series.append(series)
             
-            cls = getattr(lipid, clsname)
+        else:
             
-            self.add_metabolite_series(
-                cls,
-                fa_args = fa_args,
-                sph_args = sph_args,
-                sum_only = sum_only,
-                **kwargs
-            )
+            for job in jobs:
+                
+                prg.step()
+                
+                if self.verbose:
+                    
+                    sys.stdout.write('\t:: Generating `%s`\n' % job[0])
+                
+                self._series.append(_metabolite_series_job(job))
         
         prg.terminate()
     
@@ -978,14 +1084,15 @@ class MoleculeDatabaseAggregator(object):
         fa_args  = fa_args or self.fa_args
         sph_args = sph_args or self.sph_args
         
-        gen = cls(
-            fa_args  = copy.copy(fa_args),
-            sph_args = copy.copy(sph_args),
-            sum_only = sum_only,
-            **kwargs
+        self._series.append(
+            metabolite_series(
+                cls,
+                fa_args = fa_args,
+                sph_args = sph_args,
+                sum_only = sum_only,
+                **kwargs
+            )
         )
-        
-        self._mass_data.extend(gen.iterlines())
     
     
     def auto_fattyacids(self, **kwargs):
@@ -1098,8 +1205,9 @@ class MoleculeDatabaseAggregator(object):
 
         """
         
-        self.data = self.data[self.masses.argsort()]
-        self.masses.sort()
+        isort = self.masses.argsort()
+        self.data = self.data.take(isort)
+        self.masses = self.masses[isort]
     
     
     def ilookup(self, m, tolerance = None):
@@ -1230,12 +1338,16 @@ class MoleculeDatabaseAggregator(object):
         if not adducts and ionmode in {'pos', 'neg'}:
             
             # we look up all adducts we have a method for
-            adducts = list(settings.get('ex2ad')[abs(charge)][ionmode].keys())
+            adducts = list(
+                settings.frozen('ex2ad')[abs(charge)][ionmode].keys()
+            )
         
-        ad_default = settings.get('adducts_default')[ionmode][abs(charge)]
-        ad_constr  = settings.get('adduct_constraints')[ionmode]
+        ad_default = (
+            settings.frozen('adducts_default')[ionmode][abs(charge)]
+        )
+        ad_constr  = settings.frozen('adduct_constraints')[ionmode]
         
-        exmethods = settings.get('ad2ex')[abs(charge)][ionmode]
+        exmethods = settings.frozen('ad2ex')[abs(charge)][ionmode]
         methods = dict((ad, exmethods[ad]) for ad in adducts)
         
         for ad, method in iteritems(methods):
@@ -1527,6 +1639,266 @@ class MoleculeDatabaseAggregator(object):
             )
             for name, idx in iteritems(names)
         )
+        
+        self._name_ids = dict(
+            (name, i)
+            for i, name in enumerate(self.names.keys())
+        )
+        # record indices of all names and the names they belong to
+        self._name_records = np.concatenate(
+            [idx for idx in self.names.values()] +
+            [np.array([], dtype = np.int64)]
+        ).astype(np.int64)
+        self._name_owners = np.repeat(
+            np.arange(len(self.names)),
+            [len(idx) for idx in self.names.values()],
+        )
+        # masses and adduct m/z's by database preference
+        self._name_tables = {}
+    
+    
+    def share(self, fname = None):
+        """
+        Writes the database into a memory mapped file so other processes
+        can use it by ``attach`` without building it. The masses, the
+        columns of the records and the names are stored as arrays, the
+        processes attached to the file share them in the memory and
+        create the records on demand.
+        
+        Parameters
+        ----------
+        fname : str
+            Path to the file, by default a new file in ``/dev/shm``.
+            The file is not removed automatically.
+        
+        Returns
+        -------
+        The path to the file.
+        """
+        
+        names = records.StringTable()
+        
+        for name in self.names.keys():
+            
+            names.add(name)
+        
+        names.freeze()
+        
+        arrays = self.data.arrays(prefix = 'data_')
+        arrays.update({
+            'masses': self.masses,
+            'names_buffer': names.arrays()['buffer'],
+            'names_offsets': names.arrays()['offsets'],
+            'names_sizes': np.array(
+                [len(idx) for idx in self.names.values()],
+                dtype = np.int64,
+            ),
+            'names_records': self._name_records,
+        })
+        
+        meta = {
+            'values': self.data.values,
+            'resources': self.resources,
+            'tolerance': self.tolerance,
+            'fa_args': self.fa_args,
+            'sph_args': self.sph_args,
+            'database_preference': self.database_preference,
+        }
+        
+        return shared.save(fname or shared.new_fname('moldb'), arrays, meta)
+    
+    
+    @classmethod
+    def attach(cls, fname):
+        """
+        Creates a database from a file written by ``share``. The arrays
+        are mapped from the file read only, only the names dictionary is
+        created in the memory of the process.
+        """
+        
+        arrays, meta = shared.load(fname)
+        
+        new = cls(
+            resources = meta['resources'],
+            tolerance = meta['tolerance'],
+            fa_args = meta['fa_args'],
+            sph_args = meta['sph_args'],
+            database_preference = meta['database_preference'],
+            build = False,
+        )
+        new.masses = arrays['masses']
+        new.data = records.RecordStore.from_arrays(
+            arrays,
+            meta['values'],
+            prefix = 'data_',
+        )
+        
+        names = records.StringTable.from_arrays(
+            arrays['names_buffer'],
+            arrays['names_offsets'],
+        )
+        ends = np.cumsum(arrays['names_sizes']).tolist()
+        # views of the record indices of each name
+        new.names = dict(
+            (names[i], arrays['names_records'][start:end])
+            for i, start, end in zip(xrange(len(names)), [0] + ends, ends)
+        )
+        new._name_ids = dict(
+            (name, i)
+            for i, name in enumerate(new.names.keys())
+        )
+        new._name_records = arrays['names_records']
+        new._name_owners = np.repeat(
+            np.arange(len(names)),
+            arrays['names_sizes'],
+        )
+        new._name_tables = {}
+        
+        return new
+    
+    
+    def name_ids(self, names):
+        """
+        Looks up the position of names in the names dictionary.
+        Names which are not found are normalized by ``lipproc.str2lipid``
+        to the species level, e.g. ``PC(18:1/18:1)`` to ``PC(36:2)``.
+        
+        Parameters
+        ----------
+        names : list
+            Lipid names as strings or tuples of ``Headgroup`` and
+            ``ChainSummary`` objects.
+        
+        Returns
+        -------
+        Integer array, -1 for the names not in the database.
+        """
+        
+        ids = np.full(len(names), -1, dtype = np.int64)
+        
+        for i, name in enumerate(names):
+            
+            if not hasattr(name, 'lower'):
+                
+                name = lipproc.summary_str(hg = name[0], chainsum = name[1])
+            
+            if name not in self._name_ids:
+                
+                name = name_key(name)
+            
+            ids[i] = self._name_ids.get(name, -1)
+        
+        return ids
+    
+    
+    def _name_table(self, database_preference = None):
+        """
+        Returns a dict with the masses of all names selected according to
+        the database preference, later also with the m/z values for
+        the adducts.
+        """
+        
+        database_preference = tuple(
+            database_preference or self.database_preference
+        )
+        
+        if database_preference not in self._name_tables:
+            
+            rank = dict(
+                (db, i)
+                for i, db in enumerate(database_preference)
+            )
+            # rank of each interned value, only the database names matter
+            value_rank = np.array([
+                rank.get(value, len(rank))
+                for value in self.data.values
+            ] + [len(rank)])
+            record_rank = value_rank[self.data.db[self._name_records]]
+            # for each name the first record from the preferred database
+            order = np.lexsort((
+                self._name_records,
+                record_rank,
+                self._name_owners,
+            ))
+            owners = self._name_owners[order]
+            first = order[np.r_[True, owners[1:] != owners[:-1]]]
+            first = first[record_rank[first] < len(rank)]
+            
+            masses = np.full(len(self.names), np.nan)
+            masses[self._name_owners[first]] = (
+                self.masses[self._name_records[first]]
+            )
+            
+            self._name_tables[database_preference] = {None: masses}
+        
+        return self._name_tables[database_preference]
+    
+    
+    def mass_from_names(self, names, database_preference = None):
+        """
+        For many lipid names returns one exact mass each, preferably the
+        one from the database in front of the ``database_preference``
+        list. The batch version of ``mass_from_name``.
+        
+        Parameters
+        ----------
+        names : list
+            Lipid names as strings or tuples of ``Headgroup`` and
+            ``ChainSummary`` objects.
+        database_preference : list
+            Database names in order of preference.
+        
+        Returns
+        -------
+        Array of masses, ``nan`` for the names not in the database.
+        """
+        
+        return self.mz_from_names(
+            names,
+            adducts = (None,),
+            database_preference = database_preference,
+        )[:,0]
+    
+    
+    def mz_from_names(self, names, adducts, database_preference = None):
+        """
+        For many lipid names and adducts returns the m/z values.
+        The batch version of ``mz_from_name``. The m/z's of all names
+        are calculated once for each adduct and kept for the next calls.
+        
+        Parameters
+        ----------
+        names : list
+            Lipid names as strings or tuples of ``Headgroup`` and
+            ``ChainSummary`` objects.
+        adducts : list
+            Adduct names as in the ``ex2ad_all`` setting, e.g. ``[M+H]+``.
+            ``None`` means the exact mass.
+        database_preference : list
+            Database names in order of preference.
+        
+        Returns
+        -------
+        Array with one row for each name and one column for each adduct,
+        ``nan`` for the names not in the database.
+        """
+        
+        table = self._name_table(database_preference)
+        ids = self.name_ids(names)
+        found = ids >= 0
+        
+        result = np.full((len(names), len(adducts)), np.nan)
+        
+        for j, adduct in enumerate(adducts):
+            
+            if adduct not in table:
+                
+                adduct_method = settings.frozen('ex2ad_all')[adduct]
+                table[adduct] = getattr(mzmod.Mz(table[None]), adduct_method)()
+            
+            result[found, j] = table[adduct][ids[found]]
+        
+        return result
     
     
     def idx_from_name(
@@ -1594,9 +1966,7 @@ class MoleculeDatabaseAggregator(object):
                 
                 for i in idx:
                     
-                    rec = self.data[i]
-                    
-                    if rec.lab.db == db:
+                    if self.data.db_at(i) == db:
                         
                         return self.masses[i]
     
@@ -1618,7 +1988,7 @@ class MoleculeDatabaseAggregator(object):
         if exmass is not None:
             
             adduct_method = (
-                settings.get('ex2ad_all')[adduct]
+                settings.frozen('ex2ad_all')[adduct]
             )
             
             return getattr(formula.Formula(exmass), adduct_method)()
@@ -1641,18 +2011,12 @@ class MoleculeDatabaseAggregator(object):
         if exmasses is not None:
             
             adduct_method = (
-                settings.get('ex2ad_all')[adduct]
+                settings.frozen('ex2ad_all')[adduct]
             )
             
-            addmasses = np.array([
-                getattr(formula.Formula(exmass), adduct_method)()
-                for exmass in exmasses
-            ])
+            addmasses = getattr(mzmod.Mz(exmasses), adduct_method)()
             
-            ppms = np.array([
-                common.ppm(addmass, measured_mz)
-                for addmass in addmasses
-            ])
+            ppms = common.ppm(addmasses, measured_mz)
             
             return addmasses[np.argmin(np.abs(ppms))]
     
@@ -1753,6 +2117,193 @@ def init_db(**kwargs):
     
     setattr(mod, 'db', MoleculeDatabaseAggregator(**kwargs))
 
+
+def share_db(fname = None):
+    """
+    Writes the module's default database into a memory mapped file for
+    other processes, see ``MoleculeDatabaseAggregator.share``.
+    
+    Returns
+    -------
+    The path to the file.
+    """
+    
+    return get_db().share(fname)
+
+
+def attach_db(fname):
+    """
+    Sets the module's default database to the one shared in a file by
+    ``share_db``. E.g. the initializer of worker processes::
+        
+        fname = moldb.share_db()
+        pool = multiprocessing.Pool(
+            initializer = moldb.attach_db,
+            initargs = (fname,),
+        )
+    """
+    
+    mod = sys.modules[__name__]
+    
+    setattr(mod, 'db', MoleculeDatabaseAggregator.attach(fname))
+
+
+def metabolite_series(
+        cls,
+        fa_args = None,
+        sph_args = None,
+        sum_only = True,
+        cache = None,
+        **kwargs
+    ):
+    """
+    Generates the metabolites of one class defined in the ``lipid``
+    module along a range of homolog series.
+    
+    The result depends only on the class and the arguments, hence it is
+    saved into the cache directory and loaded from there next time,
+    unless the lipyd version changed.
+    
+    Parameters
+    ----------
+    cls : str,type
+        Name of a class in the ``lipid`` module or a class. Only series
+        of classes from the ``lipid`` module are cached.
+    fa_args : dict
+        Fatty acyl arguments.
+    sph_args : dict
+        Sphingosine base arguments.
+    sum_only : bool
+        Generate only species without chain details.
+    cache : bool
+        Use the cache; by default the value of the ``moldb_series_cache``
+        setting.
+    **kwargs :
+        Passed to the class.
+    
+    Returns
+    -------
+    Tuple of an array of masses in increasing order and a
+    ``records.RecordStore`` with the records in the same order.
+    """
+    
+    cache = settings.get('moldb_series_cache') if cache is None else cache
+    
+    if hasattr(cls, 'lower'):
+        
+        cls = getattr(lipid, cls)
+    
+    cache = cache and getattr(lipid, cls.__name__, None) is cls
+    
+    if cache:
+        
+        cachefile = _metabolite_series_cachefile(
+            cls.__name__,
+            fa_args,
+            sph_args,
+            sum_only,
+            kwargs,
+        )
+        
+        if os.path.exists(cachefile):
+            
+            with open(cachefile, 'rb') as fp:
+                
+                return pickle.load(fp)
+    
+    gen = cls(
+        fa_args  = copy.copy(fa_args),
+        sph_args = copy.copy(sph_args),
+        sum_only = sum_only,
+        **kwargs
+    )
+    
+    masses = array.array('d')
+    recs = records.RecordStore()
+    
+    for mass, rec in gen.iterlines():
+        
+        masses.append(mass)
+        recs.append(rec)
+    
+    masses = np.frombuffer(masses, dtype = np.float64)
+    isort = masses.argsort(kind = 'stable')
+    series = (masses[isort], recs.freeze().take(isort))
+    
+    if cache:
+        
+        os.makedirs(os.path.dirname(cachefile), exist_ok = True)
+        # other processes might read the same file
+        tmpfile = '%s.%u.tmp' % (cachefile, os.getpid())
+        
+        with open(tmpfile, 'wb') as fp:
+            
+            pickle.dump(series, fp, protocol = pickle.HIGHEST_PROTOCOL)
+        
+        os.replace(tmpfile, cachefile)
+    
+    return series
+
+
+def _metabolite_series_cachefile(clsname, fa_args, sph_args, sum_only, kwargs):
+    
+    key = repr((
+        clsname,
+        sorted(iteritems(fa_args or {})),
+        sorted(iteritems(sph_args or {})),
+        sum_only,
+        sorted(iteritems(kwargs)),
+        _version.__version__,
+    ))
+    
+    return os.path.join(
+        settings.get('cachedir'),
+        'metabolite_series',
+        '%s__%s.pickle' % (
+            clsname,
+            hashlib.md5(key.encode('utf-8')).hexdigest(),
+        ),
+    )
+
+
+def _metabolite_series_job(job):
+    
+    clsname, fa_args, sph_args, sum_only, kwargs = job
+    
+    return metabolite_series(
+        clsname,
+        fa_args = fa_args,
+        sph_args = sph_args,
+        sum_only = sum_only,
+        **kwargs
+    )
+
+
+def merge_sorted(series):
+    """
+    Merges series of masses and records, each sorted by mass.
+    
+    The concatenated masses are sorted by a stable sort, which for
+    floats in ``numpy`` is a timsort: it recognizes the sorted runs and
+    merges them, at the cost of a k-way merge instead of a full sort.
+    
+    Parameters
+    ----------
+    series : list
+        Tuples of mass arrays and ``records.RecordStore`` objects.
+    
+    Returns
+    -------
+    Tuple of the merged masses and record store.
+    """
+    
+    masses = np.concatenate([m for m, recs in series])
+    order = masses.argsort(kind = 'stable')
+    recs = records.RecordStore.concatenate([recs for m, recs in series])
+    
+    return masses[order], recs.take(order)
+
+
 def get_db():
     """Returns the module's default database.
     Initializes the database with default paremeters if no database
@@ -2055,6 +2606,59 @@ def mz_from_name(
     )
 
 
+def mass_from_names(names, database_preference = None):
+    """
+    For many lipid names returns one exact mass each.
+    See ``MoleculeDatabaseAggregator.mass_from_names``.
+    """
+    
+    db = get_db()
+    
+    return db.mass_from_names(
+        names = names,
+        database_preference = database_preference,
+    )
+
+
+def mz_from_names(names, adducts, database_preference = None):
+    """
+    For many lipid names and adducts returns the m/z values in an array.
+    See ``MoleculeDatabaseAggregator.mz_from_names``.
+    """
+    
+    db = get_db()
+    
+    return db.mz_from_names(
+        names = names,
+        adducts = adducts,
+        database_preference = database_preference,
+    )
+
+
+@functools.lru_cache(maxsize = 65536)
+def name_key(name):
+    """
+    Normalizes a lipid name to the species level summary string used as
+    key in the names dictionary of the database, e.g. ``PC(18:1/18:1)``
+    to ``PC(36:2)``. Returns the name unchanged if it could not be
+    processed.
+    """
+    
+    try:
+        
+        hg, chainsum, chains = lipproc.str2lipid(name)
+        
+    except ValueError:
+        
+        return name
+    
+    if hg.main is None:
+        
+        return name
+    
+    return lipproc.summary_str(hg, chainsum)
+
+
 def mz_lowest_error_from_name(
         measured_mz,
         adduct,
@@ -25,22 +25,27 @@ import sys
 import imp
 import re
 import math
+import hashlib
 import copy
 import itertools
 import collections
 from argparse import Namespace
 import numpy as np
+import scipy.sparse
 
 from lipyd.common import *
 import lipyd.mgf as mgf
 import lipyd.mz as mzmod
 import lipyd.session as session
 import lipyd.settings as settings
+import lipyd.timing as timing
 import lipyd.lookup as lookup
 import lipyd.fragdb as fragdb
 import lipyd.moldb as moldb
 import lipyd.lipproc as lipproc
-import lipyd.plot as plot
+import lipyd.checkpoint as checkpointmod
+import lipyd.progress as progress
+import lipyd._version as _version
 
 
 ChainFragment = collections.namedtuple(
@@ -198,9 +203,104 @@ ChainIdentificationDetails.__new__.__defaults__ = (None, None, None)
 
 ScanDetails = collections.namedtuple(
     'ScanDetails',
-    ['sample_id', 'scan_id', 'source', 'deltart']
+    [
+        'sample_id',
+        'scan_id',
+        'source',
+        'deltart',
+        'preprocessing',
+        'representative',
+    ]
 )
-ScanDetails.__new__.__defaults__ = (None, None, None, None)
+ScanDetails.__new__.__defaults__ = (None, None, None, None, None, None)
+
+
+class ScanPreprocessing(collections.namedtuple(
+        'ScanPreprocessingBase',
+        [
+            'min_intensity',
+            'min_relative_intensity',
+            'top_n',
+            'deisotope',
+            'deduplicate_tolerance',
+        ]
+    )):
+    """
+    Parameters of the preprocessing of MS2 spectra before annotation.
+    
+    Attributes
+    ----------
+    min_intensity : float
+        Remove the peaks with intensity lower than this value.
+    min_relative_intensity : float
+        Remove the peaks with intensity lower than this fraction of
+        the highest peak.
+    top_n : int
+        Keep only this number of the most intense peaks.
+    deisotope : bool
+        Remove the peaks which are the 13C isotopes of a more intense
+        peak at 1.003355 lower m/z (singly charged fragments).
+    deduplicate_tolerance : float
+        Merge the peaks closer to each other than this tolerance (ppm)
+        keeping only the most intense one.
+    """
+    
+    
+    def __new__(
+            cls,
+            min_intensity = 0,
+            min_relative_intensity = 0,
+            top_n = None,
+            deisotope = False,
+            deduplicate_tolerance = None,
+        ):
+        
+        return super(ScanPreprocessing, cls).__new__(
+            cls,
+            min_intensity,
+            min_relative_intensity,
+            top_n,
+            deisotope,
+            deduplicate_tolerance,
+        )
+    
+    
+    @classmethod
+    def from_settings(cls, **kwargs):
+        """
+        Creates preprocessing parameters from the current settings,
+        the values in ``kwargs`` override the settings.
+        """
+        
+        param = dict(
+            (field, settings.frozen('ms2_%s' % field))
+            for field in (
+                'min_intensity',
+                'min_relative_intensity',
+                'top_n',
+                'deisotope',
+                'deduplicate_tolerance',
+            )
+        )
+        param.update(kwargs)
+        
+        return cls(**param)
+    
+    
+    def __bool__(self):
+        """
+        Tells if any of the preprocessing steps is enabled.
+        """
+        
+        return bool(
+            self.min_intensity or
+            self.min_relative_intensity or
+            self.top_n or
+            self.deisotope or
+            self.deduplicate_tolerance
+        )
+    
+    __nonzero__ = __bool__
 
 
 PrecursorDetails = collections.namedtuple(
@@ -272,6 +372,302 @@ class intensity_sorted(object):
         self.scan.sort_mz()
 
 
+def _hashable(value):
+    """
+    Makes a fragment or chain criterion (see ``Scan.match_chattr``)
+    usable as a dict key.
+    """
+    
+    if isinstance(value, (set, frozenset)):
+        
+        return frozenset(value)
+    
+    if isinstance(value, (list, tuple)):
+        
+        return (type(value).__name__,) + tuple(_hashable(v) for v in value)
+    
+    return value
+
+
+#: Chain positions matching the fragment constraints by the version of
+#: the fragment databases, ion mode, fragment type and chain layout of
+#: the database records
+_constraint_positions = {}
+
+
+def chain_layout(record):
+    """
+    Returns the attributes of an MS1 database record which determine the
+    chain positions a fragment might originate from: the headgroup, the
+    chain types and the chain attributes. Records of the same class
+    differing only in their carbon counts and unsaturations have the
+    same layout.
+    """
+    
+    chainsum = record.chainsum or lipproc.sum_chains(record.chains)
+    
+    return record.hg, chainsum.typ, chainsum.attr
+
+
+def fragment_combinations(frags, c, u):
+    """
+    Yields the combinations of chain fragments, one from each list in
+    ``frags``, with the total carbon count ``c`` and unsaturation ``u``,
+    in the same order as ``itertools.product`` would. The fragments of
+    the last position are looked up by the carbon count and unsaturation
+    still missing, hence only the other positions are iterated.
+    """
+    
+    if not frags:
+        
+        if c == 0 and u == 0:
+            
+            yield ()
+        
+        return
+    
+    last = collections.defaultdict(list)
+    
+    for frag in frags[-1]:
+        
+        last[(frag.c, frag.u)].append(frag)
+    
+    for frag_comb in itertools.product(*frags[:-1]):
+        
+        missing = (
+            c - sum(frag.c for frag in frag_comb),
+            u - sum(frag.u for frag in frag_comb),
+        )
+        
+        for frag in last.get(missing, ()):
+            
+            yield frag_comb + (frag,)
+
+
+def clear_cache():
+    """
+    Clears the chain positions cached from the fragment constraints.
+    The positions from earlier fragment databases are not used anyway,
+    this only frees the memory.
+    """
+    
+    _constraint_positions.clear()
+
+
+class AnnotationIndex(object):
+    """
+    Inverted index of the fragment annotations of a scan.
+    """
+    
+    # annotation attributes and the type of the criteria values
+    attrs = (
+        ('fragtype', basestring),
+        ('chaintype', basestring),
+        ('c', int),
+        ('u', int),
+    )
+    
+    def __init__(self, annot, irank):
+        """
+        For each annotation stores the intensity rank of its peak and
+        the codes of its fragment type, chain type, carbon count and
+        unsaturation. Queries evaluate the criteria only once for each
+        distinct value of the attributes and the results are cached,
+        hence repeated queries cost one dict lookup.
+        
+        Parameters
+        ----------
+        annot : numpy.ndarray
+            Annotations of the peaks: tuples of ``FragmentAnnotation``
+            objects as in ``Scan.annot``.
+        irank : numpy.ndarray
+            Intensity ranks of the peaks.
+        """
+        
+        self.annot = annot
+        self.values = dict((attr, []) for attr, typ in self.attrs)
+        index = dict((attr, {}) for attr, typ in self.attrs)
+        codes = dict((attr, []) for attr, typ in self.attrs)
+        ranks = []
+        chain_ranks = set()
+        
+        for i, aa in enumerate(annot):
+            
+            for a in aa:
+                
+                ranks.append(irank[i])
+                
+                for attr, typ in self.attrs:
+                    
+                    value = getattr(a, attr)
+                    # all NaNs get the same code
+                    key = np.nan if value != value else value
+                    
+                    if key not in index[attr]:
+                        
+                        index[attr][key] = len(self.values[attr])
+                        self.values[attr].append(value)
+                    
+                    codes[attr].append(index[attr][key])
+                
+                if not np.isnan(a.c):
+                    
+                    chain_ranks.add(irank[i])
+        
+        self.ranks = np.array(ranks, dtype = np.int64)
+        self.codes = dict(
+            (attr, np.array(c, dtype = np.int64))
+            for attr, c in iteritems(codes)
+        )
+        #: Intensity ranks of the peaks with aliphatic chain annotation
+        self.chain_ranks = np.array(sorted(chain_ranks), dtype = np.int64)
+        self._cache = {}
+    
+    def ranks_matching(
+            self,
+            frag_type = None,
+            chain_type = None,
+            c = None,
+            u = None,
+        ):
+        """
+        Returns the intensity ranks of the peaks with at least one
+        annotation matching the criteria. The criteria are the same as
+        at ``Scan.match_annot``.
+        
+        Returns
+        -------
+        Sorted array of intensity ranks.
+        """
+        
+        criteria = (frag_type, chain_type, c, u)
+        key = tuple(_hashable(cr) for cr in criteria)
+        
+        if key not in self._cache:
+            
+            match = np.ones(len(self.ranks), dtype = bool)
+            
+            for (attr, typ), accepted in zip(self.attrs, criteria):
+                
+                if accepted is None:
+                    
+                    continue
+                
+                accepted_values = np.array(
+                    [
+                        Scan.match_chattr(value, accepted, typ = typ)
+                        for value in self.values[attr]
+                    ],
+                    dtype = bool,
+                )
+                match &= accepted_values[self.codes[attr]]
+            
+            self._cache[key] = np.unique(self.ranks[match])
+        
+        return self._cache[key]
+
+
+# mass difference between 13C and 12C
+_C13_SHIFT = 1.003355
+
+
+def preprocess_peaks(mzs, intensities, preprocessing, tolerance = None):
+    """
+    Selects the peaks of an MS2 spectrum to be kept after preprocessing.
+    The steps are applied in this order: intensity floor, merging the
+    peaks within the deduplication tolerance, removal of the isotope
+    peaks and selection of the top N peaks.
+    
+    Parameters
+    ----------
+    mzs : numpy.array
+        m/z values of the peaks.
+    intensities : numpy.array
+        Intensities of the peaks.
+    preprocessing : ScanPreprocessing
+        Parameters of the preprocessing.
+    tolerance : float
+        Tolerance in ppm for the isotope peaks. By default the value of
+        the ``ms2_tolerance`` setting.
+    
+    Returns
+    -------
+    Boolean array, ``True`` for the peaks to be kept.
+    """
+    
+    keep = np.ones(len(mzs), dtype = bool)
+    
+    if not preprocessing or not len(mzs):
+        
+        return keep
+    
+    p = preprocessing
+    tolerance = tolerance or settings.frozen('ms2_tolerance')
+    
+    floor = max(
+        p.min_intensity or 0,
+        (p.min_relative_intensity or 0) * intensities.max(),
+    )
+    
+    if floor:
+        
+        keep &= intensities >= floor
+    
+    imzsort = np.argsort(mzs, kind = 'mergesort')
+    
+    if p.deduplicate_tolerance:
+        
+        idx = imzsort[keep[imzsort]]
+        smzs = mzs[idx]
+        # a new group starts where the distance from the previous peak
+        # is larger than the tolerance
+        group = np.cumsum(np.concatenate((
+            [True],
+            np.diff(smzs) > lookup.ppm_tolerance(
+                p.deduplicate_tolerance,
+                smzs[1:],
+            ),
+        )))
+        order = np.lexsort((-intensities[idx], group))
+        first = np.concatenate(([True], np.diff(group[order]) != 0))
+        keep[:] = False
+        keep[idx[order][first]] = True
+    
+    if p.deisotope:
+        
+        idx = imzsort[keep[imzsort]]
+        smzs = mzs[idx]
+        sints = intensities[idx]
+        mono = smzs - _C13_SHIFT
+        t_abs = lookup.ppm_tolerance(tolerance, mono)
+        # the closest peaks below and above the monoisotopic m/z
+        iu = smzs.searchsorted(mono)
+        isotope = np.zeros(len(idx), dtype = bool)
+        
+        for i in (iu - 1, iu):
+            
+            valid = np.logical_and(i >= 0, i < len(idx))
+            i = np.clip(i, 0, len(idx) - 1)
+            isotope |= (
+                valid &
+                (np.abs(smzs[i] - mono) <= t_abs) &
+                (sints[i] > sints)
+            )
+        
+        keep[idx[isotope]] = False
+    
+    if p.top_n and keep.sum() > p.top_n:
+        
+        idx = np.where(keep)[0]
+        top = idx[
+            np.argsort(-intensities[idx], kind = 'mergesort')[:p.top_n]
+        ]
+        keep[:] = False
+        keep[top] = True
+    
+    return keep
+
+
 class ScanBase(object):
     """ Class of .
 
@@ -291,6 +687,9 @@ class ScanBase(object):
         Description of arg2
     scan_id : str
         Description of arg2
+    preprocessing : ScanPreprocessing,dict
+        Parameters of the preprocessing of the spectrum, by default
+        from the settings. See ``preprocess_peaks``.
 
     """
     
@@ -302,9 +701,10 @@ class ScanBase(object):
             intensities = None,
             tolerance = None,
             scan_id = None,
+            preprocessing = None,
         ):
 
-        self.tolerance = tolerance or settings.get('ms2_tolerance')
+        self.tolerance = tolerance or settings.frozen('ms2_tolerance')
         self.sorted_by = None
         self.mzs = mzs
         self.ionmode = ionmode
@@ -325,6 +725,7 @@ class ScanBase(object):
             
             self.intensities = np.array(self.intensities)
         
+        self.preprocess(preprocessing)
         self.annotate()
         self.normalize_intensities()
         
@@ -335,6 +736,9 @@ class ScanBase(object):
         self.irank = np.arange(len(self.mzs))
         self.imzsort  = np.argsort(self.mzs)
         self.sorted_by = 'intensities'
+        # for lookups without sorting the scan
+        self.mzs_ascending = self.mzs[self.imzsort]
+        self._top_mzs = {}
     
     def reload(self):
         modname = self.__class__.__module__
@@ -347,6 +751,37 @@ class ScanBase(object):
         
         return len(self.mzs)
     
+    @timing.timed('ms2.preprocess')
+    def preprocess(self, preprocessing = None):
+        """Removes the peaks not needed for the identification before
+        the annotation. See ``preprocess_peaks`` for the steps.
+        
+        Parameters
+        ----------
+        preprocessing : ScanPreprocessing,dict
+            Preprocessing parameters, in a ``dict`` only the ones
+            different from the settings. By default the settings are used.
+        """
+        
+        if not isinstance(preprocessing, ScanPreprocessing):
+            
+            preprocessing = ScanPreprocessing.from_settings(
+                **(preprocessing or {})
+            )
+        
+        self.preprocessing = preprocessing
+        
+        if preprocessing:
+            
+            keep = preprocess_peaks(
+                self.mzs,
+                self.intensities,
+                preprocessing,
+                tolerance = self.tolerance,
+            )
+            self.mzs = self.mzs[keep]
+            self.intensities = self.intensities[keep]
+    
     def sort_mz(self):
         """Sorts the scan by m/z values ascending
 
@@ -413,6 +848,7 @@ class ScanBase(object):
             
             data['annot'] = data['annot'][isort]
     
+    @timing.timed('ms2.annotate')
     def annotate(self):
         """Annotates the fragments in the scan with identities provided by
         the fragment database.
@@ -450,6 +886,34 @@ class ScanBase(object):
         return np.array(list(annotator)) # this is array
                                          # only to be sortable
     
+    def get_annot_shifted(self, precursor):
+        """Returns array of annotations assuming a different precursor.
+        Only the neutral losses depend on the precursor, hence the charged
+        ion annotations are taken from the current annotations and only
+        the neutral losses are looked up again.
+        
+        Parameters
+        ----------
+        precursor : float
+            The precursor m/z.
+        
+        Returns
+        -------
+        
+        """
+        
+        annotator = fragdb.FragmentAnnotator(
+            self.mzs,
+            self.ionmode,
+            precursor,
+            tolerance = self.tolerance,
+        )
+        
+        return np.array([
+            nl_annot + tuple(a for a in annot if a.charge != 0)
+            for nl_annot, annot in zip(annotator.neutral_losses(), self.annot)
+        ])
+    
     def normalize_intensities(self):
         """Creates a vector of normalized intensities i.e. divides intensities
         by their maximum.
@@ -490,6 +954,7 @@ class Scan(ScanBase):
             tolerance = None,
             ms1_tolerance = None,
             rt = None,
+            preprocessing = None,
         ):
         
         ScanBase.__init__(
@@ -499,20 +964,23 @@ class Scan(ScanBase):
             precursor,
             intensities,
             tolerance = tolerance,
+            preprocessing = preprocessing,
         )
         
         # get some settings
-        self.ms1_tolerance = ms1_tolerance or settings.get('ms1_tolerance')
-        self.check_ratio_g = settings.get(
+        self.ms1_tolerance = (
+            ms1_tolerance or settings.frozen('ms1_tolerance')
+        )
+        self.check_ratio_g = settings.frozen(
             'even_chain_fragment_intensity_ratios_gl_gpl'
         )
-        self.check_ratio_s = settings.get(
+        self.check_ratio_s = settings.frozen(
             'even_chain_fragment_intensity_ratios_sl'
         )
-        self.iratio_logbase = settings.get(
+        self.iratio_logbase = settings.frozen(
             'chain_fragment_instensity_ratios_logbase'
         )
-        self.chain_details = settings.get('ms2_scan_chain_details')
+        self.chain_details = settings.frozen('ms2_scan_chain_details')
         
         if ms1_records is None and precursor is not None:
             
@@ -544,7 +1012,10 @@ class Scan(ScanBase):
             scan_id   = self.scan_id,
             source    = self.source,
             deltart   = self.deltart,
+            preprocessing = self.preprocessing,
         )
+        # m/z values of fragments by name and adduct
+        self._fragment_mzs = {}
     
     
     @classmethod
@@ -677,6 +1148,9 @@ class Scan(ScanBase):
     
     def plot(self, **kwargs):
         
+        # imported here as it pulls in matplotlib
+        import lipyd.plot as plot
+        
         _ = plot.SpectrumPlot(
             mzs = self.mzs,
             intensities = self.intensities,
@@ -783,13 +1257,9 @@ class Scan(ScanBase):
 
         """
         
-        self.sort_mz()
-        
-        imz = lookup.find(self.mzs, mz, self.tolerance)
+        imz = lookup.find(self.mzs_ascending, mz, self.tolerance)
         i = self.imzsort[imz] if imz else None
         
-        self.sort_intensity()
-        
         return i
     
     def has_mz(self, mz):
@@ -879,20 +1349,48 @@ class Scan(ScanBase):
 
         """
         
-        frag = fragdb.by_name(name, self.ionmode)
+        mz = self.fragment_mz(name, adduct = adduct)
         
-        if frag is not None:
+        if mz is not None:
             
-            if frag[6] == 0:
-                
-                return self.nl_lookup(frag[0], adduct = adduct)
-                
-            else:
-                
-                return self.mz_lookup(frag[0])
+            return self.mz_lookup(mz)
         
         return False
     
+    def fragment_mz(self, name, adduct = None):
+        """Returns the m/z of a fragment by its name. For neutral losses
+        the m/z is calculated from the precursor. The values are cached.
+        Returns `None` if the fragment name could not be found in the
+        database.
+        
+        Parameters
+        ----------
+        name : str
+            Fragment full name as used in the database 2nd column.
+        adduct : str
+            The precursor adduct for neutral losses.
+        
+        Returns
+        -------
+        
+        """
+        
+        key = (name, adduct)
+        
+        if key not in self._fragment_mzs:
+            
+            frag = fragdb.by_name(name, self.ionmode)
+            
+            self._fragment_mzs[key] = (
+                None
+                    if frag is None else
+                self.nl(frag[0], adduct = adduct)
+                    if frag[6] == 0 else
+                frag[0]
+            )
+        
+        return self._fragment_mzs[key]
+    
     def has_fragment(self, name, adduct = None):
         """Tells if a fragment exists in this scan by its name.
         
@@ -949,15 +1447,9 @@ class Scan(ScanBase):
 
         """
         
-        frag = fragdb.by_name(name, self.ionmode)
+        mz = self.fragment_mz(name, adduct = adduct)
         
-        if frag is not None:
-            
-            mz = (
-                self.nl(frag[0], adduct = adduct)
-                    if frag[6] == 0 else
-                frag[0]
-            )
+        if mz is not None:
             
             return self.mz_match(self.mzs[0], mz)
     
@@ -978,15 +1470,9 @@ class Scan(ScanBase):
 
         """
         
-        frag = fragdb.by_name(name, self.ionmode)
+        mz = self.fragment_mz(name, adduct = adduct)
         
-        if frag is not None:
-            
-            mz = (
-                self.nl(frag[0], adduct = adduct)
-                    if frag[6] == 0 else
-                frag[0]
-            )
+        if mz is not None:
             
             return self.mz_among_most_abundant(mz, n = n)
     
@@ -1013,15 +1499,9 @@ class Scan(ScanBase):
 
         """
         
-        frag = fragdb.by_name(name, self.ionmode)
+        mz = self.fragment_mz(name, adduct = adduct)
         
-        if frag is not None:
-            
-            mz = (
-                self.nl(frag[0], adduct = adduct)
-                    if frag[6] == 0 else
-                frag[0]
-            )
+        if mz is not None:
             
             return self.mz_percent_of_most_abundant(mz, percent = percent)
     
@@ -1078,15 +1558,7 @@ class Scan(ScanBase):
 
         """
         
-        self.sort_mz()
-        
-        i = lookup.find(
-            self.mzs[self.irank < n], # intensity rank < n
-            mz,
-            self.tolerance
-        )
-        
-        self.sort_intensity()
+        i = lookup.find(self.top_mzs(n), mz, self.tolerance)
         
         if self.verbose:
             
@@ -1098,6 +1570,26 @@ class Scan(ScanBase):
         
         return i is not None
     
+    def top_mzs(self, n):
+        """Returns the m/z values of the `n` most abundant fragments in
+        ascending order. The arrays are cached.
+        
+        Parameters
+        ----------
+        n : int
+            The number of most abundant fragments.
+        
+        Returns
+        -------
+        
+        """
+        
+        if n not in self._top_mzs:
+            
+            self._top_mzs[n] = np.sort(self.mzs[self.irank < n])
+        
+        return self._top_mzs[n]
+    
     def nl_among_most_abundant(self, nl, n = 2, adduct = None):
         """Tells if a neutral loss corresponds to one of the
         most aboundant `n` fragments in a spectrum.
@@ -1407,19 +1899,16 @@ class Scan(ScanBase):
         
         head = len(self.mzs) if head is None else min(head, len(self.mzs))
         
-        for i in xrange(head):
+        ranks = self.annot_index(adduct).ranks_matching(
+            frag_type = frag_type,
+            chain_type = chain_type,
+            c = c,
+            u = u,
+        )
+        
+        for i in ranks[:np.searchsorted(ranks, head)]:
             
-            if self.chain_fragment_type_is(
-                i,
-                frag_type = frag_type,
-                chain_type = chain_type,
-                c = c,
-                u = u,
-                return_annot = False,
-                adduct = adduct,
-            ):
-                
-                yield i
+            yield int(i)
     
     def chain_fragment_type_among_most_abundant(
             self,
@@ -1972,11 +2461,25 @@ class Scan(ScanBase):
 
         """
         
-        # constraints for the fragment type
-        constr = fragdb.constraints(frag_type, self.ionmode)
-        # set of possible positions of the chain
-        # which this fragment originates from
-        return lipproc.match_constraints(record, constr)[1]
+        # a new fragment database might have other constraints
+        key = (
+            fragdb.version,
+            self.ionmode,
+            frag_type,
+            chain_layout(record),
+        )
+        
+        if key not in _constraint_positions:
+            
+            # constraints for the fragment type
+            constr = fragdb.constraints(frag_type, self.ionmode)
+            # set of possible positions of the chain
+            # which this fragment originates from
+            _constraint_positions[key] = frozenset(
+                lipproc.match_constraints(record, constr)[1]
+            )
+        
+        return _constraint_positions[key]
     
     def is_chain(self, i, adduct = None):
         """Examines if a fragment has an aliphatic chain.
@@ -2269,31 +2772,28 @@ class Scan(ScanBase):
                 '%u fragments.' % head
             )
         
-        result = any((
-            self.chain_fragment_type_is(
-                i,
-                frag_type = frag_type,
-                chain_type = chain_type,
-                c = c,
-                u = u,
-                adduct = adduct,
-            )
-            for i in (
-                xrange(head)
-                    if not skip_non_chains else
-                itertools.islice(
-                    (
-                        i for i in xrange(len(self.mzs))
-                            if (
-                                not skip_non_chains or self.is_chain(i)
-                            ) and (
-                                min_mass is None or self.mzs[i] >= min_mass
-                            )
-                    ),
-                    head
-                )
-            )
-        ))
+        ranks = self.annot_index(adduct).ranks_matching(
+            frag_type = frag_type,
+            chain_type = chain_type,
+            c = c,
+            u = u,
+        )
+        
+        if skip_non_chains:
+            
+            # the first `head` fragments with aliphatic chain
+            # and at least `min_mass` m/z
+            top = self.annot_index().chain_ranks
+            
+            if min_mass is not None:
+                
+                top = top[self.mzs[top] >= min_mass]
+            
+            result = bool(np.intersect1d(ranks, top[:head]).size)
+            
+        else:
+            
+            result = bool(ranks.size and ranks[0] < head)
         
         if self.verbose:
             
@@ -2336,18 +2836,16 @@ class Scan(ScanBase):
 
         """
         
-        for i in xrange(len(self)):
+        ranks = self.annot_index(adduct).ranks_matching(
+            frag_type = frag_type,
+            chain_type = chain_type,
+            c = c,
+            u = u,
+        )
+        
+        if ranks.size:
             
-            if self.chain_fragment_type_is(
-                i,
-                frag_type = frag_type,
-                chain_type = chain_type,
-                c = c,
-                u = u,
-                adduct = adduct,
-            ):
-                
-                return i
+            return int(ranks[0])
     
     def chain_percent_of_most_abundant(
             self,
@@ -2387,22 +2885,20 @@ class Scan(ScanBase):
 
         """
         
-        result = any((
-            self.chain_among_most_abundant(
-                i,
-                frag_type = frag_type,
-                chain_type = chain_type,
-                c = c,
-                u = u,
-                adduct = adduct,
-            )
-            for i in
-            itertools.takewhile(
-                lambda i:
-                    self.inorm[i] > percent / 100.0,
-                xrange(len(self.mzs))
-            )
-        ))
+        # number of fragments above the threshold
+        above = int(np.sum(self.inorm > percent / 100.0))
+        
+        # this has been checked the same way as looking among the top
+        # 0, 1, ..., `above - 1` fragments, i.e. the last one above the
+        # threshold is not considered
+        result = above > 1 and self.chain_among_most_abundant(
+            above - 1,
+            frag_type = frag_type,
+            chain_type = chain_type,
+            c = c,
+            u = u,
+            adduct = adduct,
+        )
         
         return result
     
@@ -2590,32 +3086,30 @@ class Scan(ScanBase):
             # can be used
             return
         
-        # iterate all combinations
-        for frag_comb in itertools.product(
-            *(
+        # iterate all combinations matching the carbon count
+        # and unsaturation
+        for frag_comb in fragment_combinations(
+            [
                 # making a sorted list of lists from the dict
                 i[1] for i in
                 sorted(frags_for_position.items(), key = lambda i: i[0])
-            )
+            ],
+            chainsum.c,
+            chainsum.u,
         ):
             
             if (
-                sum(frag.c for frag in frag_comb) == chainsum.c and
-                sum(frag.u for frag in frag_comb) == chainsum.u
+                # bypass intensity check
+                no_intensity_check or
+                self._intensity_check(
+                    frag_comb, chainsum, expected_intensities
+                )
             ):
                 
-                if (
-                    # bypass intensity check
-                    no_intensity_check or
-                    self._intensity_check(
-                        frag_comb, chainsum, expected_intensities
-                    )
-                ):
-                    
-                    # now all conditions satisfied:
-                    yield self._chains_frag_comb(
-                        frag_comb, chainsum, details = fragment_details
-                    )
+                # now all conditions satisfied:
+                yield self._chains_frag_comb(
+                    frag_comb, chainsum, details = fragment_details
+                )
     
     def frags_for_positions(
             self,
@@ -2732,7 +3226,7 @@ class Scan(ScanBase):
 
         """
         
-        logbase = settings.get('chain_fragment_instensity_ratios_logbase')
+        logbase = settings.frozen('chain_fragment_instensity_ratios_logbase')
         
         if len(intensities) == 1:
             
@@ -3044,7 +3538,7 @@ class Scan(ScanBase):
         
         return chainsum.c - c, chainsum.u - u
     
-    def iterrecords(self, adducts = None):
+    def iterrecords(self, adducts = None, ms1_records = None):
         """Iterates MS1 records.
         Yields tuple of adduct type and record.
 
@@ -3052,13 +3546,20 @@ class Scan(ScanBase):
         ----------
         adducts :
              (Default value = None)
+        ms1_records :
+            Records in the format of the ``ms1_records`` attribute,
+            by default the records of this scan.
 
         Returns
         -------
 
         """
         
-        for add, recs in iteritems(self.ms1_records):
+        ms1_records = (
+            self.ms1_records if ms1_records is None else ms1_records
+        )
+        
+        for add, recs in iteritems(ms1_records):
             
             if adducts is None or add in adducts:
                 
@@ -3142,6 +3643,7 @@ class Scan(ScanBase):
             
             return None
     
+    @timing.timed('ms2.scan.identify')
     def identify(self, adducts = None):
         """
 
@@ -3155,33 +3657,7 @@ class Scan(ScanBase):
 
         """
         
-        result = {}
-        
-        for add, rec, precursor_details in self.iterrecords(adducts):
-            
-            if rec.hg is None:
-                
-                continue
-            
-            rec_str = rec.summary_str()
-            
-            if rec_str not in result and rec.hg in idmethods[self.ionmode]:
-                
-                method = idmethods[self.ionmode][rec.hg]
-                
-                adduct = None if add in {'[M+H]+', '[M-H]-'} else add
-                
-                result[rec_str] = tuple(
-                    method(
-                        record = rec,
-                        scan = self,
-                        adduct = adduct,
-                        adduct_str = add,
-                        precursor_details = precursor_details,
-                    ).identify()
-                )
-        
-        return result
+        return identify_batch([self], adducts = adducts)[0]
     
     #
     # Sphingolipids
@@ -3448,7 +3924,7 @@ class Scan(ScanBase):
             
             return
         
-        ad2ex = settings.get('ad2ex')[1][self.ionmode][adduct]
+        ad2ex = settings.frozen('ad2ex')[1][self.ionmode][adduct]
         ex2ad = 'remove_h' if self.ionmode == 'neg' else 'add_h'
         
         fake_precursor = (
@@ -3463,7 +3939,7 @@ class Scan(ScanBase):
             )()
         )
         
-        annot = self.get_annot(fake_precursor)
+        annot = self.get_annot_shifted(fake_precursor)
         
         chain_list = self._build_chain_list(annot = annot)
         
@@ -3488,6 +3964,32 @@ class Scan(ScanBase):
         
         return self.adduct_data('annot', adduct = adduct)
     
+    def annot_index(self, adduct = None):
+        """Returns the inverted index of the fragment annotations for a
+        certain adduct (``AnnotationIndex``). The index is built at the
+        first call and rebuilt only if the annotations changed.
+        
+        Parameters
+        ----------
+        adduct :
+             (Default value = None)
+        
+        Returns
+        -------
+        
+        """
+        
+        annot = self.adduct_annot(adduct)
+        data = self.__dict__ if adduct is None else self.adducts[adduct]
+        index = data.get('_annot_index')
+        
+        if index is None or index.annot is not annot:
+            
+            index = AnnotationIndex(annot, self.irank)
+            data['_annot_index'] = index
+        
+        return index
+    
     def adduct_chain_list(self, adduct = None):
         """Gets the chain list for a certain adduct.
 
@@ -3624,6 +4126,7 @@ class AbstractMS2Identifier(object):
         
         self.scores = {}
     
+    @timing.timed('ms2.identifier', per_class = True)
     def identify(self):
         """ """
         
@@ -6829,487 +7332,574 @@ idmethods = {
 }
 
 
-class MS2Feature(object):
-    
-    
-    scan_methods = {
-        'mgf':  'mgf_iterscans',
-        'mzml': 'mzml_iterscans',
-    }
-    
-    def __init__(
-            self,
-            mz,
-            ionmode,
-            resources,
-            ms1_records = None,
-            rt = None,
-            rt_range = None,
-            rt_range_width = .5,
-            check_rt = True,
-            add_precursor_details = False,
-        ):
-        """
-        Collects the MS2 scans from the provided resources for a single
-        feature. Calls identification methods on all scans collected.
-        
-        mz : float
-            m/z value of the precursor ion.
-        ionmode : str
-            Ion mode of the experiment. Either ``pos`` or ``neg``.
-        resources : dict
-            ``dict`` of MS2 scan resources. These are either ``mgf.MgfReader``
-            objects or paths to MGF files. Later more resource types
-            will be available, for example MzML format. Keys of the ``dict``
-            are used as sample labels. Thes can be strings or tuples.
-        ms1_records : dict
-            A data structure resulted by ``moldb.adduct_lookup``. If ``None``
-            the lookup will be done here.
-        rt : float
-            Retention time of the feature.
-        rt_range : tuple
-            Tuple of 2 floats, minimum and maximum retention time of the
-            feature. If ``rt`` not provided the mean of this range will
-            be used as ``rt``.
-        rt_range_width : float
-            If no ``rt_range`` but ``rt`` provided ``rt_range`` will be set
-            as ``rt +/- rt_range_width``.
-        check_rt : bool
-            Check if the retention time of the scan is enough close to the
-            precursor's RT. If ``False``, scans will be matched only by the
-            m/z value of the precursor and scans with any large RT difference
-            will be analysed.
-        """
-        
-        self.mz = mz
-        self.ionmode = ionmode
-        self.ms1_records = ms1_records or moldb.adduct_lookup(mz, ionmode)
-        self.add_precursor_details = add_precursor_details
-        self.resources = resources
-        self.rt = rt
-        self.rt_range = rt_range
-        self.rt_range_width = rt_range_width
-        self.rt_range = rt_range
-        self.check_rt = check_rt
-        
-        self._set_rt()
-        self._set_rt_range()
-    
-    
-    def reload(self):
-        
-        modname = self.__class__.__module__
-        mod = __import__(modname, fromlist = [modname.split('.')[0]])
-        imp.reload(mod)
-        new = getattr(mod, self.__class__.__name__)
-        setattr(self, '__class__', new)
-    
+@timing.timed('ms2.identify_batch')
+def identify_batch(scans, ms1_records = None, adducts = None):
+    """
+    Identifies a number of scans against their MS1 database records in
+    one call.
     
-    def main(self):
-        
-        self.ms1_lookup()
-        self.build_scans()
-        self.identify()
+    First the records of all scans are collected, then the work is
+    grouped by ion mode and identifier class and all scans are examined
+    for one class before moving to the next one. The string
+    representations of the records and the chain positions matching the
+    fragment constraints (see ``chain_layout``) are calculated only once
+    and shared across the scans.
     
+    Parameters
+    ----------
+    scans : list
+        ``Scan`` objects.
+    ms1_records : dict,list
+        MS1 records in the format of ``Scan.ms1_records``, either one
+        dict used for all scans or a list with one dict for each scan.
+        By default the own records of each scan are used.
+    adducts : set
+        Consider only these adducts. By default all adducts.
     
-    def _set_rt(self):
-        
-        self.rt = (
-            self.rt
-                if self.rt else
-            sum(self.rt_range) / 2.
-                if self.rt_range is not None else
-            None
-        )
+    Returns
+    -------
+    List of dicts with one element for each scan, the same as
+    ``Scan.identify`` returns.
+    """
     
+    scans = list(scans)
     
-    def _set_rt_range(self):
+    if ms1_records is None or isinstance(ms1_records, dict):
         
-        self.rt_range = (
-            self.rt_range
-                if self.rt_range is not None else
-            (self.rt - self.rt_range_width, self.rt + self.rt_range_width)
-                if self.rt else
-            None
-        )
+        ms1_records = [ms1_records] * len(scans)
     
+    result = [{} for _ in scans]
+    # identification jobs by ion mode and identifier class
+    jobs = collections.OrderedDict()
+    # the same record is often found for more scans
+    rec_strs = {}
     
-    def iterresources(self, only_samples = None):
-        """
-        Iterates the MS2 resources for the feature.
-        Yields tuples of resource, type of the resource and the ID of
-        the sample it belongs to.
+    for i, (scan, records) in enumerate(zip(scans, ms1_records)):
         
-        only_samples : set
-            Set of sample IDs. Iterate over resources only for these samples.
-            If None iterates resources from all samples.
-        """
-        
-        for sample_id, resources in iteritems(self.resources):
+        for add, rec, precursor_details in scan.iterrecords(
+            adducts,
+            ms1_records = records,
+        ):
             
-            if only_samples and sample_id not in only_samples:
+            if rec.hg is None:
                 
                 continue
             
-            if not isinstance(resources, (list, tuple, set)):
+            if id(rec) not in rec_strs:
                 
-                resources = [resources]
+                rec_strs[id(rec)] = rec.summary_str()
             
-            for resource in resources:
-                
-                res_type = self.guess_resouce_type(resource)
+            rec_str = rec_strs[id(rec)]
+            
+            if (
+                rec_str not in result[i] and
+                rec.hg in idmethods[scan.ionmode]
+            ):
                 
-                if res_type not in self.scan_methods:
-                    
-                    raise ValueError(
-                        'Unknown MS2 resource type: %s' % str(resource)
-                    )
+                method = idmethods[scan.ionmode][rec.hg]
+                # reserving the place of the record in the result
+                result[i][rec_str] = None
                 
-                yield resource, res_type, sample_id
-    
+                jobs.setdefault((scan.ionmode, method), []).append(
+                    (i, rec_str, add, rec, precursor_details)
+                )
     
-    def iterscans(self):
+    for (ionmode, method), method_jobs in iteritems(jobs):
         
-        for resource, res_type, sample_id in self.iterresources():
+        for i, rec_str, add, rec, precursor_details in method_jobs:
             
-            scan_method = getattr(self, self.scan_methods[res_type])
+            adduct = None if add in {'[M+H]+', '[M-H]-'} else add
             
-            for scan in scan_method(resource, sample_id):
-                
-                yield scan
-    
+            result[i][rec_str] = tuple(
+                method(
+                    record = rec,
+                    scan = scans[i],
+                    adduct = adduct,
+                    adduct_str = add,
+                    precursor_details = precursor_details,
+                ).identify()
+            )
     
-    def get_mgf(self, mgf_resource):
-        """
+    return result
 
-        Parameters
-        ----------
-        mgf_resource :
-
-        Returns
-        -------
 
-        """
-        
-        if isinstance(mgf_resource, basestring):
-            
-            mgffile = mgf.MgfReader(mgf_resource, charge = None)
-            
-        elif isinstance(mgf_resource, mgf.MgfReader):
-            
-            mgffile = mgf_resource
-            
-        else:
-            
-            raise ValueError(
-                'Mgf files should be lipyd.mgf.MgfReader '
-                'instances or file names.'
-            )
-        
-        return mgffile
+def spectrum_vectors(scans, bin_width = None):
+    """
+    Creates binned sparse vectors from MS2 spectra for calculating their
+    similarity. The square roots of the intensities are summed in each
+    m/z bin and the vectors are normalized to unit length.
     
+    Parameters
+    ----------
+    scans : list
+        ``Scan`` objects.
+    bin_width : float
+        Width of the m/z bins. By default the value of the
+        ``ms2_cluster_bin_width`` setting.
     
-    def mgf_iterscanidx(self, mgf_resource):
-        """
-        Selects scans from each resurce and yields tuples of scan ID and
-        RT difference.
-        """
-        
-        mgffile = self.get_mgf(mgf_resource)
-        idx, rtdiff = mgffile.lookup(self.mz, rt = self.rt)
-        
-        for i, rtd in zip(idx, rtdiff):
-            
-            if self.check_rt:
-                
-                scan_rt = self.rt + rtd
-                
-                if scan_rt < self.rt_range[0] or scan_rt > self.rt_range[1]:
-                    
-                    continue
-            
-            yield i, rtd
+    Returns
+    -------
+    ``scipy.sparse.csr_matrix`` with one row for each scan.
+    """
     
+    bin_width = bin_width or settings.frozen('ms2_cluster_bin_width')
+    
+    rows = np.concatenate(
+        [np.full(len(sc.mzs), i) for i, sc in enumerate(scans)] +
+        [np.array([], dtype = np.int64)]
+    )
+    bins = np.floor(
+        np.concatenate([sc.mzs for sc in scans] + [np.array([])]) /
+        bin_width
+    ).astype(np.int64)
+    values = np.sqrt(np.concatenate(
+        [sc.intensities for sc in scans] + [np.array([])]
+    ))
+    
+    bins, cols = np.unique(bins, return_inverse = True)
+    
+    vectors = scipy.sparse.csr_matrix(
+        (values, (rows, cols)),
+        shape = (len(scans), len(bins)),
+    )
+    norms = np.sqrt(np.asarray(vectors.multiply(vectors).sum(axis = 1)))
+    norms[norms == 0] = 1.0
+    
+    return scipy.sparse.csr_matrix(vectors.multiply(1.0 / norms))
+
+
+@timing.timed('ms2.cluster_scans')
+def cluster_scans(
+        scans,
+        min_cosine = None,
+        rt_tolerance = None,
+        precursor_tolerance = None,
+        bin_width = None,
+    ):
+    """
+    Groups the near identical MS2 spectra, e.g. the ones of the same
+    precursor in adjacent fractions. The scans are processed in their
+    order and each scan not yet assigned becomes the representative of
+    the unassigned scans similar to it. Scans are similar if they have
+    the same ion mode, their precursor m/z and retention time are within
+    the tolerances and the cosine similarity of their binned spectra
+    (see ``spectrum_vectors``) is at least ``min_cosine``. Missing
+    retention times are considered to be within the tolerance.
     
-    def iterscanidx_all(self):
-        
-        for resource, res_type, sample_id in self.iterresources():
-            
-            itermethod = getattr(self, '%s_iterscanidx' % res_type)
-            
-            for i, rtd in itermethod(resource):
-                
-                yield resource, i, rtd
+    Parameters
+    ----------
+    scans : list
+        ``Scan`` objects.
+    min_cosine : float
+        Minimum cosine similarity. By default the value of the
+        ``ms2_cluster_min_cosine`` setting.
+    rt_tolerance : float
+        Highest retention time difference. By default the value of the
+        ``ms2_cluster_rt_tolerance`` setting.
+    precursor_tolerance : float
+        Tolerance of the precursor m/z in ppm. By default the value of
+        the ``precursor_match_tolerance`` setting.
+    bin_width : float
+        Width of the m/z bins.
     
+    Returns
+    -------
+    Array with the index of the representative scan for each scan,
+    for the representatives their own index.
+    """
     
-    def mgf_get_scans_summary(self, mgf_resource):
-        """
-        For a single MGF resource finds scans matching this feature and
-        returns arrays of scan indices and RT differences.
-        """
-        
-        try:
-            
-            idx, rtdiff = zip(*list(self.mgf_iterscanidx(mgf_resource)))
-            
-        except ValueError:
-            
-            idx, rtdiff = [], []
-        
-        return np.array(idx), np.array(rtdiff)
+    min_cosine = min_cosine or settings.frozen('ms2_cluster_min_cosine')
+    rt_tolerance = (
+        rt_tolerance or settings.frozen('ms2_cluster_rt_tolerance')
+    )
+    precursor_tolerance = (
+        precursor_tolerance or settings.frozen('precursor_match_tolerance')
+    )
     
+    scans = list(scans)
+    representatives = np.arange(len(scans))
     
-    def mgf_iter_scans_summaries(self):
-        """
-        Selects scans from each resurce and yields tuples of resource,
-        array of scan indices and array of RT differences for each resource.
-        """
+    if len(scans) < 2:
         
-        for resource, res_type, sample_id in self.iterresources():
-            
-            idx, rtdiff = self.mgf_get_scans_summary(resource)
-            
-            yield resource, idx, rtdiff
+        return representatives
     
+    vectors = spectrum_vectors(scans, bin_width = bin_width)
+    cosine = (vectors * vectors.T).toarray()
     
-    def mgf_iterscans(self, mgf_resource, sample_id = None):
-        """
-        Iterates over scans from an MGF resource belonging to this feature.
-        """
+    precursors = np.array(
+        [np.nan if sc.precursor is None else sc.precursor for sc in scans],
+        dtype = np.float64,
+    )
+    rts = np.array(
+        [
+            np.nan if getattr(sc, 'rt', None) is None else sc.rt
+            for sc in scans
+        ],
+        dtype = np.float64,
+    )
+    ionmodes = np.array([sc.ionmode for sc in scans])
+    
+    with np.errstate(invalid = 'ignore'):
+        
+        similar = np.logical_and.reduce((
+            cosine >= min_cosine,
+            ionmodes[:,None] == ionmodes[None,:],
+            np.logical_or(
+                np.abs(precursors[:,None] - precursors[None,:]) <=
+                lookup.ppm_tolerance(precursor_tolerance, precursors[:,None]),
+                np.logical_and(
+                    np.isnan(precursors[:,None]),
+                    np.isnan(precursors[None,:]),
+                ),
+            ),
+            np.logical_not(
+                np.abs(rts[:,None] - rts[None,:]) > rt_tolerance
+            ),
+        ))
+    
+    assigned = np.zeros(len(scans), dtype = bool)
+    
+    for i in xrange(len(scans)):
+        
+        if assigned[i]:
+            
+            continue
+        
+        members = np.logical_and(similar[i], np.logical_not(assigned))
+        members[i] = True
+        representatives[members] = i
+        assigned |= members
+    
+    return representatives
+
+
+#: Settings affecting the results of the MS2 identification
+_identification_settings = (
+    'ms1_tolerance',
+    'ms2_tolerance',
+    'precursor_match_tolerance',
+    'ms2_rt_within_range',
+    'deltart_threshold',
+    'ms2_scan_chain_details',
+    'chain_fragment_instensity_ratios_logbase',
+    'even_chain_fragment_intensity_ratios_gl_gpl',
+    'even_chain_fragment_intensity_ratios_sl',
+    'ms2_min_intensity',
+    'ms2_min_relative_intensity',
+    'ms2_top_n',
+    'ms2_deisotope',
+    'ms2_deduplicate_tolerance',
+    'ms2_cluster_min_cosine',
+    'ms2_cluster_rt_tolerance',
+    'ms2_cluster_bin_width',
+)
+
+
+#: Attributes of ``mgf.MgfReader`` objects affecting the identification
+_reader_attrs = ('charge', 'drift', 'tolerance', 'rt_tolerance')
+
+
+def resources_signature(resources):
+    """
+    Describes the MS2 resources by the signatures of their files (see
+    ``checkpoint.file_signature``) and the parameters of their readers,
+    the values of the settings affecting the identification and the
+    version of this module. Used for
+    checkpointing, if the signature is the same, the results of the
+    identification are the same.
+    
+    resources : dict
+        ``dict`` of MS2 scan resources in the same format as for
+        ``MS2Feature``.
+    """
+    
+    files = []
+    
+    for sample_id, sample_resources in iteritems(resources):
         
-        mgffile = self.get_mgf(mgf_resource)
+        if not isinstance(sample_resources, (list, tuple, set)):
+            
+            sample_resources = [sample_resources]
         
-        for i, rtd in self.mgf_iterscanidx(mgf_resource):
+        for resource in sample_resources:
             
-            sc = mgffile.get_scan(i)
+            if isinstance(resource, mgf.MgfReader):
+                
+                fname = resource.fname
+                # e.g. recalibration changes the precursor matching
+                reader_args = tuple(
+                    getattr(resource, attr)
+                    for attr in _reader_attrs
+                )
+                
+            else:
+                
+                fname = resource
+                reader_args = None
             
-            yield self.get_scan(mgffile, i, sample_id = sample_id)
+            files.append((
+                sample_id,
+                checkpointmod.file_signature(fname),
+                reader_args,
+            ))
     
+    return (
+        sorted(files, key = repr),
+        tuple(
+            (param, settings.frozen(param))
+            for param in _identification_settings
+        ),
+        _version.__version__,
+    )
+
+
+@timing.timed('ms2.analyse_features')
+def analyse_features(
+        mzs,
+        ionmode,
+        resources,
+        rts = None,
+        ms1_records = None,
+        check_rt = True,
+        keep_scans = None,
+        checkpoint = None,
+        silent = True,
+    ):
+    """
+    Runs the MS2 identification of many features in the same MS2
+    resources. The scans are assigned to the features in one step by
+    ``mgf.PrecursorIndex.join``.
     
-    def get_scan(self, ms2_resource, i, sample_id = None):
-        """
-        Retrieves a scan by its ID from an MS2 resource.
-        Creates ``Scan`` object.
-        
-        Returns
-        -------
-        ``lipyd.ms2.Scan`` instance.
-        """
-        
-        sc = ms2_resource.get_scan(i)
-        
-        return Scan(
-            mzs = sc[:,0],
-            intensities = sc[:,1],
-            ionmode = self.ionmode,
-            precursor = self.mz,
-            ms1_records = self.ms1_records,
-            add_precursor_details = self.add_precursor_details,
-            scan_id = ms2_resource.mgfindex[i,3],
-            sample_id = sample_id,
-            source = ms2_resource.fname,
-            deltart = ms2_resource.mgfindex[i,2] - self.rt,
-            rt = ms2_resource.mgfindex[i,2],
-        )
+    Parameters
+    ----------
+    mzs : numpy.ndarray
+        m/z values of the features.
+    ionmode : str
+        Ion mode, either ``pos`` or ``neg``.
+    resources : dict
+        ``dict`` of MS2 scan resources in the same format as for
+        ``MS2Feature``.
+    rts : numpy.ndarray
+        Retention times of the features.
+    ms1_records : list
+        Database records for each feature, as ``moldb.adduct_lookup``
+        returns them. Looked up for each feature if not provided.
+    check_rt : bool
+        Use only the scans within the RT range of the features.
+    keep_scans : bool
+        Return ``MS2Feature`` objects with all their scans instead of
+        the compact ``MS2FeatureResult`` objects. By default the value
+        of the ``ms2_keep_scans`` setting.
+    checkpoint : str
+        Path to a checkpoint file. The result of each feature is
+        written into this file as soon as it is ready. If the file
+        exists already, the features with results from the same inputs
+        are not analysed again, hence an interrupted run can be resumed.
+        Resumed features have ``MS2FeatureResult`` objects even if
+        ``keep_scans`` is ``True``. By default the value of the
+        ``ms2_checkpoint`` setting, if ``None`` no checkpoints are written.
+    silent : bool
+        Do not show a progress bar.
+    
+    Returns
+    -------
+    List of ``MS2FeatureResult`` or ``MS2Feature`` objects, one for
+    each feature.
+    """
     
+    result = []
+    rts = [None] * len(mzs) if rts is None else rts
+    ms1_records = [None] * len(mzs) if ms1_records is None else ms1_records
+    keep_scans = (
+        settings.get('ms2_keep_scans')
+            if keep_scans is None else
+        keep_scans
+    )
+    # one index of the scans in all resources for all features
+    index = precursor_index(resources)
+    # assigning the scans to all features in one step
+    matches = index.join(mzs, rts)
+    checkpoint = checkpoint or settings.get('ms2_checkpoint')
     
-    def closest_scan(self, only_samples = None):
-        """
-        Retrieves the scan with the lowest retention time difference.
+    if checkpoint:
         
-        only_samples : set
-            Set of sample IDs. Retrieve the closest scan only from these
-            samples. If None looks up scans from all samples.
-        """
+        store = checkpointmod.CheckpointStore(checkpoint)
+        signature = resources_signature(resources)
+        resumed = 0
+    
+    if not silent:
         
-        closest_rtdiff  = np.inf
-        closest_mgffile = None
-        closest_i       = np.nan
+        prg = progress.Progress(len(mzs), 'Analysing MS2 spectra', 1)
+    
+    try:
         
-        for resource, res_type, sample_id in self.iterresources(
-            only_samples = only_samples
-        ):
+        for i in xrange(len(mzs)):
             
-            idx, rtdiff = (
-                getattr(self, '%s_get_scans_summary' % res_type)(resource)
+            if not silent:
+                
+                prg.step()
+            
+            # MS2 identifications:
+            ms2_fe = MS2Feature(
+                mz = mzs[i],
+                ionmode = ionmode,
+                resources = resources,
+                rt = rts[i],
+                ms1_records = ms1_records[i],
+                check_rt = check_rt,
+                precursor_index = index,
+                precursor_matches = matches.of_feature(i),
             )
             
-            if not len(idx):
+            if checkpoint:
                 
-                continue
+                input_digest = ms2_fe.input_digest(signature)
+                fe_result = store.get(i, input_digest)
+                
+                if fe_result is not None:
+                    
+                    result.append(fe_result)
+                    resumed += 1
+                    continue
+            
+            ms2_fe.main()
+            fe_result = ms2_fe.result()
             
-            if np.min(np.abs(rtdiff)) < closest_rtdiff:
+            if checkpoint:
                 
-                closest_rtdiff  = np.min(np.abs(rtdiff))
-                closest_i       = idx[np.argmin(np.abs(rtdiff))]
-                closest_mgffile = resource
+                store.append(i, input_digest, fe_result)
+            
+            result.append(ms2_fe if keep_scans else fe_result)
         
-        return (
-            None
-                if closest_mgffile is None else
-            self.get_scan(
-                self.get_mgf(closest_mgffile),
-                closest_i,
-                sample_id = sample_id
-            )
+    finally:
+        
+        if checkpoint:
+            
+            store.close()
+    
+    if not silent:
+        
+        prg.terminate()
+    
+    if checkpoint:
+        
+        store._log(
+            'Results of %u features taken from '
+            'checkpoint file `%s`.' % (resumed, checkpoint)
         )
     
+    return result
+
+
+def precursor_index(resources):
+    """
+    Creates a merged index of the precursors of the MS2 scans in all
+    resources, used by ``MS2Feature`` to retrieve the scans of features.
+    Building this index once and passing it to each feature saves the
+    lookup of the features in the resources one by one.
+    
+    resources : dict
+        ``dict`` of MS2 scan resources in the same format as for
+        ``MS2Feature``.
     
-    def has_scan_within_rt_range(self):
-        """
-        Tells if any MS2 scan is available within the RT range according to
-        the current settings.
-        """
+    Returns
+    -------
+    ``mgf.PrecursorIndex`` object, its labels are the sample IDs.
+    """
+    
+    readers = []
+    labels = []
+    
+    for sample_id, sample_resources in iteritems(resources):
         
-        for resource, idx, rtdiff in self.iterscanidx_all():
+        if not isinstance(sample_resources, (list, tuple, set)):
             
-            scans_rts = self.rt - np.abs(rtdiff)
+            sample_resources = [sample_resources]
+        
+        for resource in sample_resources:
             
-            if np.any(
-                np.logical_and(
-                    scans_rts > self.rt_range[0],
-                    scans_rts < self.rt_range[1],
-                )
-            ):
+            if MS2Feature.guess_resouce_type(resource) != 'mgf':
                 
-                return True
-        
-        return False
+                raise ValueError(
+                    'Unknown MS2 resource type: %s' % str(resource)
+                )
+            
+            readers.append(
+                mgf.MgfReader(resource, charge = None)
+                    if isinstance(resource, basestring) else
+                resource
+            )
+            labels.append(sample_id)
+    
+    return mgf.PrecursorIndex(readers, labels = labels)
+
+
+class MS2FeatureBase(object):
+    """
+    Methods for grouping, sorting and formatting the MS2 identities of a
+    feature. The ``identities`` attribute is a list of dicts, one for
+    each scan, as returned by ``Scan.identify``.
+    """
     
     
-    def mzml_iterscans(self, mzml_resource, sample_id = None):
+    @staticmethod
+    def identities_sort(ids):
         """
+        Sorts identities by score, deltart, and rank of chain fragments.
 
         Parameters
         ----------
-        mzml_resource :
-            
-        sample_id :
-             (Default value = None)
-
+        ids : list
+            List of ``MS2Identity`` objects.
+        
         Returns
         -------
-
+        Sorted list of ``MS2Identity`` objects.
         """
         
-        raise NotImplementedError
+        return sorted(
+            ids,
+            key = lambda i:
+                (
+                    100 - i.score_pct,
+                    # if we don't have scan details don't consider
+                    abs(i.scan_details.deltart) if i.scan_details else 0,
+                    # if we don't have chain details don't consider
+                    # otherwise sort by lowest rank among all chain fragments
+                    (
+                        min(
+                            (
+                                # removing None's
+                                r for r in i.chain_details.rank
+                                if r is not None
+                            ),
+                            default = 9999 # if all chain fragments missing
+                                           # goes to the end
+                        )
+                            if i.chain_details else
+                        9999 # ones with no chain details at all go to the end
+                    )
+                )
+        )
     
     
-    @staticmethod
-    def guess_resouce_type(res):
+    def identities_group_by(self, by = 'subspecies'):
         """
 
         Parameters
         ----------
-        res :
-            
+        by :
+             (Default value = 'subspecies')
 
         Returns
         -------
 
+        
         """
         
-        if isinstance(res, basestring) and os.path.exists(res):
-            
-            if res[-3:].lower() == 'mgf':
-                
-                return 'mgf'
-            
-        elif isinstance(res, mgf.MgfReader):
-            
-            return 'mgf'
-    
-    
-    def build_scans(self):
-        """ """
-        
-        self.scans = np.array(list(self.iterscans()))
-        self.deltart = np.array([sc.rt - self.rt for sc in self.scans])
-        
-        rtsort = [
-            it[0]
-            for it in sorted(
-                (it for it in enumerate(self.deltart)),
-                key = lambda it: abs(it[1])
-            )
-        ]
-        
-        self.scans = self.scans[rtsort]
-        self.deltart = self.deltart[rtsort]
-    
-    
-    def identify(self):
-        """ """
-        
-        self.identities = []
-        
-        for scan in self.scans:
-            
-            identity = scan.identify()
-            
-            if identity:
-                
-                self.identities.append(identity)
-    
-    
-    @staticmethod
-    def identities_sort(ids):
-        """
-        Sorts identities by score, deltart, and rank of chain fragments.
-
-        Parameters
-        ----------
-        ids : list
-            List of ``MS2Identity`` objects.
-        
-        Returns
-        -------
-        Sorted list of ``MS2Identity`` objects.
-        """
-        
-        return sorted(
-            ids,
-            key = lambda i:
-                (
-                    100 - i.score_pct,
-                    # if we don't have scan details don't consider
-                    abs(i.scan_details.deltart) if i.scan_details else 0,
-                    # if we don't have chain details don't consider
-                    # otherwise sort by lowest rank among all chain fragments
-                    (
-                        min(
-                            (
-                                # removing None's
-                                r for r in i.chain_details.rank
-                                if r is not None
-                            ),
-                            default = 9999 # if all chain fragments missing
-                                           # goes to the end
-                        )
-                            if i.chain_details else
-                        9999 # ones with no chain details at all go to the end
-                    )
-                )
-        )
-    
-    
-    def identities_group_by(self, by = 'subspecies'):
-        """
-
-        Parameters
-        ----------
-        by :
-             (Default value = 'subspecies')
-
-        Returns
-        -------
-
-        
-        """
-        
-        identities = {}
-        
-        for scan in self.identities:
+        identities = {}
+        
+        for scan in self.identities:
             
             for sum_str, varieties in iteritems(scan):
                 
@@ -7574,7 +8164,7 @@ class MS2Feature(object):
         
         identities = {}
         
-        for i, scan_i in enumerate(self.identities):
+        for scan_i in self.identities:
             
             for sum_str, varieties in iteritems(scan_i):
                 
@@ -7598,15 +8188,15 @@ class MS2Feature(object):
                     
                     if drt:
                         
-                        key.append(self.deltart[i])
+                        key.append(var.scan_details.deltart)
                     
                     if sample_ids:
                         
-                        key.append(self.scans[i].sample_id)
+                        key.append(var.scan_details.sample_id)
                     
                     if scan_ids:
                         
-                        key.append(self.scans[i].scan_id)
+                        key.append(var.scan_details.scan_id)
                     
                     key = tuple(key)
                     
@@ -7617,11 +8207,721 @@ class MS2Feature(object):
                     identities[key].append(var)
         
         return identities
+
+
+class MS2Feature(MS2FeatureBase):
     
     
-    def ms1_lookup(self):
-        """ """
+    scan_methods = {
+        'mgf':  'mgf_iterscans',
+        'mzml': 'mzml_iterscans',
+    }
+    
+    def __init__(
+            self,
+            mz,
+            ionmode,
+            resources,
+            ms1_records = None,
+            rt = None,
+            rt_range = None,
+            rt_range_width = .5,
+            check_rt = True,
+            add_precursor_details = False,
+            precursor_index = None,
+            precursor_matches = None,
+            cluster_duplicates = None,
+        ):
+        """
+        Collects the MS2 scans from the provided resources for a single
+        feature. Calls identification methods on all scans collected.
         
-        if self.ms1_records is None:
+        mz : float
+            m/z value of the precursor ion.
+        ionmode : str
+            Ion mode of the experiment. Either ``pos`` or ``neg``.
+        resources : dict
+            ``dict`` of MS2 scan resources. These are either ``mgf.MgfReader``
+            objects or paths to MGF files. Later more resource types
+            will be available, for example MzML format. Keys of the ``dict``
+            are used as sample labels. Thes can be strings or tuples.
+        ms1_records : dict
+            A data structure resulted by ``moldb.adduct_lookup``. If ``None``
+            the lookup will be done here.
+        rt : float
+            Retention time of the feature.
+        rt_range : tuple
+            Tuple of 2 floats, minimum and maximum retention time of the
+            feature. If ``rt`` not provided the mean of this range will
+            be used as ``rt``.
+        rt_range_width : float
+            If no ``rt_range`` but ``rt`` provided ``rt_range`` will be set
+            as ``rt +/- rt_range_width``.
+        check_rt : bool
+            Check if the retention time of the scan is enough close to the
+            precursor's RT. If ``False``, scans will be matched only by the
+            m/z value of the precursor and scans with any large RT difference
+            will be analysed.
+        precursor_index : mgf.PrecursorIndex
+            Index of the MS2 scans in all ``resources``, as created by
+            ``precursor_index``. Pass the same index to all features of
+            the same resources to avoid building it for each feature.
+        precursor_matches : tuple
+            The scans matching this feature in ``precursor_index``, as
+            returned by ``PrecursorIndex.lookup``. Features of one sample
+            can be looked up at once by ``PrecursorIndex.join``. If
+            ``None`` the feature will be looked up in the index.
+        cluster_duplicates : bool
+            Identify only one representative of the similar scans. By
+            default the value of the ``ms2_cluster_scans`` setting.
+        """
+        
+        self.mz = mz
+        self.ionmode = ionmode
+        self.ms1_records = ms1_records or moldb.adduct_lookup(mz, ionmode)
+        self.add_precursor_details = add_precursor_details
+        self.resources = resources
+        self.rt = rt
+        self.rt_range = rt_range
+        self.rt_range_width = rt_range_width
+        self.rt_range = rt_range
+        self.check_rt = check_rt
+        self._precursor_index = precursor_index
+        self._precursor_matches = precursor_matches
+        self._scan_matches = None
+        self.cluster_duplicates = (
+            settings.frozen('ms2_cluster_scans')
+                if cluster_duplicates is None else
+            cluster_duplicates
+        )
+        
+        self._set_rt()
+        self._set_rt_range()
+    
+    
+    def reload(self):
+        
+        modname = self.__class__.__module__
+        mod = __import__(modname, fromlist = [modname.split('.')[0]])
+        imp.reload(mod)
+        new = getattr(mod, self.__class__.__name__)
+        setattr(self, '__class__', new)
+    
+    
+    @timing.timed('ms2.feature.main')
+    def main(self):
+        
+        self.ms1_lookup()
+        self.build_scans()
+        self.identify()
+    
+    
+    def _set_rt(self):
+        
+        self.rt = (
+            self.rt
+                if self.rt else
+            sum(self.rt_range) / 2.
+                if self.rt_range is not None else
+            None
+        )
+    
+    
+    def _set_rt_range(self):
+        
+        self.rt_range = (
+            self.rt_range
+                if self.rt_range is not None else
+            (self.rt - self.rt_range_width, self.rt + self.rt_range_width)
+                if self.rt else
+            None
+        )
+    
+    
+    def iterresources(self, only_samples = None):
+        """
+        Iterates the MS2 resources for the feature.
+        Yields tuples of resource, type of the resource and the ID of
+        the sample it belongs to.
+        
+        only_samples : set
+            Set of sample IDs. Iterate over resources only for these samples.
+            If None iterates resources from all samples.
+        """
+        
+        for sample_id, resources in iteritems(self.resources):
             
-            self.ms1_records = moldb.adduct_lookup(self.mz)
+            if only_samples and sample_id not in only_samples:
+                
+                continue
+            
+            if not isinstance(resources, (list, tuple, set)):
+                
+                resources = [resources]
+            
+            for resource in resources:
+                
+                res_type = self.guess_resouce_type(resource)
+                
+                if res_type not in self.scan_methods:
+                    
+                    raise ValueError(
+                        'Unknown MS2 resource type: %s' % str(resource)
+                    )
+                
+                yield resource, res_type, sample_id
+    
+    
+    def get_precursor_index(self):
+        """
+        Returns the index of the MS2 scans in all resources, builds it
+        if it has not been provided.
+        """
+        
+        if self._precursor_index is None:
+            
+            self._precursor_index = precursor_index(self.resources)
+        
+        return self._precursor_index
+    
+    
+    def scan_matches(self):
+        """
+        Looks up the feature in the precursor index and returns 3 arrays:
+        the index of the MS2 resources, the row numbers of the scans in
+        these resources and the RT differences. If ``check_rt`` is
+        ``True`` only the scans within the RT range of the feature are
+        returned. The result is cached, the lookup done only once.
+        If the matches have been provided at the creation of this object
+        those are used instead of the lookup.
+        """
+        
+        if self._scan_matches is None:
+            
+            files, rows, rtdiff = (
+                self._precursor_matches
+                    if self._precursor_matches is not None else
+                self.get_precursor_index().lookup(self.mz, rt = self.rt)
+            )
+            
+            if self.check_rt and self.rt_range is not None:
+                
+                scan_rt = self.rt + rtdiff
+                # scans without RT are kept
+                within_range = np.logical_not(
+                    np.logical_or(
+                        scan_rt < self.rt_range[0],
+                        scan_rt > self.rt_range[1],
+                    )
+                )
+                files = files[within_range]
+                rows = rows[within_range]
+                rtdiff = rtdiff[within_range]
+            
+            self._scan_matches = files, rows, rtdiff
+        
+        return self._scan_matches
+    
+    
+    def iterscans(self):
+        
+        index = self.get_precursor_index()
+        
+        for ifile, i, rtd in zip(*self.scan_matches()):
+            
+            yield self.get_scan(
+                index.readers[ifile],
+                i,
+                sample_id = index.labels[ifile],
+            )
+    
+    
+    def get_mgf(self, mgf_resource):
+        """
+
+        Parameters
+        ----------
+        mgf_resource :
+
+        Returns
+        -------
+
+        """
+        
+        if isinstance(mgf_resource, basestring):
+            
+            mgffile = mgf.MgfReader(mgf_resource, charge = None)
+            
+        elif isinstance(mgf_resource, mgf.MgfReader):
+            
+            mgffile = mgf_resource
+            
+        else:
+            
+            raise ValueError(
+                'Mgf files should be lipyd.mgf.MgfReader '
+                'instances or file names.'
+            )
+        
+        return mgffile
+    
+    
+    def mgf_iterscanidx(self, mgf_resource):
+        """
+        Selects scans from each resurce and yields tuples of scan ID and
+        RT difference.
+        """
+        
+        mgffile = self.get_mgf(mgf_resource)
+        idx, rtdiff = mgffile.lookup(self.mz, rt = self.rt)
+        
+        for i, rtd in zip(idx, rtdiff):
+            
+            if self.check_rt:
+                
+                scan_rt = self.rt + rtd
+                
+                if scan_rt < self.rt_range[0] or scan_rt > self.rt_range[1]:
+                    
+                    continue
+            
+            yield i, rtd
+    
+    
+    def iterscanidx_all(self):
+        
+        for resource, res_type, sample_id in self.iterresources():
+            
+            itermethod = getattr(self, '%s_iterscanidx' % res_type)
+            
+            for i, rtd in itermethod(resource):
+                
+                yield resource, i, rtd
+    
+    
+    def mgf_get_scans_summary(self, mgf_resource):
+        """
+        For a single MGF resource finds scans matching this feature and
+        returns arrays of scan indices and RT differences.
+        """
+        
+        try:
+            
+            idx, rtdiff = zip(*list(self.mgf_iterscanidx(mgf_resource)))
+            
+        except ValueError:
+            
+            idx, rtdiff = [], []
+        
+        return np.array(idx), np.array(rtdiff)
+    
+    
+    def mgf_iter_scans_summaries(self):
+        """
+        Selects scans from each resurce and yields tuples of resource,
+        array of scan indices and array of RT differences for each resource.
+        """
+        
+        for resource, res_type, sample_id in self.iterresources():
+            
+            idx, rtdiff = self.mgf_get_scans_summary(resource)
+            
+            yield resource, idx, rtdiff
+    
+    
+    def mgf_iterscans(self, mgf_resource, sample_id = None):
+        """
+        Iterates over scans from an MGF resource belonging to this feature.
+        """
+        
+        mgffile = self.get_mgf(mgf_resource)
+        
+        for i, rtd in self.mgf_iterscanidx(mgf_resource):
+            
+            sc = mgffile.get_scan(i)
+            
+            yield self.get_scan(mgffile, i, sample_id = sample_id)
+    
+    
+    def get_scan(self, ms2_resource, i, sample_id = None):
+        """
+        Retrieves a scan by its ID from an MS2 resource.
+        Creates ``Scan`` object.
+        
+        Returns
+        -------
+        ``lipyd.ms2.Scan`` instance.
+        """
+        
+        sc = ms2_resource.get_scan(i)
+        
+        return Scan(
+            mzs = sc[:,0],
+            intensities = sc[:,1],
+            ionmode = self.ionmode,
+            precursor = self.mz,
+            ms1_records = self.ms1_records,
+            add_precursor_details = self.add_precursor_details,
+            scan_id = ms2_resource.mgfindex[i,3],
+            sample_id = sample_id,
+            source = ms2_resource.fname,
+            deltart = ms2_resource.mgfindex[i,2] - self.rt,
+            rt = ms2_resource.mgfindex[i,2],
+        )
+    
+    
+    def closest_scan(self, only_samples = None):
+        """
+        Retrieves the scan with the lowest retention time difference.
+        
+        only_samples : set
+            Set of sample IDs. Retrieve the closest scan only from these
+            samples. If None looks up scans from all samples.
+        """
+        
+        index = self.get_precursor_index()
+        files, rows, rtdiff = self.scan_matches()
+        
+        if only_samples:
+            
+            in_samples = np.array(
+                [index.labels[ifile] in only_samples for ifile in files],
+                dtype = bool,
+            )
+            files = files[in_samples]
+            rows = rows[in_samples]
+            rtdiff = rtdiff[in_samples]
+        
+        if not len(files):
+            
+            return None
+        
+        closest = np.argmin(np.abs(rtdiff))
+        
+        return self.get_scan(
+            index.readers[files[closest]],
+            rows[closest],
+            sample_id = index.labels[files[closest]],
+        )
+    
+    
+    def has_scan_within_rt_range(self):
+        """
+        Tells if any MS2 scan is available within the RT range according to
+        the current settings.
+        """
+        
+        rtdiff = self.scan_matches()[2]
+        scans_rts = self.rt - np.abs(rtdiff)
+        
+        return bool(
+            np.any(
+                np.logical_and(
+                    scans_rts > self.rt_range[0],
+                    scans_rts < self.rt_range[1],
+                )
+            )
+        )
+    
+    
+    def mzml_iterscans(self, mzml_resource, sample_id = None):
+        """
+
+        Parameters
+        ----------
+        mzml_resource :
+            
+        sample_id :
+             (Default value = None)
+
+        Returns
+        -------
+
+        """
+        
+        raise NotImplementedError
+    
+    
+    @staticmethod
+    def guess_resouce_type(res):
+        """
+
+        Parameters
+        ----------
+        res :
+            
+
+        Returns
+        -------
+
+        """
+        
+        if isinstance(res, basestring) and os.path.exists(res):
+            
+            if res[-3:].lower() == 'mgf':
+                
+                return 'mgf'
+            
+        elif isinstance(res, mgf.MgfReader):
+            
+            return 'mgf'
+    
+    
+    def build_scans(self):
+        """ """
+        
+        index = self.get_precursor_index()
+        files, rows = self.scan_matches()[:2]
+        
+        self.scans = np.array(list(self.iterscans()))
+        self.deltart = np.array([sc.rt - self.rt for sc in self.scans])
+        # file names, byte offsets, sample IDs and reader parameters
+        # of the scans; the row numbers depend on the reader parameters
+        # and the scan IDs are not always unique
+        self.scan_refs = np.empty(len(self.scans), dtype = object)
+        self.scan_refs[:] = [
+            (
+                index.readers[ifile].fname,
+                int(index.readers[ifile].mgfindex[i,4]),
+                index.labels[ifile],
+                dict(
+                    (attr, getattr(index.readers[ifile], attr))
+                    for attr in _reader_attrs
+                ),
+            )
+            for ifile, i in zip(files, rows)
+        ]
+        
+        rtsort = [
+            it[0]
+            for it in sorted(
+                (it for it in enumerate(self.deltart)),
+                key = lambda it: abs(it[1])
+            )
+        ]
+        
+        self.scans = self.scans[rtsort]
+        self.deltart = self.deltart[rtsort]
+        self.scan_refs = self.scan_refs[rtsort]
+    
+    
+    def identify(self):
+        """
+        Identifies the scans of the feature. If ``cluster_duplicates``
+        is ``True`` only one representative of the similar scans is
+        identified (see ``cluster_scans``) and its identities are
+        copied to the other scans with their own scan details. The scan
+        details of these scans refer to the representative.
+        """
+        
+        self.identities = []
+        
+        representatives = (
+            cluster_scans(self.scans)
+                if self.cluster_duplicates else
+            np.arange(len(self.scans))
+        )
+        
+        for scan, irep in zip(self.scans, representatives):
+            
+            rep = self.scans[irep]
+            scan.scan_details = scan.scan_details._replace(
+                representative = (
+                    None
+                        if rep is scan else
+                    (rep.sample_id, rep.scan_id)
+                ),
+            )
+        
+        unique_representatives = np.unique(representatives)
+        representative_identities = dict(
+            zip(
+                unique_representatives,
+                identify_batch(
+                    [self.scans[i] for i in unique_representatives]
+                ),
+            )
+        )
+        
+        for i, scan in enumerate(self.scans):
+            
+            irep = representatives[i]
+            identity = representative_identities[irep]
+            
+            if irep != i:
+                
+                identity = dict(
+                    (
+                        rec_str,
+                        tuple(
+                            ident._replace(scan_details = scan.scan_details)
+                            for ident in idents
+                        )
+                    )
+                    for rec_str, idents in iteritems(identity)
+                )
+            
+            if identity:
+                
+                self.identities.append(identity)
+    
+    
+    def ms1_lookup(self):
+        """ """
+        
+        if self.ms1_records is None:
+            
+            self.ms1_records = moldb.adduct_lookup(self.mz)
+    
+    
+    def input_digest(self, signature = None):
+        """
+        Digest of all inputs of the identification of this feature: its
+        m/z, RT, MS1 records, parameters and the MS2 resources. Features
+        with the same digest have the same identification results.
+        
+        signature : tuple
+            The output of ``resources_signature`` for the resources of
+            this feature. Calculated if not provided.
+        """
+        
+        signature = signature or resources_signature(self.resources)
+        
+        records = tuple(
+            (
+                adduct,
+                hashlib.md5(
+                    np.asarray(self.ms1_records[adduct][0]).tobytes()
+                ).hexdigest(),
+            )
+            for adduct in sorted(self.ms1_records or ())
+        )
+        
+        return checkpointmod.digest(
+            float(self.mz),
+            None if self.rt is None else float(self.rt),
+            (
+                None
+                    if self.rt_range is None else
+                tuple(float(rt) for rt in self.rt_range)
+            ),
+            self.ionmode,
+            self.check_rt,
+            self.add_precursor_details,
+            self.cluster_duplicates,
+            records,
+            signature,
+        )
+    
+    
+    def result(self):
+        """
+        Returns the results of the identification without the scans and
+        MS1 records, as an ``MS2FeatureResult`` object.
+        """
+        
+        return MS2FeatureResult(
+            mz = self.mz,
+            ionmode = self.ionmode,
+            rt = self.rt,
+            rt_range = self.rt_range,
+            identities = self.identities,
+            deltart = self.deltart,
+            scan_refs = self.scan_refs,
+            add_precursor_details = self.add_precursor_details,
+        )
+
+
+class MS2FeatureResult(MS2FeatureBase):
+    
+    
+    def __init__(
+            self,
+            mz,
+            ionmode,
+            rt = None,
+            rt_range = None,
+            identities = None,
+            deltart = None,
+            scan_refs = None,
+            add_precursor_details = False,
+        ):
+        """
+        Compact result of the identification of an ``MS2Feature``. Keeps
+        only the identities and refers to the scans by the name of their
+        MGF file and their byte offset in the file instead of keeping the
+        data of the scans in the memory.
+        
+        mz : float
+            m/z value of the precursor ion.
+        ionmode : str
+            Ion mode of the experiment. Either ``pos`` or ``neg``.
+        rt : float
+            Retention time of the feature.
+        rt_range : tuple
+            Minimum and maximum retention time of the feature.
+        identities : list
+            The ``identities`` of the ``MS2Feature``.
+        deltart : numpy.ndarray
+            RT differences of the scans from the feature.
+        scan_refs : numpy.ndarray
+            Tuples of MGF file name, byte offset, sample ID and the
+            parameters of the ``mgf.MgfReader``, in the same order as
+            ``deltart``, i.e. by increasing absolute RT difference.
+        add_precursor_details : bool
+            The ``add_precursor_details`` of the ``MS2Feature``, used
+            for the scans created by ``load_scan``.
+        """
+        
+        self.mz = mz
+        self.ionmode = ionmode
+        self.rt = rt
+        self.rt_range = rt_range
+        self.identities = identities or []
+        self.deltart = np.array([]) if deltart is None else deltart
+        self.scan_refs = (
+            np.empty(0, dtype = object)
+                if scan_refs is None else
+            scan_refs
+        )
+        self.add_precursor_details = add_precursor_details
+    
+    
+    def best_scan_ref(self):
+        """
+        Returns the reference of the scan with the lowest RT difference,
+        ``None`` if the feature has no scans.
+        """
+        
+        return self.scan_refs[0] if len(self.scan_refs) else None
+    
+    
+    def load_scan(self, i = 0, **kwargs):
+        """
+        Reads a scan from its MGF file and creates a ``Scan`` object.
+        
+        i : int
+            Index of the scan, by default the one with the lowest RT
+            difference.
+        **kwargs
+            Passed to ``Scan``, e.g. ``ms1_records``.
+        """
+        
+        fname, offset, sample_id, reader_args = self.scan_refs[i]
+        reader = mgf.MgfReader(fname, **reader_args)
+        row = np.where(reader.mgfindex[:,4] == offset)[0][0]
+        sc = reader.get_scan(row)
+        kwargs.setdefault('add_precursor_details', self.add_precursor_details)
+        
+        return Scan(
+            mzs = sc[:,0],
+            intensities = sc[:,1],
+            ionmode = self.ionmode,
+            precursor = self.mz,
+            scan_id = reader.mgfindex[row,3],
+            sample_id = sample_id,
+            source = fname,
+            deltart = self.deltart[i],
+            rt = reader.mgfindex[row,2],
+            **kwargs
+        )
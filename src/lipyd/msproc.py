@@ -34,6 +34,7 @@ import pyopenms as oms
 import lipyd.session as session
 import lipyd.common as common
 import lipyd.settings as settings
+import lipyd.timing as timing
 
 OPENMS_OBJ_TYPES = (
     oms.PeakMap,
@@ -165,7 +166,7 @@ class MethodParamHandler(session.Logger):
                     self.openms_object_type,
                     common.ensure_unicode(value),
                 ),
-                1,
+                level = 1,
             )
         
         self.openms_obj.setParameters(self.openms_param)
@@ -1420,7 +1421,7 @@ class MgfExport(MethodPathHandler):
                 self._log(
                     'Could not find any MS2 spectra in the input, '
                     'the output MGF file is empty!',
-                    -1,
+                    level = -1,
                 )
                 
             else:
@@ -2030,17 +2031,20 @@ class MSPreprocess(PathHandlerBase):
         self.sample_ids = sample_ids_out
     
     
+    @timing.timed('msproc.peak_picking')
     def peak_picking(self):
         
         self._step_base(method = 'peak_picking')
     
     
+    @timing.timed('msproc.export_mgf')
     def export_mgf(self, **kwargs):
         
         mgf_exporter = MgfExport(**kwargs)
         mgf_exporter.main()
     
     
+    @timing.timed('msproc.feature_finding')
     def feature_finding(self):
         
         self._setup_feature_finding_param()
@@ -2064,6 +2068,7 @@ class MSPreprocess(PathHandlerBase):
         )
     
     
+    @timing.timed('msproc.map_alignment')
     def map_alignment(self):
         
         # attempting to select if any sample requested
@@ -2143,11 +2148,13 @@ class MSPreprocess(PathHandlerBase):
                 )
     
     
+    @timing.timed('msproc.feature_grouping')
     def feature_grouping(self):
         
         self._step_base(method = 'feature_grouping')
     
     
+    @timing.timed('msproc.data_extraction')
     def export(self):
         
         self._step_base(method = 'data_extraction')
@@ -32,6 +32,7 @@ class Recalibration(object):
             first = None,
             last = None,
             by_sample = None,
+            keep_original = False,
             **kwargs,
         ):
         """
@@ -51,11 +52,16 @@ class Recalibration(object):
             detailed at argument ``first``: float or array with one or
             two columns. ``**kwargs`` handled the same way as ``by_sample``
             but the latter has priority.
+        :arg bool keep_original:
+            Keep a copy of the m/z values before the recalibration in the
+            ``mzs_original`` and ``mzs_by_sample_original`` variables.
+            Otherwise the m/z arrays are corrected in place.
         """
         
         self.first = first
         self.last = last
         self.by_sample = by_sample or kwargs
+        self.keep_original = keep_original
     
     
     def reload(self):
@@ -86,18 +92,39 @@ class Recalibration(object):
         self.process_ppms()
         self._by_feature_ppms()
         
-        # keeping the original mzs
-        self.samples._add_var(self.samples.mzs, 'mzs_original')
-        self.samples._add_var(
-            self.samples.mzs_by_sample,
-            'mzs_by_sample_original'
-        )
+        has_by_sample = hasattr(self.samples, 'mzs_by_sample')
+        
+        if self.keep_original:
+            
+            # keeping the original mzs
+            self.samples._add_var(self.samples.mzs.copy(), 'mzs_original')
+            
+            if has_by_sample:
+                
+                self.samples._add_var(
+                    self.samples.mzs_by_sample.copy(),
+                    'mzs_by_sample_original'
+                )
         
         # doing the recalibration
-        self.samples.mzs_by_sample = self._recalibrate(
-            mzs = self.samples.mzs_by_sample,
-            ppms = self.ppms,
-        )
+        if has_by_sample:
+            
+            # in ``SampleSet`` the centroid m/z's might be the same array
+            # as the m/z's by sample, we must not correct it twice
+            shared = np.shares_memory(
+                self.samples.mzs,
+                self.samples.mzs_by_sample,
+            )
+            
+            self.samples.mzs_by_sample = self._recalibrate(
+                mzs = self.samples.mzs_by_sample,
+                ppms = self.ppms,
+            )
+            
+            if shared:
+                
+                self.samples.mzs = self.samples.mzs_by_sample
+                return
         
         self.samples.mzs = self._recalibrate(
             mzs = self.samples.mzs,
@@ -106,73 +133,112 @@ class Recalibration(object):
     
     
     def _recalibrate(self, mzs, ppms):
+        """
+        Corrects the m/z values in place if possible, otherwise returns
+        a new array.
+        """
+        
+        factor = 1. - np.asarray(ppms, dtype = np.float64) * 1e-6
+        
+        if mzs.ndim == 1 and factor.ndim == 2:
+            
+            factor = factor.ravel()
+        
+        if (
+            isinstance(mzs, np.ndarray) and
+            np.issubdtype(mzs.dtype, np.floating) and
+            np.broadcast(mzs, factor).shape == mzs.shape
+        ):
+            
+            mzs *= factor
+            
+            return mzs
+        
+        return mzs * factor
+    
+    
+    def _mzs_of_sample(self, i):
+        """
+        Returns the m/z values of the ``i``th sample.
+        """
+        
+        return (
+            self.samples.mzs_by_sample[:,i]
+            # this only to keep compatibility with Sample
+                if hasattr(self.samples, 'mzs_by_sample') else
+            self.samples.mzs
+        )
+    
+    
+    def _interpolate(self, first, last):
+        """
+        Linear interpolation between the ppms of the first and last sample
+        for all samples, in one broadcasted operation.
+        
+        :arg float,numpy.ndarray first:
+            A single ppm value or an array of ppms for each feature.
+        :arg float,numpy.ndarray last:
+            Same as ``first``.
+        
+        :returns:
+            Array of one dimension with one value for each sample if both
+            ``first`` and ``last`` are single values; otherwise an
+            array of features x samples.
+        """
+        
+        first = np.asarray(first, dtype = np.float64)
+        last  = np.asarray(last, dtype = np.float64)
         
-        return mzs - mzs / 1e6 * ppms
+        weights = np.linspace(0., 1., self.numof_samples)
+        
+        return first[...,None] + (last - first)[...,None] * weights
     
     
     def process_ppms(self):
         """
         Arranges ppms in a way as described argument definitions for
         ``__init__``, taking into consideration the current samples object.
+        After this ``ppms`` is either a single number, an array with one
+        value for each sample or an array of features x samples (for a
+        single ``Sample`` an array with one value for each feature).
         """
         
         if self.first is not None:
             
-            if isinstance(self.first, (float, int, np.float64)):
-                
-                if self.last is None:
-                    
-                    # we got one single ppm value for all samples
-                    self.ppms = self.first
-                    
-                else:
-                    
-                    # we got 2 values for first and last sample, respectively
-                    # extrapolate these over all samples
-                    self.ppms = np.linspace(
-                        self.first,
-                        self.last,
-                        self.numof_samples,
-                    )
-                
-            elif isinstance(self.first, np.ndarray):
+            first = self.first
+            last  = self.last
+            
+            if isinstance(first, np.ndarray):
                 
                 # we got array of ppms for the first sample, this means
                 # the ppms are not even across the m/z range
                 # here we make sure we have an array of ppms with the
                 # same length as number of features
-                mzs_first = (
-                    self.samples.mzs_by_sample[:,0]
-                        if hasattr(self.samples, 'mzs_by_sample') else
-                    self.samples.mzs
-                )
-                first = self.align_array(self.first, mzs_first)
+                first = self.align_array(first, self._mzs_of_sample(0))
+            
+            if isinstance(last, np.ndarray):
                 
-                if not isinstance(self.last, np.ndarray):
-                    
-                    # ppm values provided only for the first sample
-                    # we use this for all samples
-                    self.ppms = first
-                    
-                else:
-                    
-                    # ppms for the last sample also provided
-                    # we extrapolate for other samples in between
-                    mzs_last = (
-                        self.samples.mzs_by_sample[:,-1]
-                            if hasattr(self.samples, 'mzs_by_sample') else
-                        self.samples.mzs
-                    )
-                    last = self.align_array(self.last, mzs_last)
-                    
-                    ppms = []
-                    
-                    for f, l in zip(first, last):
-                        
-                        ppms.append(np.linspace(f, l, self.numof_samples))
-                    
-                    self.ppms = np.vstack(ppms)
+                last = self.align_array(last, self._mzs_of_sample(-1))
             
+            if last is None or self.numof_samples == 1:
+                
+                # ppm values provided only for the first sample
+                # we use this for all samples
+                self.ppms = (
+                    first[:,None]
+                        if (
+                            isinstance(first, np.ndarray) and
+                            hasattr(self.samples, 'mzs_by_sample')
+                        ) else
+                    first
+                )
+                
+            else:
+                
+                # ppms for the last sample also provided
+                # we extrapolate for other samples in between
+                self.ppms = self._interpolate(first, last)
+        
         if (isinstance(self.by_sample, (list, np.ndarray)) and
             len(self.by_sample) == self.numof_samples
         ):
@@ -188,42 +254,39 @@ class Recalibration(object):
         
         if self.by_sample:
             
-            self.ppms = []
+            # one column for each sample, samples missing from the dict
+            # are not corrected
+            ppms = [0.] * self.numof_samples
             
             # we got ppms for each sample, iterate through the dict
             for sample_id, sample_ppm in iteritems(self.by_sample):
                 
-                if isinstance(sample_ppm, (float, int, np.float64)):
-                    
-                    self.ppms.append(sample_ppm)
-                    
-                else:
-                    
-                    sample_id = self.sample_id_proc(sample_id)
+                sample_id = self.sample_id_proc(sample_id)
+                i = self.samples.attrs.sample_id_to_index[sample_id]
+                
+                if not isinstance(sample_ppm, (float, int, np.float64)):
                     
-                    sampl_mzs = mzs_last = (
-                        self.samples.mzs_by_sample[
-                            :,
-                            self.samples.attrs.sample_id_to_index[sample_id]
-                        ]
-                        # this only to keep compatibility with Sample
-                            if hasattr(self.samples, 'mzs_by_sample') else
-                        self.samples.mzs
+                    sample_ppm = self.align_array(
+                        sample_ppm,
+                        self._mzs_of_sample(i),
                     )
-                    sample_ppm = self.align_array(sample_ppm, sample_mzs)
-                    self.ppms.append(sample_ppm)
+                
+                ppms[i] = sample_ppm
             
-            if all(isinstance(ppms, np.ndarray) for ppms in self.ppms):
+            if any(isinstance(p, np.ndarray) for p in ppms):
                 
                 # if above we produced ppms for each feature
                 # we create an array with dimensions features x samples
-                self.ppms = np.hstack(self.ppms)
+                self.ppms = np.column_stack([
+                    np.broadcast_to(p, (self.numof_features,))
+                    for p in ppms
+                ])
                 
-            if isinstance(self.ppms, list):
+            else:
                 
                 # if we have one number for each sample, simply
                 # create a one dimensional array
-                self.ppms = np.array(self.ppms)
+                self.ppms = np.array(ppms, dtype = np.float64)
     
     
     def _by_feature_ppms(self):
@@ -235,8 +298,14 @@ class Recalibration(object):
             
         elif isinstance(self.ppms, np.ndarray) and self.ppms.ndim == 1:
             
-            # if it's an array with one number for each sample
-            self.ppms_by_feature = np.median(self.ppms)
+            self.ppms_by_feature = (
+                # if it's an array with one number for each feature
+                # in a single sample
+                self.ppms
+                    if not hasattr(self.samples, 'mzs_by_sample') else
+                # if it's an array with one number for each sample
+                np.median(self.ppms)
+            )
             
         else:
             
@@ -245,17 +314,30 @@ class Recalibration(object):
     
     
     def align_array(self, array, mzs):
+        """
+        Creates an array of ppms for each feature from an array of 2
+        columns: first with m/z values, second with errors in ppm above
+        the corresponding m/z value. Below the lowest m/z the first ppm
+        value applies.
         
-        if len(array) == self.numof_features:
+        :arg numpy.ndarray array:
+            Either an array of 2 columns as described above, or an array
+            with one ppm value for each feature.
+        :arg numpy.ndarray mzs:
+            The m/z values of the features.
+        """
+        
+        array = np.asarray(array, dtype = np.float64)
+        
+        if array.ndim == 1 and len(array) == self.numof_features:
             
             return array
             
         else:
             
-            if ndim(array) < 2:
+            if array.ndim < 2:
                 
-                raise(
-                    ValueError,
+                raise ValueError(
                     'ppm arrays must be the same length as '
                     'number of features in the samples or must have '
                     '2 columns: first with m/z values second with ppms.'
@@ -264,21 +346,7 @@ class Recalibration(object):
             # sorting by m/z
             array = array[array[:,0].argsort(),:]
             
-            ppms = []
-            
-            ppm = array[0,1]
-            i = 1
-            
-            for mz in mzs:
-                
-                if mz >= array[i,0]:
-                    
-                    ppm = array[i,1]
-                    
-                    if i < array.shape[0]:
-                        
-                        i += 1
-                
-                ppms.append(ppm)
+            # index of the highest calibrant m/z below each m/z
+            i = array[:,0].searchsorted(mzs, side = 'right') - 1
             
-            return np.array(ppms)
+            return array[np.clip(i, 0, array.shape[0] - 1),1]
@@ -0,0 +1,664 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://denes.omnipathdb.org/
+#
+
+"""
+Columnar storage of ``lipproc.LipidRecord`` objects.
+
+Molecule databases contain millions of records, each of them a few
+nested namedtuples with their own strings. Here the records are
+decomposed into integer arrays and a string table, the repetitive parts
+(headgroups, chain types and attributes, database names) are interned.
+The records are created again only when accessed by their index.
+"""
+
+import array
+import numbers
+
+import numpy as np
+
+import lipyd.lipproc as lipproc
+
+
+#: Separator of the names in the string table
+_NAMESEP = '\x1e'
+
+
+class StringTable(object):
+    """
+    Strings concatenated in one buffer.
+    """
+    
+    
+    def __init__(self):
+        """
+        Stores many strings in one buffer. Strings are accessed by
+        their index.
+        """
+        
+        self._buffer = bytearray()
+        self._offsets = array.array('q', [0])
+        # for deduplication while building
+        self._index = {}
+    
+    
+    def add(self, s, dedup = False):
+        """
+        Adds a string to the table and returns its index.
+        ``None`` is represented by -1.
+        
+        Parameters
+        ----------
+        s : str
+            The string.
+        dedup : bool
+            Return the index of an identical string if it has been added
+            already (and with ``dedup = True``).
+        """
+        
+        if s is None:
+            
+            return -1
+        
+        if dedup and s in self._index:
+            
+            return self._index[s]
+        
+        self._buffer.extend(s.encode('utf-8'))
+        self._offsets.append(len(self._buffer))
+        i = len(self._offsets) - 2
+        
+        if dedup:
+            
+            self._index[s] = i
+        
+        return i
+    
+    
+    def freeze(self):
+        """
+        Makes the table compact and read only.
+        """
+        
+        self._buffer = bytes(self._buffer)
+        self._offsets = np.frombuffer(self._offsets, dtype = np.int64).copy()
+        self._index = {}
+    
+    
+    @classmethod
+    def concatenate(cls, tables):
+        """
+        Joins frozen string tables into a new one.
+        
+        Returns
+        -------
+        Tuple of the new table and the amounts the string indices of
+        each original table have to be shifted by.
+        """
+        
+        new = cls()
+        new._buffer = b''.join(t._buffer for t in tables)
+        byte_shifts = np.cumsum([0] + [len(t._buffer) for t in tables])
+        new._offsets = np.concatenate(
+            [np.zeros(1, dtype = np.int64)] +
+            [
+                t._offsets[1:] + shift
+                for t, shift in zip(tables, byte_shifts)
+            ]
+        )
+        shifts = np.cumsum([0] + [len(t) for t in tables])[:-1]
+        
+        return new, shifts
+    
+    
+    def arrays(self):
+        """
+        The buffer and the offsets of a frozen table as arrays,
+        e.g. for ``shared.save``.
+        """
+        
+        return {
+            'buffer': np.frombuffer(self._buffer, dtype = np.uint8),
+            'offsets': self._offsets,
+        }
+    
+    
+    @classmethod
+    def from_arrays(cls, buffer, offsets):
+        """
+        Creates a frozen table from the arrays returned by ``arrays``,
+        without copying them.
+        """
+        
+        new = cls()
+        new._buffer = memoryview(buffer)
+        new._offsets = offsets
+        
+        return new
+    
+    
+    def __getitem__(self, i):
+        
+        if i < 0:
+            
+            return None
+        
+        # the buffer is `bytes` or a `memoryview` of a shared array
+        return str(
+            self._buffer[self._offsets[i]:self._offsets[i + 1]],
+            'utf-8',
+        )
+    
+    
+    def __len__(self):
+        
+        return len(self._offsets) - 1
+    
+    
+    @property
+    def nbytes(self):
+        
+        return len(self._buffer) + len(self._offsets) * 8
+
+
+class RecordStore(object):
+    """
+    Lipid records as columns of integer arrays.
+    """
+    
+    
+    # columns: name, typecode, dtype
+    _columns = (
+        ('db_id', 'q', np.int64),
+        ('db', 'i', np.int32),
+        ('names', 'q', np.int64),
+        ('names_tuple', 'b', np.int8),
+        ('formula', 'q', np.int64),
+        ('hg', 'i', np.int32),
+        ('sum_c', 'i', np.int32),
+        ('sum_u', 'i', np.int32),
+        ('sum_form', 'i', np.int32),
+        ('chain_start', 'q', np.int64),
+        ('chain_c', 'i', np.int32),
+        ('chain_u', 'i', np.int32),
+        ('chain_form', 'i', np.int32),
+    )
+    
+    
+    def __init__(self, records = None):
+        """
+        Stores ``lipproc.LipidRecord`` objects in arrays and creates them
+        on demand.
+        
+        Records are added by ``append`` or ``extend`` and the store
+        becomes accessible after ``freeze`` has been called. Indexing by
+        an integer returns a ``LipidRecord``, by a slice or an array of
+        indices returns an object array of ``LipidRecord``s (as the
+        former ``numpy`` object arrays of records did). ``take`` returns
+        a new store with the selected records.
+        
+        Parameters
+        ----------
+        records : iterable
+            ``lipproc.LipidRecord`` objects to start with; if provided
+            the store is frozen right away.
+        """
+        
+        for name, typecode, dtype in self._columns:
+            
+            setattr(self, name, array.array(typecode))
+        
+        self.chain_start.append(0)
+        self.strings = StringTable()
+        # interned values: headgroups, chain types and attributes, etc
+        self.values = []
+        self._value_index = {}
+        self.frozen = False
+        
+        if records is not None:
+            
+            self.extend(records)
+            self.freeze()
+    
+    
+    def _intern(self, value):
+        
+        if value not in self._value_index:
+            
+            self._value_index[value] = len(self.values)
+            self.values.append(value)
+        
+        return self._value_index[value]
+    
+    
+    def append(self, rec):
+        """
+        Adds one ``lipproc.LipidRecord`` to the store.
+        """
+        
+        if self.frozen:
+            
+            raise RuntimeError('Can not add records to a frozen store.')
+        
+        lab, hg, chainsum, chains = rec
+        
+        self.db_id.append(self.strings.add(lab.db_id))
+        self.db.append(self._intern(lab.db))
+        
+        names = lab.names
+        is_tuple = isinstance(names, (tuple, list))
+        self.names.append(
+            self.strings.add(
+                _NAMESEP.join(names) if is_tuple else names
+            )
+        )
+        self.names_tuple.append(is_tuple)
+        self.formula.append(self.strings.add(lab.formula, dedup = True))
+        self.hg.append(self._intern(hg))
+        
+        if chainsum is None:
+            
+            self.sum_c.append(0)
+            self.sum_u.append(0)
+            self.sum_form.append(-1)
+        
+        else:
+            
+            self.sum_c.append(chainsum.c)
+            self.sum_u.append(chainsum.u)
+            self.sum_form.append(
+                self._intern((chainsum.typ, chainsum.attr, chainsum.iso))
+            )
+        
+        for chain in chains:
+            
+            self.chain_c.append(chain.c)
+            self.chain_u.append(chain.u)
+            self.chain_form.append(
+                self._intern((chain.typ, chain.attr, chain.iso))
+            )
+        
+        self.chain_start.append(len(self.chain_c))
+    
+    
+    def extend(self, records):
+        """
+        Adds ``lipproc.LipidRecord`` objects from an iterable.
+        """
+        
+        for rec in records:
+            
+            self.append(rec)
+    
+    
+    def freeze(self):
+        """
+        Converts the columns to numpy arrays and drops the indexes used
+        only while adding records.
+        """
+        
+        if self.frozen:
+            
+            return self
+        
+        for name, typecode, dtype in self._columns:
+            
+            setattr(
+                self,
+                name,
+                np.frombuffer(getattr(self, name), dtype = dtype).copy(),
+            )
+        
+        self.strings.freeze()
+        self._value_index = {}
+        self.frozen = True
+        
+        return self
+    
+    
+    def __len__(self):
+        
+        return len(self.db)
+    
+    
+    @property
+    def shape(self):
+        
+        return (len(self),)
+    
+    
+    def record(self, i):
+        """
+        Creates the ``lipproc.LipidRecord`` at index ``i``.
+        """
+        
+        names = self.strings[self.names[i]]
+        
+        if self.names_tuple[i]:
+            
+            names = tuple(names.split(_NAMESEP)) if names else ()
+        
+        lab = lipproc.LipidLabel._make((
+            self.strings[self.db_id[i]],
+            self.values[self.db[i]],
+            names,
+            self.strings[self.formula[i]],
+        ))
+        
+        sum_form = self.sum_form[i]
+        chainsum = (
+            None
+                if sum_form < 0 else
+            # bypassing `__new__` as the values have been processed
+            # already; `_make` does not work as `ChainSummary` has `__len__`
+            tuple.__new__(
+                lipproc.ChainSummary,
+                (int(self.sum_c[i]), int(self.sum_u[i])) +
+                self.values[sum_form]
+            )
+        )
+        
+        chains = tuple(
+            tuple.__new__(
+                lipproc.Chain,
+                (int(self.chain_c[j]), int(self.chain_u[j])) +
+                self.values[self.chain_form[j]]
+            )
+            for j in range(self.chain_start[i], self.chain_start[i + 1])
+        )
+        
+        return lipproc.LipidRecord._make((
+            lab,
+            self.values[self.hg[i]],
+            chainsum,
+            chains,
+        ))
+    
+    
+    def _indices(self, idx):
+        """
+        Converts a slice, a boolean mask or a sequence of integers to an
+        array of non negative record indices. The cost depends only on
+        the size of ``idx``, not on the number of records.
+        """
+        
+        n = len(self)
+        
+        if isinstance(idx, slice):
+            
+            return np.arange(*idx.indices(n), dtype = np.intp)
+        
+        idx = np.asarray(idx)
+        
+        if idx.dtype == np.bool_:
+            
+            if idx.shape != (n,):
+                
+                raise IndexError(
+                    'Boolean index of length %u for %u records.' % (
+                        len(idx), n,
+                    )
+                )
+            
+            return np.flatnonzero(idx)
+        
+        if idx.size == 0:
+            
+            return np.empty(0, dtype = np.intp)
+        
+        if not np.issubdtype(idx.dtype, np.integer):
+            
+            raise IndexError('Record indices must be integers.')
+        
+        idx = idx.astype(np.intp)
+        idx = np.where(idx < 0, idx + n, idx)
+        
+        if idx.min() < 0 or idx.max() >= n:
+            
+            raise IndexError('Record index out of range.')
+        
+        return idx
+    
+    
+    def __getitem__(self, idx):
+        
+        if isinstance(idx, numbers.Integral):
+            
+            idx = int(idx)
+            
+            if idx < 0:
+                
+                idx += len(self)
+            
+            if not 0 <= idx < len(self):
+                
+                raise IndexError('Record index out of range: %u' % idx)
+            
+            return self.record(idx)
+        
+        idx = self._indices(idx)
+        result = np.empty(len(idx), dtype = object)
+        
+        for k, i in enumerate(idx):
+            
+            result[k] = self.record(i)
+        
+        return result
+    
+    
+    def __iter__(self):
+        
+        for i in range(len(self)):
+            
+            yield self.record(i)
+    
+    
+    @classmethod
+    def concatenate(cls, stores):
+        """
+        Joins record stores into a new one, the records follow each other
+        in the order of the stores.
+        
+        Parameters
+        ----------
+        stores : list
+            ``RecordStore`` objects, these are frozen if not yet.
+        """
+        
+        stores = [store.freeze() for store in stores]
+        new = cls.__new__(cls)
+        new.values = []
+        new._value_index = {}
+        new.strings, string_shifts = StringTable.concatenate(
+            [store.strings for store in stores]
+        )
+        
+        columns = dict((name, []) for name, typecode, dtype in cls._columns)
+        nchains = 0
+        
+        for store, string_shift in zip(stores, string_shifts):
+            
+            # interned value ids in the new store
+            values = np.array(
+                [new._intern(value) for value in store.values] + [-1],
+                dtype = np.int32,
+            )
+            
+            for name, typecode, dtype in cls._columns:
+                
+                col = getattr(store, name)
+                
+                if name in ('db', 'hg', 'sum_form', 'chain_form'):
+                    
+                    # -1 remains -1 as it points to the last element
+                    col = values[col]
+                    
+                elif name in ('db_id', 'names', 'formula'):
+                    
+                    col = np.where(col < 0, col, col + string_shift)
+                    
+                elif name == 'chain_start':
+                    
+                    col = col[:-1] + nchains
+                
+                columns[name].append(col)
+            
+            nchains += store.chain_start[-1]
+        
+        columns['chain_start'].append(np.array([nchains], dtype = np.int64))
+        
+        for name, typecode, dtype in cls._columns:
+            
+            setattr(
+                new,
+                name,
+                np.concatenate(columns[name]).astype(dtype, copy = False),
+            )
+        
+        new._value_index = {}
+        new.frozen = True
+        
+        return new
+    
+    
+    def arrays(self, prefix = ''):
+        """
+        The columns and the string table of the store as a dict of arrays,
+        e.g. for ``shared.save``. The interned ``values`` are not included.
+        
+        Parameters
+        ----------
+        prefix : str
+            Prefix for the names of the arrays.
+        """
+        
+        self.freeze()
+        
+        arrays = dict(
+            ('%s%s' % (prefix, name), getattr(self, name))
+            for name, typecode, dtype in self._columns
+        )
+        arrays.update(
+            ('%sstrings_%s' % (prefix, name), arr)
+            for name, arr in self.strings.arrays().items()
+        )
+        
+        return arrays
+    
+    
+    @classmethod
+    def from_arrays(cls, arrays, values, prefix = ''):
+        """
+        Creates a frozen store from the arrays returned by ``arrays``
+        and the interned values, without copying the arrays. Records
+        are created from the arrays on demand just as in any store,
+        e.g. the arrays might be mapped from a file shared by many
+        processes.
+        """
+        
+        new = cls.__new__(cls)
+        
+        for name, typecode, dtype in cls._columns:
+            
+            setattr(new, name, arrays['%s%s' % (prefix, name)])
+        
+        new.strings = StringTable.from_arrays(
+            arrays['%sstrings_buffer' % prefix],
+            arrays['%sstrings_offsets' % prefix],
+        )
+        new.values = list(values)
+        new._value_index = {}
+        new.frozen = True
+        
+        return new
+    
+    
+    def take(self, idx):
+        """
+        Returns a new store with the records at the indices in ``idx``
+        (e.g. for reordering the records). The string table and the
+        interned values are shared with this store.
+        """
+        
+        idx = self._indices(idx)
+        new = RecordStore.__new__(RecordStore)
+        
+        for name, typecode, dtype in self._columns:
+            
+            if not name.startswith('chain_'):
+                
+                setattr(new, name, getattr(self, name)[idx])
+        
+        start = self.chain_start[idx]
+        end = self.chain_start[idx + 1]
+        lengths = end - start
+        new.chain_start = np.concatenate(([0], np.cumsum(lengths)))
+        # positions of the chains of the selected records
+        chain_idx = (
+            np.repeat(start - new.chain_start[:-1], lengths) +
+            np.arange(new.chain_start[-1])
+        )
+        
+        for name in ('chain_c', 'chain_u', 'chain_form'):
+            
+            setattr(new, name, getattr(self, name)[chain_idx])
+        
+        new.strings = self.strings
+        new.values = self.values
+        new._value_index = {}
+        new.frozen = True
+        
+        return new
+    
+    
+    def hg_at(self, i):
+        """
+        Returns the headgroup of the record at index ``i``.
+        """
+        
+        return self.values[self.hg[i]]
+    
+    
+    def db_at(self, i):
+        """
+        Returns the database name of the record at index ``i``.
+        """
+        
+        return self.values[self.db[i]]
+    
+    
+    @property
+    def nbytes(self):
+        """
+        Size of the arrays and the string table in bytes.
+        """
+        
+        return (
+            sum(
+                getattr(self, name).nbytes
+                    if self.frozen else
+                len(getattr(self, name)) * getattr(self, name).itemsize
+                for name, typecode, dtype in self._columns
+            ) +
+            self.strings.nbytes
+        )
+    
+    
+    def __repr__(self):
+        
+        return '<RecordStore with %u records>' % len(self)
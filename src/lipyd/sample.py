@@ -38,11 +38,13 @@ import lipyd.moldb as moldb
 import lipyd.ms2 as ms2
 import lipyd.mgf as mgf
 import lipyd.settings as settings
+import lipyd.timing as timing
 import lipyd.progress as progress
 import lipyd.sampleattrs as sampleattrs
 import lipyd.feature as feature
 import lipyd.recalibration as recalibration
 import lipyd.lookup as lookup
+import lipyd.identities as identities
 import lipyd.common as common
 import lipyd.session as session
 
@@ -1218,6 +1220,7 @@ class Sample(FeatureBase):
         first = None,
         last = None,
         by_sample = None,
+        keep_original = False,
         **kwargs,
     ):
         """
@@ -1240,12 +1243,17 @@ class Sample(FeatureBase):
             detailed at argument ``first``: float or array with one or
             two columns. ``**kwargs`` handled the same way as ``by_sample``
             but the latter has priority.
+        :arg bool keep_original:
+            Keep a copy of the original m/z values in the ``mzs_original``
+            and ``mzs_by_sample_original`` variables. By default the m/z
+            arrays are corrected in place and no copy is kept.
         """
         
         recalibrator = recalibration.Recalibration(
             first = first,
             last = last,
             by_sample = by_sample,
+            keep_original = keep_original,
             **kwargs,
         )
         
@@ -1410,6 +1418,7 @@ class Sample(FeatureBase):
         self.rt_filter(threshold = rt_min)
     
     
+    @timing.timed('sample.database_lookup')
     def database_lookup(
             self,
             database_args = None,
@@ -1460,6 +1469,7 @@ class Sample(FeatureBase):
         )
     
     
+    @timing.timed('sample.set_ms2_sources')
     def set_ms2_sources(self, attrs = None):
         """Collects the MS2 scans belonging to this sample.
         
@@ -1687,18 +1697,12 @@ class Sample(FeatureBase):
         raise NotImplementedError
     
     
-    def ms2_analysis(self, resources = None):
+    def get_ms2_resources(self, resources = None):
         """
-        Runs MS2 identification methods on all features.
-
-        Parameters
-        ----------
-        resources :
-             (Default value = None)
-
-        Returns
-        -------
-
+        Returns the MS2 resources of the sample in the format
+        ``ms2.MS2Feature`` accepts them, i.e. a ``dict`` with sample IDs as
+        keys and MGF files as values. If ``resources`` provided returns
+        them unchanged.
         """
         
         if resources is None:
@@ -1717,37 +1721,58 @@ class Sample(FeatureBase):
                     'No resources provided for MS2 identification.'
                 )
         
-        ms2_identities = []
-        
-        self._log('Analysing MS2 spectra.')
+        return resources
+    
+    
+    @timing.timed('sample.ms2_analysis')
+    def ms2_analysis(
+            self,
+            resources = None,
+            keep_scans = None,
+            checkpoint = None,
+        ):
+        """
+        Runs MS2 identification methods on all features.
+
+        Parameters
+        ----------
+        resources :
+             (Default value = None)
+        keep_scans : bool
+            Keep the ``ms2.MS2Feature`` objects with all their scans, e.g.
+            for inspection and plotting. Otherwise only the compact
+            ``ms2.MS2FeatureResult`` objects are kept. By default the
+            value of the ``ms2_keep_scans`` setting.
+        checkpoint : str
+            Path to a checkpoint file. The result of each feature is
+            written into this file as soon as it is ready. If the file
+            exists already, the features with results from the same
+            inputs are not analysed again, hence an interrupted run can
+            be resumed. Resumed features have ``ms2.MS2FeatureResult``
+            objects even if ``keep_scans`` is ``True``. By default the
+            value of the ``ms2_checkpoint`` setting, if ``None`` no
+            checkpoints are written.
+
+        Returns
+        -------
+
+        """
         
-        if not self.silent:
-            
-            prg = progress.Progress(len(self), 'Analysing MS2 spectra', 1)
+        resources = self.get_ms2_resources(resources)
         
-        for i in xrange(len(self)):
-            
-            if not self.silent:
-                
-                prg.step()
-            
-            # MS2 identifications:
-            ms2_fe = ms2.MS2Feature(
-                mz = self.mzs[i],
-                ionmode = self.ionmode,
-                resources = resources,
-                rt = self.feattrs.rt_means[i],
-                ms1_records = self.feattrs.records[i],
-                check_rt = self.ms2_check_rt,
-            )
-            
-            ms2_fe.main()
-            
-            ms2_identities.append(ms2_fe)
+        self._log('Analysing MS2 spectra.')
         
-        if not self.silent:
-            
-            prg.terminate()
+        ms2_identities = ms2.analyse_features(
+            mzs = self.mzs,
+            ionmode = self.ionmode,
+            resources = resources,
+            rts = self.feattrs.rt_means,
+            ms1_records = self.feattrs.records,
+            check_rt = self.ms2_check_rt,
+            keep_scans = keep_scans,
+            checkpoint = checkpoint,
+            silent = self.silent,
+        )
         
         ms2_identities = np.array(ms2_identities)
         
@@ -1800,24 +1825,39 @@ class Sample(FeatureBase):
                 yield rec
     
     
-    def table(
+    def ms2_identity_table(self):
+        """
+        Collects the MS2 identification results of all features into
+        a columnar table. Feature IDs in the table are the current
+        indices of the features.
+        
+        Returns
+        -------
+        ``lipyd.identities.IdentityTable`` instance.
+        """
+        
+        return identities.IdentityTable(self.feattrs.ms2_identities)
+    
+    
+    def table_columns(
             self,
             variables = None,
             headers = None,
         ):
         """
-        Returns results as a header and a table as list of lists.
+        Returns results as a header and a list of columns. Numeric
+        columns are arrays, the rest are lists or arrays of strings.
 
         Parameters
         ----------
-        variables :
-             (Default value = None)
-        headers :
-             (Default value = None)
+        variables : list
+            Names of further feature attributes to include.
+        headers : list
+            Column titles for ``variables``.
 
         Returns
         -------
-
+        Tuple of the header and the list of columns.
         """
         
         self.feattrs.sort_all('total_intensities', desc = True)
@@ -1833,80 +1873,147 @@ class Sample(FeatureBase):
             'MS2 all',
         ]
         
+        ms2_ids = self.ms2_identity_table()
+        
+        columns = [
+            self.mzs,
+            self.feattrs.total_intensities,
+            (
+                [
+                    '%.02f - %.02f' % tuple(rtr)
+                    for rtr in self.feattrs.rt_ranges
+                ]
+                    if hasattr(self.feattrs, 'rt_ranges') else
+                [''] * len(self)
+            ),
+            self.feattrs.quality,
+            (
+                self.feattrs.significance
+                    if hasattr(self.feattrs, 'significance') else
+                np.full(len(self), np.nan)
+            ),
+            [
+                moldb.records_string(
+                    records = records,
+                    show_ppm = True,
+                    show_adduct = True,
+                    show_db = True,
+                )
+                for records in self.feattrs.records
+            ],
+            ms2_ids.feature_strings_best(),
+            ms2_ids.feature_strings_all(),
+        ]
+        
         if variables:
             
             for i, var in enumerate(variables):
                 
                 hdr.append(var if not headers else headers[i])
+                columns.append(getattr(self.feattrs, var))
+        
+        return hdr, columns
+    
+    
+    def table(
+            self,
+            variables = None,
+            headers = None,
+        ):
+        """
+        Returns results as a header and a table as list of lists.
+        
+        Parameters
+        ----------
+        variables :
+             (Default value = None)
+        headers :
+             (Default value = None)
+        
+        Returns
+        -------
+        
+        """
+        
+        hdr, columns = self.table_columns(
+            variables = variables,
+            headers = headers,
+        )
         
         yield hdr
         
+        has_significance = hasattr(self.feattrs, 'significance')
+        
         for i in xrange(len(self)):
             
-            ms2_id = self.feattrs.ms2_identities[i]
-            ms2_best = ms2_id.identities_str_best()
-            ms2_all = ms2_id.identities_str_all()
-            
             line = [
-                '%08f' % self.mzs[i],
-                '%u' % self.feattrs.total_intensities[i],
-                (
-                    '%.02f - %.02f' % tuple(self.feattrs.rt_ranges[i])
-                        if hasattr(self.feattrs, 'rt_ranges') else
-                    ''
-                ),
-                '%.02f' % self.feattrs.quality[i],
-                (
-                    '%.02f' % self.feattrs.significance[i]
-                        if hasattr(self.feattrs, 'significance') else
-                    ''
-                ),
-                moldb.records_string(
-                    records = self.feattrs.records[i],
-                    show_ppm = True,
-                    show_adduct = True,
-                    show_db = True,
-                ),
-                ms2_best,
-                ms2_all,
+                '%08f' % columns[0][i],
+                '%u' % columns[1][i],
+                columns[2][i],
+                '%.02f' % columns[3][i],
+                '%.02f' % columns[4][i] if has_significance else '',
+                columns[5][i],
+                columns[6][i],
+                columns[7][i],
             ]
             
-            if variables:
-                
-                for var in variables:
-                    
-                    line.append(str(getattr(self.feattrs, var)[i]))
+            line.extend(str(col[i]) for col in columns[8:])
             
             yield line
     
     
-    def export_table(self, fname, **kwargs):
+    def export_table(self, fname, fmt = None, **kwargs):
         """
+        Writes the results into a TSV or Parquet file.
 
         Parameters
         ----------
-        fname :
-            
+        fname : str
+            Path to the output file.
+        fmt : str
+            Either ``tsv`` or ``parquet``, by default guessed from the
+            file name. Parquet files contain numeric columns as numbers.
         **kwargs :
-            
-
-        Returns
-        -------
-
+            Passed to ``table``.
         """
         
-        table = self.table(**kwargs)
-        
-        hdr = next(table)
-        
-        with open(fname, 'w') as fp:
+        if common._table_format(fname, fmt) == 'parquet':
             
-            _ = fp.write('\t'.join(hdr))
+            hdr, columns = self.table_columns(**kwargs)
             
-            for row in table:
-                
-                _ = fp.write('\n')
-                _ = fp.write('\t'.join(row))
+        else:
+            
+            table = self.table(**kwargs)
+            hdr = next(table)
+            columns = list(zip(*table)) or [()] * len(hdr)
+        
+        common.write_table(fname, hdr, columns, fmt = fmt)
+    
+    
+    def export_ms2_identities(self, fname, top = None, fmt = None):
+        """
+        Writes the MS2 identities of all features into a TSV or Parquet
+        file, one identity in each row.
+        
+        Parameters
+        ----------
+        fname : str
+            Path to the output file.
+        top : int
+            Export only the best ``top`` species level identities of each
+            feature. By default all identities are exported.
+        fmt : str
+            Either ``tsv`` or ``parquet``, by default guessed from the
+            file name.
+        """
+        
+        ms2_ids = self.ms2_identity_table()
+        
+        ms2_ids.export(
+            fname,
+            rows = None if top is None else ms2_ids.top(n = top),
+            fmt = fmt,
+        )
 
 
 class FeatureIdx(FeatureBase):
@@ -2513,6 +2620,7 @@ class SampleSet(Sample, sampleattrs.SampleSorter):
         return ms2_source
     
     
+    @timing.timed('sample.set_ms2_sources')
     def set_ms2_sources(self, attrs = None):
         """
         Collects the MS2 scans for all samples.
@@ -2561,23 +2669,6 @@ class SampleSet(Sample, sampleattrs.SampleSorter):
         
         """
         
-        def ps(a0, a1):
-            
-            _method = np.nanmax if min_max == 'max' else np.nanmin
-            
-            if np.all(np.isnan(a1)) or np.nanmax(a1) == 0:
-                
-                return 0.0
-            
-            if (
-                (np.all(np.isnan(a0)) or np.nanmax(a0) == 0) and
-                np.nanmax(a1) > 0
-            ):
-                
-                return np.inf
-            
-            return _method(a1) / np.nanmax(a0)
-        
         backg = set(self.attrs.proc(f) for f in backg)
         peak  = set(self.attrs.proc(f) for f in peak)
         
@@ -2585,17 +2676,40 @@ class SampleSet(Sample, sampleattrs.SampleSorter):
             i
             for i, attr in enumerate(self.attrs)
             if attr['label']['fraction'] in backg
-        ])
+        ], dtype = np.int64)
         ipeak = np.array([
             i
             for i, attr in enumerate(self.attrs)
             if attr['label']['fraction'] in peak
-        ])
+        ], dtype = np.int64)
         
-        peaksize = np.array([
-            ps(self.intensities[i,ibackg], self.intensities[i,ipeak])
-            for i in xrange(len(self))
-        ])
+        # all features processed at once along the samples axis
+        _method = feature.nanmax if min_max == 'max' else feature.nanmin
+        
+        in_backg = self.intensities[:,ibackg]
+        in_peak  = self.intensities[:,ipeak]
+        
+        backg_max = feature.nanmax(in_backg)
+        peak_max  = feature.nanmax(in_peak)
+        peak_sel  = _method(in_peak)
+        
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            
+            no_peak  = np.isnan(peak_max) | (peak_max == 0)
+            no_backg = (
+                (np.isnan(backg_max) | (backg_max == 0)) &
+                (peak_max > 0)
+            )
+            
+            peaksize = np.where(
+                no_peak,
+                0.0,
+                np.where(
+                    no_backg,
+                    np.inf,
+                    peak_sel / backg_max,
+                ),
+            )
         
         self.feattrs._add_var(peaksize, 'peaksize')
         
@@ -32,7 +32,7 @@ class Session(object):
         self.label = label or self.gen_session_id()
         self.log_verbosity = log_verbosity
         self.start_logger()
-        self.log.msg('Session `%s` started.' % self.label)
+        self.log.msg('Session `%s` started.', self.label)
     
     
     @staticmethod
@@ -57,7 +57,7 @@ class Session(object):
     
     def __del__(self):
         
-        self.log.msg('Session `%s` finished.' % self.label)
+        self.log.msg('Session `%s` finished.', self.label)
 
 
 class Logger(object):
@@ -69,20 +69,22 @@ class Logger(object):
         self._logger = get_log()
     
     
-    def _log(self, msg = '', level = 0):
+    def _log(self, msg = '', *args, level = 0):
         """
         Writes a message into the logfile.
+        If ``args`` provided, ``msg`` is formatted by them only if the
+        message is not dropped due to its level.
         """
         
-        self._logger.msg(msg = msg, label = self._log_name, level = level)
+        self._logger.msg(msg, *args, label = self._log_name, level = level)
     
     
-    def _console(self, msg = ''):
+    def _console(self, msg = '', *args):
         """
         Writes a message to the console and also to the logfile.
         """
         
-        self._logger.console(msg = msg, label = self._log_name)
+        self._logger.console(msg, *args, label = self._log_name)
     
     
     @property
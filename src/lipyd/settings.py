@@ -21,6 +21,7 @@ from future.utils import iteritems
 
 import os
 import copy
+import types
 import collections
 
 import lipyd.common as common
@@ -364,6 +365,35 @@ _defaults = {
     # (fragment rank, intensity and type) to the MS2Identity object
     # turning this off makes MS2 spectra analysis faster
     'ms2_scan_chain_details': True,
+    # preprocessing of the MS2 spectra before annotation,
+    # all steps disabled by default:
+    # remove peaks below this absolute intensity
+    'ms2_min_intensity': 0,
+    # remove peaks below this fraction of the highest peak
+    'ms2_min_relative_intensity': 0,
+    # keep only this number of the most intense peaks
+    'ms2_top_n': None,
+    # remove the 13C isotope peaks of the fragments
+    'ms2_deisotope': False,
+    # merge peaks closer than this tolerance (ppm)
+    # keeping the most intense one
+    'ms2_deduplicate_tolerance': None,
+    # at MS2 features identify only one representative of the
+    # similar MS2 spectra, e.g. the same precursor in adjacent
+    # fractions, and copy the results to the other spectra
+    'ms2_cluster_scans': False,
+    # minimum cosine similarity of the spectra in one cluster
+    'ms2_cluster_min_cosine': 0.95,
+    # highest retention time difference within one cluster
+    'ms2_cluster_rt_tolerance': 1.0,
+    # width of the m/z bins for the spectrum similarity
+    'ms2_cluster_bin_width': 0.01,
+    # keep the complete `ms2.MS2Feature` objects with all scans
+    # after MS2 analysis of samples instead of compact results
+    'ms2_keep_scans': False,
+    # write the MS2 identification results of each feature into this
+    # checkpoint file to be able to resume interrupted runs
+    'ms2_checkpoint': None,
     # Method names to convert between adduct and exact masses
     'ad2ex': {
         1: {
@@ -562,8 +592,24 @@ _defaults = {
     'log_flush_interval': 2,
     'console_verbosity': -1,
     'log_verbosity': 0,
+    # format of the log files: `text` or `jsonl` (JSON lines)
+    'log_format': 'text',
+    # the log file is written by a background thread which starts
+    # only after this many messages or `log_flush_interval` seconds
+    'log_buffer_size': 100,
+    # number of peaks in isotope patterns (see ``lipyd.isotope``)
+    'isotope_peaks': 5,
+    # peaks with lower abundance are removed from the end
+    # of isotope patterns
+    'isotope_prune_threshold': 1e-12,
+    # collect timings of the processing stages (see ``lipyd.timing``)
+    'timing': False,
     # priority of databases at name to mass lookups in moldb
     'database_preference': ('lipyd.lipid', 'SwissLipids', 'LipidMaps'),
+    # number of processes generating the lipid series in moldb
+    'moldb_processes': 1,
+    # save the generated lipid series into the cache directory
+    'moldb_series_cache': True,
     # lipyd specific defaults for OpenMS methods
     'peak_picking_param': {
         'signal_to_noise': 0.0,
@@ -700,6 +746,7 @@ def reset_all():
         )
     
     globals()['settings'] = settings
+    _changed()
 
 
 def setup(**kwargs):
@@ -718,6 +765,8 @@ def setup(**kwargs):
     for param, value in iteritems(kwargs):
         
         setattr(settings, param, value)
+    
+    _changed()
 
 def get(param):
     """
@@ -780,7 +829,128 @@ def reset(param):
     Resets the value of the parameter to its default.
     """
     
-    setup(param, get_default(param))
+    setup(**{param: get_default(param)})
+
+
+#: Incremented at each change of the settings by ``setup``, ``reset``
+#: or ``reset_all``.
+version = 0
+# frozen values of the current version
+_frozen = {}
+
+
+def _changed():
+    
+    global version
+    
+    version += 1
+    _frozen.clear()
+
+
+def _freeze(value):
+    """
+    Returns an immutable copy of a value: dicts become read-only
+    mappings, lists tuples and sets frozensets, recursively.
+    """
+    
+    if isinstance(value, (dict, types.MappingProxyType)):
+        
+        return types.MappingProxyType(
+            dict((k, _freeze(v)) for k, v in iteritems(value))
+        )
+    
+    if isinstance(value, (list, tuple)) and not hasattr(value, '_fields'):
+        
+        return tuple(_freeze(v) for v in value)
+    
+    if isinstance(value, (set, frozenset)):
+        
+        return frozenset(_freeze(v) for v in value)
+    
+    return value
+
+
+def frozen(param):
+    """
+    Returns the current value of a parameter without copying it.
+    Instead of the deep copy returned by ``get``, here the value is
+    made immutable once for each version of the settings and the same
+    object is returned until the settings change.
+    
+    Parameters
+    ----------
+    param : str
+        Name of a parameter in the settings.
+    
+    Returns
+    -------
+    Immutable version of the current value of the parameter.
+    """
+    
+    if param not in _frozen:
+        
+        if (
+            not isinstance(param, common.basestring) or
+            not hasattr(settings, param)
+        ):
+            
+            return None
+        
+        _frozen[param] = _freeze(getattr(settings, param))
+    
+    return _frozen[param]
+
+
+class Snapshot(object):
+    """
+    Read-only view of the settings for code called many times. The
+    parameters are available as attributes and by item access, their
+    values are returned by ``frozen``, hence they are never copied but
+    the snapshot still follows the changes made by ``setup``. The
+    ``version`` attribute is the version of the settings at the time
+    the snapshot has been taken.
+    """
+    
+    def __init__(self):
+        
+        self.version = version
+    
+    def __getattr__(self, param):
+        
+        if param.startswith('__'):
+            
+            raise AttributeError(param)
+        
+        return self[param]
+    
+    def __getitem__(self, param):
+        
+        if not hasattr(settings, param):
+            
+            raise KeyError(param)
+        
+        return frozen(param)
+    
+    def __contains__(self, param):
+        
+        return hasattr(settings, param)
+    
+    @property
+    def current(self):
+        """
+        Tells if the settings have not changed since the snapshot
+        has been taken.
+        """
+        
+        return self.version == version
+
+
+def snapshot():
+    """
+    Returns a read-only ``Snapshot`` of the settings.
+    """
+    
+    return Snapshot()
 
 
 defaults = common._const()
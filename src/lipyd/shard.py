@@ -0,0 +1,555 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://denes.omnipathdb.org/
+#
+
+"""
+Sharded execution of the database lookup and MS2 identification of the
+features of a ``Sample`` or ``SampleSet``, e.g. on many machines.
+
+The features are split into shards by their m/z, each shard is a
+contiguous m/z range with about the same number of features. For each
+shard a job file is written, a job file contains everything necessary
+for processing the shard: the m/z and RT values, the paths to the MGF
+files and the settings. The jobs are processed independently by
+calling ``python -m lipyd.shard <job file>``, each writes a result file.
+Finally the results are merged into the ``FeatureAttributes`` of the
+sample in the original order of the features::
+    
+    jobs = shard.write_jobs(sampleset, 4, 'plate01')
+    # on the nodes, e.g. `python -m lipyd.shard plate01.shard0.job`
+    shard.merge(sampleset, [shard.result_fname(job) for job in jobs])
+
+The job and result files are pickles, the MGF files must be available at
+the same paths on all machines.
+"""
+
+import os
+import sys
+import pickle
+import argparse
+
+import numpy as np
+
+import lipyd.session as session
+import lipyd.settings as settings
+import lipyd.moldb as moldb
+import lipyd.mgf as mgf
+import lipyd.ms2 as ms2
+import lipyd._version as _version
+
+
+#: Settings transferred from the coordinator to the shard processes
+_shard_settings = ms2._identification_settings + (
+    'ms2_cluster_scans',
+    'ms2_check_rt',
+    'adducts_constraints',
+    # database lookup
+    'adducts_default',
+    'adduct_constraints',
+    'ex2ad',
+    'ad2ex',
+    'database_preference',
+    'lipidmaps_url',
+    'lipidmaps_fname',
+    'swisslipids_url',
+)
+#: Attributes of ``mgf.MgfReader`` objects transferred to the shards
+_reader_attrs = ('label', 'charge', 'rt_tolerance', 'drift', 'tolerance')
+
+
+def assign_shards(mzs, nshards):
+    """
+    Splits features into shards by m/z. Each shard is a contiguous m/z
+    range, the number of features in the shards differ at most by one.
+    
+    Returns
+    -------
+    Array with the shard number of each feature.
+    """
+    
+    mzs = np.asarray(mzs)
+    ranks = np.empty(len(mzs), dtype = np.int64)
+    ranks[np.argsort(mzs, kind = 'mergesort')] = np.arange(len(mzs))
+    
+    return ranks * nshards // max(len(mzs), 1)
+
+
+def _portable_resources(resources):
+    """
+    Replaces the ``MgfReader`` objects in a ``dict`` of MS2 resources by
+    the absolute paths of their files and their parameters, e.g. the
+    drift and tolerance after recalibration. For resources given as
+    paths the parameters are ``None``.
+    """
+    
+    portable = {}
+    
+    for sample_id, sample_resources in resources.items():
+        
+        if not isinstance(sample_resources, (list, tuple, set)):
+            
+            sample_resources = [sample_resources]
+        
+        portable[sample_id] = [
+            (
+                os.path.abspath(res.fname),
+                dict((attr, getattr(res, attr)) for attr in _reader_attrs),
+            )
+                if isinstance(res, mgf.MgfReader) else
+            (os.path.abspath(res), None)
+            for res in sample_resources
+        ]
+    
+    return portable
+
+
+def _readers(resources):
+    """
+    Creates the ``MgfReader`` objects from resources processed by
+    ``_portable_resources``.
+    """
+    
+    return dict(
+        (
+            sample_id,
+            [
+                fname
+                    if reader_args is None else
+                mgf.MgfReader(fname, **reader_args)
+                for fname, reader_args in sample_resources
+            ]
+        )
+        for sample_id, sample_resources in resources.items()
+    )
+
+
+def _database_args():
+    """
+    The arguments of the module's default database in ``moldb`` if it
+    has been initialized, otherwise ``None``.
+    """
+    
+    if not hasattr(moldb, 'db'):
+        
+        return None
+    
+    return dict(
+        (attr, getattr(moldb.db, attr))
+        for attr in (
+            'resources',
+            'tolerance',
+            'fa_args',
+            'sph_args',
+            'database_preference',
+        )
+    )
+
+
+def make_jobs(
+        mzs,
+        ionmode,
+        resources,
+        nshards,
+        rts = None,
+        check_rt = True,
+        database_args = None,
+        adduct_constraints = True,
+        charge = None,
+        tolerance = None,
+    ):
+    """
+    Creates the jobs for processing the features in ``nshards`` shards.
+    
+    Parameters
+    ----------
+    mzs : numpy.ndarray
+        m/z values of the features.
+    ionmode : str
+        Ion mode, either ``pos`` or ``neg``.
+    resources : dict
+        MS2 resources in the same format as for ``ms2.MS2Feature``.
+    nshards : int
+        Number of shards.
+    rts : numpy.ndarray
+        Retention times of the features.
+    check_rt : bool
+        Use only the scans within the RT range of the features.
+    database_args : dict
+        Arguments for ``moldb.init_db``. By default the arguments of the
+        database already initialized in ``moldb`` or if there is none
+        the database is built with the default arguments.
+    adduct_constraints, charge, tolerance :
+        Passed to ``moldb.adduct_lookup_many``.
+    
+    Returns
+    -------
+    List of dicts, one job for each shard.
+    """
+    
+    mzs = np.asarray(mzs)
+    rts = np.full(len(mzs), None) if rts is None else np.asarray(rts)
+    shards = assign_shards(mzs, nshards)
+    resources = _portable_resources(resources)
+    database_args = (
+        _database_args() if database_args is None else database_args
+    )
+    shard_settings = dict(
+        (param, settings.get(param))
+        for param in _shard_settings
+    )
+    
+    return [
+        {
+            'shard': shard,
+            'nshards': nshards,
+            'nfeatures': len(mzs),
+            'features': np.where(shards == shard)[0],
+            'mzs': mzs[shards == shard],
+            'rts': rts[shards == shard],
+            'ionmode': ionmode,
+            'resources': resources,
+            'check_rt': check_rt,
+            'database_args': database_args,
+            'lookup_args': {
+                'adduct_constraints': adduct_constraints,
+                'charge': charge,
+                'tolerance': tolerance,
+            },
+            'settings': shard_settings,
+            'version': _version.__version__,
+        }
+        for shard in range(nshards)
+    ]
+
+
+def job_fname(prefix, shard):
+    
+    return '%s.shard%u.job' % (prefix, shard)
+
+
+def result_fname(fname):
+    """
+    The default name of the result file of a job file.
+    """
+    
+    return '%s.result' % os.path.splitext(fname)[0]
+
+
+def _dump(obj, fname):
+    
+    dirname = os.path.dirname(os.path.abspath(fname))
+    os.makedirs(dirname, exist_ok = True)
+    # readers should never see a partially written file
+    tmpfile = '%s.%u.tmp' % (fname, os.getpid())
+    
+    with open(tmpfile, 'wb') as fp:
+        
+        pickle.dump(obj, fp, protocol = pickle.HIGHEST_PROTOCOL)
+    
+    os.replace(tmpfile, fname)
+
+
+def _load(fname):
+    
+    with open(fname, 'rb') as fp:
+        
+        return pickle.load(fp)
+
+
+def write_jobs(sample, nshards, prefix, resources = None, **kwargs):
+    """
+    Writes the job files for processing the features of a sample in
+    ``nshards`` shards.
+    
+    Parameters
+    ----------
+    sample : sample.Sample
+        A ``Sample`` or ``SampleSet`` object, its MS2 sources must be set
+        unless ``resources`` are provided.
+    nshards : int
+        Number of shards.
+    prefix : str
+        Prefix of the job file names, the shard number and the
+        extension are appended to it.
+    resources : dict
+        MS2 resources, by default the MS2 sources of the sample.
+    **kwargs
+        Passed to ``make_jobs``.
+    
+    Returns
+    -------
+    List of the job file names.
+    """
+    
+    jobs = make_jobs(
+        mzs = sample.mzs,
+        ionmode = sample.ionmode,
+        resources = sample.get_ms2_resources(resources),
+        nshards = nshards,
+        rts = sample.feattrs.rt_means,
+        check_rt = sample.ms2_check_rt,
+        **kwargs
+    )
+    
+    return save_jobs(jobs, prefix)
+
+
+def save_jobs(jobs, prefix):
+    """
+    Writes jobs created by ``make_jobs`` into files.
+    
+    Returns
+    -------
+    List of the job file names.
+    """
+    
+    fnames = []
+    
+    for job in jobs:
+        
+        fname = job_fname(prefix, job['shard'])
+        _dump(job, fname)
+        fnames.append(fname)
+    
+    return fnames
+
+
+def run_job(job, output = None, checkpoint = None):
+    """
+    Processes the features of one shard: looks them up in the database
+    and runs the MS2 identification.
+    
+    Parameters
+    ----------
+    job : str,dict
+        A job or the path to a job file.
+    output : str
+        Path to the result file. By default next to the job file with
+        ``.result`` extension.
+    checkpoint : str
+        Path to a checkpoint file, see ``ms2.analyse_features``.
+    
+    Returns
+    -------
+    The path to the result file if ``job`` is a file name or ``output``
+    is provided, otherwise the result as a ``dict``.
+    """
+    
+    log = session.Logger(name = 'shard')
+    
+    if not isinstance(job, dict):
+        
+        output = output or result_fname(job)
+        job = _load(job)
+    
+    if job['version'] != _version.__version__:
+        
+        log._log(
+            'Job created by lipyd version %s, '
+            'processing it with version %s.' % (
+                job['version'],
+                _version.__version__,
+            )
+        )
+    
+    settings.setup(**job['settings'])
+    
+    if job['database_args'] is not None:
+        
+        moldb.init_db(**(job['database_args'] or {}))
+    
+    log._log(
+        'Processing shard %u of %u: %u features.' % (
+            job['shard'],
+            job['nshards'],
+            len(job['features']),
+        )
+    )
+    
+    records = moldb.adduct_lookup_many(
+        job['mzs'],
+        ionmode = job['ionmode'],
+        **job['lookup_args']
+    )
+    ms2_identities = ms2.analyse_features(
+        mzs = job['mzs'],
+        ionmode = job['ionmode'],
+        resources = _readers(job['resources']),
+        rts = job['rts'],
+        ms1_records = records,
+        check_rt = job['check_rt'],
+        keep_scans = False,
+        checkpoint = checkpoint,
+    )
+    
+    result = {
+        'shard': job['shard'],
+        'nshards': job['nshards'],
+        'nfeatures': job['nfeatures'],
+        'features': job['features'],
+        'mzs': job['mzs'],
+        'records': records,
+        'ms2_identities': ms2_identities,
+        'version': _version.__version__,
+    }
+    
+    if output:
+        
+        _dump(result, output)
+        
+        return output
+    
+    return result
+
+
+def merge_results(results, nfeatures = None, mzs = None):
+    """
+    Merges the results of the shards.
+    
+    Parameters
+    ----------
+    results : list
+        Results as returned by ``run_job`` or paths to result files.
+    nfeatures : int
+        Number of features. By default taken from the results.
+    mzs : numpy.ndarray
+        m/z values of the features, if provided the results are checked
+        if they belong to the same features.
+    
+    Returns
+    -------
+    Tuple of two arrays in the order of the features: database records
+    and MS2 identification results.
+    """
+    
+    results = [
+        res if isinstance(res, dict) else _load(res)
+        for res in results
+    ]
+    
+    nfeatures = nfeatures or (results[0]['nfeatures'] if results else 0)
+    
+    if any(res['nfeatures'] != nfeatures for res in results):
+        
+        raise RuntimeError(
+            'Shard results are from a different number of features.'
+        )
+    
+    features = np.concatenate(
+        [res['features'] for res in results] +
+        [np.array([], dtype = np.int64)]
+    )
+    
+    if (
+        len(features) != nfeatures or
+        not np.array_equal(np.sort(features), np.arange(nfeatures))
+    ):
+        
+        raise RuntimeError(
+            'Shard results do not cover each of the %u features '
+            'exactly once.' % nfeatures
+        )
+    
+    records = np.empty(nfeatures, dtype = object)
+    ms2_identities = np.empty(nfeatures, dtype = object)
+    
+    for res in results:
+        
+        if mzs is not None and not np.allclose(
+            np.asarray(mzs)[res['features']].astype(np.float64),
+            np.asarray(res['mzs']).astype(np.float64),
+        ):
+            
+            raise RuntimeError(
+                'Result of shard %u belongs to different features.' % (
+                    res['shard']
+                )
+            )
+        
+        for i, rec, ms2_id in zip(
+            res['features'],
+            res['records'],
+            res['ms2_identities'],
+        ):
+            
+            records[i] = rec
+            ms2_identities[i] = ms2_id
+    
+    return records, ms2_identities
+
+
+def merge(sample, results):
+    """
+    Merges the results of the shards into the ``FeatureAttributes`` of
+    a sample. The features of the sample must be in the same order as
+    at writing the jobs.
+    
+    Parameters
+    ----------
+    sample : sample.Sample
+        The ``Sample`` or ``SampleSet`` the jobs were created from.
+    results : list
+        Results as returned by ``run_job`` or paths to result files.
+    """
+    
+    records, ms2_identities = merge_results(
+        results,
+        nfeatures = len(sample.mzs),
+        mzs = sample.mzs,
+    )
+    
+    sample.feattrs._add_var(records, 'records')
+    sample.feattrs._add_var(ms2_identities, 'ms2_identities')
+
+
+def main(argv = None):
+    """
+    Command line entry point for processing one shard.
+    """
+    
+    parser = argparse.ArgumentParser(
+        prog = 'python -m lipyd.shard',
+        description = (
+            'Database lookup and MS2 identification of one shard '
+            'of features.'
+        ),
+    )
+    parser.add_argument('job', help = 'Path to the job file.')
+    parser.add_argument(
+        '-o', '--output',
+        help = 'Path to the result file, by default `<job>.result`.',
+    )
+    parser.add_argument(
+        '-c', '--checkpoint',
+        help = 'Path to a checkpoint file to resume interrupted runs.',
+    )
+    
+    args = parser.parse_args(argv)
+    
+    output = run_job(
+        args.job,
+        output = args.output,
+        checkpoint = args.checkpoint,
+    )
+    
+    sys.stdout.write('%s\n' % output)
+
+
+if __name__ == '__main__':
+    
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://denes.omnipathdb.org/
+#
+
+"""
+Read only numpy arrays shared by many processes in memory mapped files.
+
+Large data, e.g. the molecule and the fragment databases, are written
+once into a file by ``save``, then any number of processes map the same
+file by ``load``. The arrays are not copied, the operating system keeps
+only one copy of the pages in the memory. By default the files are
+created in ``/dev/shm`` which is in the memory on Linux. Small, not
+numeric data are stored in a pickled header at the beginning of the file.
+"""
+
+import os
+import pickle
+import struct
+import tempfile
+
+import numpy as np
+
+
+_MAGIC = b'LIPYDSHM'
+#: Alignment of the arrays in the file in bytes
+_ALIGN = 64
+
+
+def _aligned(n):
+    
+    return -(-n // _ALIGN) * _ALIGN
+
+
+def default_dir():
+    """
+    The directory for the shared files: ``/dev/shm`` if available,
+    otherwise the default temporary directory.
+    """
+    
+    return (
+        '/dev/shm'
+            if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else
+        tempfile.gettempdir()
+    )
+
+
+def new_fname(prefix):
+    """
+    Creates a new, empty file in ``default_dir`` and returns its path.
+    """
+    
+    fd, fname = tempfile.mkstemp(
+        prefix = 'lipyd_%s_' % prefix,
+        suffix = '.shm',
+        dir = default_dir(),
+    )
+    os.close(fd)
+    
+    return fname
+
+
+def save(fname, arrays, meta = None):
+    """
+    Writes numpy arrays and arbitrary picklable data into a file which
+    can be mapped by ``load``.
+    
+    Parameters
+    ----------
+    fname : str
+        Path to the file.
+    arrays : dict
+        Numpy arrays by their names, object arrays are not allowed.
+    meta : object
+        Any picklable object stored along with the arrays.
+    
+    Returns
+    -------
+    The path to the file.
+    """
+    
+    arrays = [
+        (name, np.ascontiguousarray(arr))
+        for name, arr in arrays.items()
+    ]
+    layout = []
+    offset = 0
+    
+    for name, arr in arrays:
+        
+        if arr.dtype.hasobject:
+            
+            raise ValueError(
+                'Object arrays can not be shared: `%s`.' % name
+            )
+        
+        layout.append((name, arr.dtype.str, arr.shape, offset))
+        offset += _aligned(arr.nbytes)
+    
+    header = pickle.dumps(
+        {'layout': layout, 'meta': meta},
+        protocol = pickle.HIGHEST_PROTOCOL,
+    )
+    data_start = _aligned(len(_MAGIC) + 8 + len(header))
+    # other processes should never map a partially written file
+    tmpfile = '%s.%u.tmp' % (fname, os.getpid())
+    
+    with open(tmpfile, 'wb') as fp:
+        
+        fp.write(_MAGIC)
+        fp.write(struct.pack('<Q', len(header)))
+        fp.write(header)
+        
+        for (name, arr), (_name, dtype, shape, arr_offset) in zip(
+            arrays,
+            layout,
+        ):
+            
+            fp.seek(data_start + arr_offset)
+            fp.write(arr.tobytes())
+        
+        fp.truncate(data_start + offset)
+    
+    os.replace(tmpfile, fname)
+    
+    return fname
+
+
+def load(fname):
+    """
+    Maps the arrays from a file written by ``save``.
+    
+    Returns
+    -------
+    Tuple of a dict of read only arrays and the data stored as ``meta``.
+    """
+    
+    with open(fname, 'rb') as fp:
+        
+        if fp.read(len(_MAGIC)) != _MAGIC:
+            
+            raise ValueError('Not a lipyd shared arrays file: `%s`.' % fname)
+        
+        size = struct.unpack('<Q', fp.read(8))[0]
+        header = pickle.loads(fp.read(size))
+    
+    data_start = _aligned(len(_MAGIC) + 8 + size)
+    mmap = np.memmap(fname, dtype = np.uint8, mode = 'r')
+    arrays = {}
+    
+    for name, dtype, shape, offset in header['layout']:
+        
+        dtype = np.dtype(dtype)
+        start = data_start + offset
+        end = start + int(np.prod(shape)) * dtype.itemsize
+        arrays[name] = (
+            mmap[start:end].view(dtype = dtype, type = np.ndarray).
+            reshape(shape)
+        )
+    
+    return arrays, header['meta']
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://denes.omnipathdb.org/
+#
+
+"""
+Opt-in instrumentation of the processing stages. Stages are measured
+by the ``timer`` context manager or the ``timed`` decorator, both collect
+the number of calls, the wall time and the CPU time per stage name.
+Arbitrary events can be counted by ``count``. When disabled (default)
+the decorated functions are called directly after checking one flag.
+
+Enable by ``timing.enable()`` or by the ``timing`` setting, and export
+the results by ``timing.export('report.json')``.
+"""
+
+from future.utils import iteritems
+
+import time
+import json
+import inspect
+import functools
+
+import lipyd.settings as settings
+
+__all__ = [
+    'enable', 'disable', 'is_enabled', 'reset',
+    'timer', 'timed', 'count', 'report', 'export',
+]
+
+
+# stage name -> [calls, wall time, cpu time]
+_stages = {}
+# counter name -> count
+_counters = {}
+
+
+def enable():
+    """
+    Starts collecting timings and counts, by setting the ``timing``
+    setting.
+    """
+    
+    settings.setup(timing = True)
+
+
+def disable():
+    """
+    Stops collecting timings and counts, the data collected so far
+    is kept.
+    """
+    
+    settings.setup(timing = False)
+
+
+def is_enabled():
+    
+    # the setting can be changed any time, e.g. by `settings.setup`
+    return bool(settings.frozen('timing'))
+
+
+def reset():
+    """
+    Drops all timings and counts collected so far.
+    """
+    
+    _stages.clear()
+    _counters.clear()
+
+
+def _record(name, wall, cpu):
+    
+    stage = _stages.get(name)
+    
+    if stage is None:
+        
+        _stages[name] = [1, wall, cpu]
+        
+    else:
+        
+        stage[0] += 1
+        stage[1] += wall
+        stage[2] += cpu
+
+
+def count(name, n = 1):
+    """
+    Increases the counter ``name`` by ``n``.
+    """
+    
+    if is_enabled():
+        
+        _counters[name] = _counters.get(name, 0) + n
+
+
+class timer(object):
+    
+    
+    def __init__(self, name):
+        """
+        Context manager measuring the wall and CPU time spent in its
+        block under the stage ``name``.
+        """
+        
+        self.name = name
+        self._start = None
+    
+    
+    def __enter__(self):
+        
+        if is_enabled():
+            
+            self._start = (time.perf_counter(), time.process_time())
+        
+        return self
+    
+    
+    def __exit__(self, *args):
+        
+        if self._start is not None:
+            
+            wall0, cpu0 = self._start
+            self._start = None
+            
+            _record(
+                self.name,
+                time.perf_counter() - wall0,
+                time.process_time() - cpu0,
+            )
+
+
+def timed(name = None, per_class = False):
+    """
+    Decorator measuring the time spent in a function or method.
+    For generator functions the time spent in the generator while
+    it is consumed is measured.
+    
+    Parameters
+    ----------
+    name : str
+        Stage name, by default the qualified name of the function.
+    per_class : bool
+        For methods: append the name of the class of the instance to the
+        stage name, so methods inherited by many classes are recorded
+        separately for each class.
+    """
+    
+    def decorator(func):
+        
+        label = name or '%s.%s' % (func.__module__, func.__qualname__)
+        
+        def _label(args):
+            
+            return (
+                '%s.%s' % (label, args[0].__class__.__name__)
+                    if per_class and args else
+                label
+            )
+        
+        if inspect.isgeneratorfunction(func):
+            
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                
+                if not is_enabled():
+                    
+                    return func(*args, **kwargs)
+                
+                return _timed_generator(
+                    _label(args),
+                    func(*args, **kwargs),
+                )
+            
+        else:
+            
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                
+                if not is_enabled():
+                    
+                    return func(*args, **kwargs)
+                
+                with timer(_label(args)):
+                    
+                    return func(*args, **kwargs)
+        
+        return wrapper
+    
+    return decorator
+
+
+def _timed_generator(name, gen):
+    """
+    Yields the elements of a generator and records the time spent in
+    the generator as one call.
+    """
+    
+    wall = cpu = 0.
+    
+    try:
+        
+        while True:
+            
+            wall0, cpu0 = time.perf_counter(), time.process_time()
+            
+            try:
+                
+                item = next(gen)
+                
+            except StopIteration:
+                
+                break
+                
+            finally:
+                
+                wall += time.perf_counter() - wall0
+                cpu  += time.process_time() - cpu0
+            
+            yield item
+        
+    finally:
+        
+        _record(name, wall, cpu)
+
+
+def report():
+    """
+    Returns the collected timings and counts as a dict which can be
+    serialized as JSON.
+    """
+    
+    return {
+        'enabled': is_enabled(),
+        'stages': dict(
+            (
+                name,
+                {
+                    'calls': calls,
+                    'wall': wall,
+                    'cpu': cpu,
+                    'wall_mean': wall / calls if calls else 0.,
+                }
+            )
+            for name, (calls, wall, cpu) in iteritems(_stages)
+        ),
+        'counters': dict(_counters),
+    }
+
+
+def export(fname):
+    """
+    Writes the report into a JSON file.
+    """
+    
+    with open(fname, 'w') as fp:
+        
+        json.dump(report(), fp, indent = 2, sort_keys = True)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://www.ebi.ac.uk/~denes
+#
+
+"""
+Benchmark of the identification of the MS2 spectra in the bundled
+``ms2_examples``, scan by scan and in one batch. Not collected by pytest,
+run it by ``python -m test.bench_identify`` from the ``src`` directory.
+"""
+
+import os
+import sys
+import timeit
+
+import lipyd.common as common
+import lipyd.mgf as mgf
+import lipyd.ms2 as ms2
+
+
+def example_scans():
+    """
+    Reads all scans of the example MGF files.
+    """
+    
+    scans = []
+    
+    for mgfname, ionmode in (
+        ('neg_examples.mgf', 'neg'),
+        ('pos_examples.mgf', 'pos'),
+    ):
+        
+        mgfpath = os.path.join(common.ROOT, 'data', 'ms2_examples', mgfname)
+        reader = mgf.MgfReader(mgfpath, charge = None)
+        
+        for scan_id in sorted(set(int(i) for i in reader.mgfindex[:,3])):
+            
+            scans.append(ms2.Scan.from_mgf(mgfpath, scan_id, ionmode))
+    
+    return scans
+
+
+def bench(repeat = 3):
+    """
+    Prints the time of identifying all example scans one by one
+    and by ``ms2.identify_batch``.
+    """
+    
+    scans = example_scans()
+    
+    timings = [
+        min(timeit.repeat(proc, number = 1, repeat = repeat))
+        for proc in (
+            lambda: [scan.identify() for scan in scans],
+            lambda: ms2.identify_batch(scans),
+        )
+    ]
+    
+    sys.stdout.write(
+        '%6s %14s %14s\n%6u %13.03fs %13.03fs\n' % (
+            ('scans', 'identify', 'identify_batch', len(scans)) +
+            tuple(timings)
+        )
+    )
+
+
+if __name__ == '__main__':
+    
+    bench()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://www.ebi.ac.uk/~denes
+#
+
+"""
+Micro-benchmark of the scalar and the vectorized lookups of the
+``lipyd.lookup`` module across array sizes. Not collected by pytest,
+run it by ``python -m test.bench_lookup`` from the ``src`` directory.
+"""
+
+import sys
+import timeit
+
+import numpy as np
+
+import lipyd.lookup as lookup
+
+
+def bench(sizes = (1000, 10000, 100000, 1000000), nqueries = 10000,
+          tolerance = 10, repeat = 3):
+    """
+    Prints the time of looking up ``nqueries`` random values in sorted
+    random arrays of each size, one by one and at once.
+    """
+    
+    np.random.seed(0)
+    ms = np.random.uniform(100, 1000, nqueries)
+    
+    sys.stdout.write(
+        '%10s %14s %14s %14s %14s\n' % (
+            'size', 'findall', 'findall_many', 'find', 'find_many',
+        )
+    )
+    
+    for size in sizes:
+        
+        a = np.sort(np.random.uniform(100, 1000, size))
+        
+        timings = [
+            min(timeit.repeat(proc, number = 1, repeat = repeat))
+            for proc in (
+                lambda: [lookup.findall(a, m, tolerance) for m in ms],
+                lambda: lookup.findall_many(a, ms, tolerance),
+                lambda: [lookup.find(a, m, tolerance) for m in ms],
+                lambda: lookup.find_many(a, ms, tolerance),
+            )
+        ]
+        
+        sys.stdout.write(
+            '%10u %13.03fs %13.03fs %13.03fs %13.03fs\n' % (
+                (size,) + tuple(timings)
+            )
+        )
+
+
+if __name__ == '__main__':
+    
+    bench()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://www.ebi.ac.uk/~denes
+#
+
+import pytest
+
+import numpy as np
+
+import lipyd.align as align
+
+
+class TestAlign(object):
+    """ """
+    
+    def test_align(self):
+        """ """
+        
+        a0 = np.array([100.0, 200.0, 300.0])
+        a1 = np.array([300.0005, 100.0003, 250.0])
+        a2 = np.array([100.0004, 100.0001, np.nan])
+        
+        means, idx = align.align(a0, a1, a2, tolerance = 5)
+        
+        assert idx.shape == (5, 3)
+        assert np.all(np.diff(means) > 0)
+        # 100.0003 is closer to 100.0004 than to 100.0001
+        assert list(idx[0]) == [0, -1, 1]
+        assert list(idx[1]) == [-1, 1, 0]
+        assert list(idx[4]) == [2, 0, -1]
+    
+    def test_align_nearest(self):
+        """ """
+        
+        a0 = np.array([100., 100.0004, 100.0008])
+        a1 = np.array([100.0004])
+        
+        means, idx = align.align(a0, a1, tolerance = 5)
+        
+        assert idx.shape == (3, 2)
+        assert list(idx[:,1]) == [-1, 0, -1]
+        assert list(idx[1]) == [1, 0]
+    
+    def test_align_tolerance(self):
+        """ """
+        
+        # chain of values each within 5 ppm of the next one
+        # but spanning much wider range
+        a0 = 100. + np.arange(10) * 0.0004
+        
+        means, idx = align.align(a0, tolerance = 5)
+        mzs = align.values(idx, a0)
+        
+        assert idx.shape[0] > 1
+        assert np.all(
+            (np.nanmax(mzs, axis = 1) - np.nanmin(mzs, axis = 1)) <=
+            means * 5e-6
+        )
+    
+    def test_values(self):
+        """ """
+        
+        a0 = np.array([300., 100.])
+        a1 = np.array([100.0002])
+        
+        means, idx = align.align(a0, a1)
+        mzs = align.values(idx, a0, a1)
+        
+        assert mzs.shape == (2, 2)
+        assert mzs[0, 0] == 100. and mzs[0, 1] == 100.0002
+        assert np.isnan(mzs[1, 1])
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://denes.omnipathdb.org/
+#
+
+import os
+
+import lipyd.checkpoint as checkpoint
+
+
+class TestCheckpoint(object):
+    
+    
+    def test_append_resume(self, tmpdir):
+        
+        fname = os.path.join(str(tmpdir), 'ms2.checkpoint')
+        
+        with checkpoint.CheckpointStore(fname) as store:
+            
+            store.append(0, 'a', {'PC(34:1)': ()})
+            store.append(1, 'b', [1, 2])
+            store.append(0, 'c', 'recalculated')
+        
+        store = checkpoint.CheckpointStore(fname)
+        
+        assert len(store) == 2
+        assert store.get(0, 'a') is None
+        assert store.get(0, 'c') == 'recalculated'
+        assert store.get(1, 'b') == [1, 2]
+        assert store.get(2, 'b') is None
+        
+        store.close()
+    
+    def test_truncated(self, tmpdir):
+        
+        fname = os.path.join(str(tmpdir), 'ms2.checkpoint')
+        
+        with checkpoint.CheckpointStore(fname) as store:
+            
+            store.append(0, 'a', 'first')
+            size = os.path.getsize(fname)
+            store.append(1, 'a', 'second' * 100)
+        
+        # as if the process had been killed while writing
+        with open(fname, 'r+b') as fp:
+            
+            fp.truncate(size + 20)
+        
+        store = checkpoint.CheckpointStore(fname)
+        
+        assert 0 in store
+        assert 1 not in store
+        assert os.path.getsize(fname) == size
+        
+        store.append(1, 'a', 'second')
+        store.close()
+        
+        assert checkpoint.CheckpointStore(fname).get(1, 'a') == 'second'
+    
+    def test_digest(self):
+        
+        assert checkpoint.digest(1, 'a', (2.0,)) == checkpoint.digest(
+            1, 'a', (2.0,)
+        )
+        assert checkpoint.digest(1, 'a') != checkpoint.digest(1, 'b')
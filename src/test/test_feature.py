@@ -110,3 +110,27 @@ class TestFeature(object):
                 True,  True, False, False, False
             ])
         )
+    
+    def test_peak_size_vectorized(self):
+        """ """
+        
+        fea = feature.PeakSize(
+            samples = self.samples,
+            sample_selection = self.protein_samples.selection,
+            names = ('peaksize_v', 'peaksize_value_v'),
+        )
+        fea = feature.PeakSize(
+            samples = self.samples,
+            sample_selection = self.protein_samples.selection,
+            names = ('peaksize_f', 'peaksize_value_f'),
+            vectorized = False,
+        )
+        
+        assert np.all(
+            self.samples.feattrs.peaksize_v ==
+            self.samples.feattrs.peaksize_f
+        )
+        assert np.allclose(
+            self.samples.feattrs.peaksize_value_v,
+            self.samples.feattrs.peaksize_value_f,
+        )
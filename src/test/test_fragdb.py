@@ -67,3 +67,49 @@ class TestFragdb(object):
         assert '[FA(14:0)+NH+C2H2-OH]+' in fragnames
         assert '[Sph(18:1)-2xH2O+H]+' in fragnames
         assert len(list(annot)) == len(annot.mzs)
+    
+    def test_annotate_vectorized(self):
+        """ """
+        
+        precursor = 590.45536
+        scan = self.mgfreader.scan_by_id(1941)
+        
+        annot = fragdb.FragmentAnnotator(
+            mzs = scan[:,0],
+            ionmode = 'pos',
+            precursor = precursor
+        )
+        
+        assert list(annot) == [annot.annotate(mz) for mz in scan[:,0]]
+        assert (
+            fragdb.FragmentAnnotator(scan[:,0], 'pos').neutral_losses() ==
+            [()] * len(scan)
+        )
+        
+        for nl, charged in zip(
+            annot.neutral_losses(precursor = precursor + 18.0106),
+            annot.charged(),
+        ):
+            
+            assert all(a.charge == 0 for a in nl)
+            assert all(a.charge != 0 for a in charged)
+    
+    def test_shared(self, tmpdir):
+        
+        db = fragdb.get_db('pos')
+        fname = db.share(os.path.join(str(tmpdir), 'fragdb.shm'))
+        shared_db = fragdb.FragmentDatabaseAggregator.attach(fname)
+        
+        assert shared_db.ionmode == 'pos'
+        assert len(shared_db) == len(db)
+        assert repr(shared_db.fragments.tolist()) == repr(db.fragments.tolist())
+        assert shared_db.constraints == db.constraints
+        
+        scan = self.mgfreader.scan_by_id(1941)
+        
+        assert repr(shared_db.lookup_many(scan[:,0])) == repr(
+            db.lookup_many(scan[:,0])
+        )
+        assert repr(shared_db.lookup_nl_many(scan[:,0], 590.45536)) == repr(
+            db.lookup_nl_many(scan[:,0], 590.45536)
+        )
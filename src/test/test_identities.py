@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://www.ebi.ac.uk/~denes
+#
+
+import pytest
+
+import os
+import random
+
+import numpy as np
+
+import lipyd.ms2 as ms2
+import lipyd.lipproc as lipproc
+import lipyd.identities as identities
+
+
+names = [
+    'PC(36:2)',
+    'PC(18:1/18:1)',
+    'PC(16:0/20:2)',
+    'PE(38:4)',
+    'PE(18:0/20:4)',
+    'Cer(d18:1/16:0)',
+    'SM(d34:1)',
+]
+
+
+def random_feature(lipids):
+    
+    fe = ms2.MS2Feature.__new__(ms2.MS2Feature)
+    fe.add_precursor_details = random.random() < .5
+    fe.identities = []
+    
+    for _ in range(random.randint(0, 4)):
+        
+        scan = {}
+        
+        for _ in range(random.randint(0, 3)):
+            
+            hg, chainsum, chains = random.choice(lipids)
+            key = lipproc.summary_str(hg, chainsum)
+            score = random.choice([0, 5, 10, 15])
+            
+            scan[key] = tuple(
+                ms2.MS2Identity(
+                    score,
+                    20,
+                    score / 20. * 100,
+                    hg,
+                    chainsum,
+                    chains = chains if random.random() < .5 else None,
+                    chain_details = ms2.ChainIdentificationDetails(
+                        rank = (random.choice([None, 0, 1, 2]), None),
+                    ),
+                    scan_details = ms2.ScanDetails(
+                        sample_id = ('A', random.randint(1, 12)),
+                        scan_id = random.randint(1, 900),
+                        deltart = random.choice([-.3, -.1, .1, .2]),
+                    ),
+                    precursor_details = ms2.PrecursorDetails(
+                        adduct = '[M+H]+',
+                        error = random.uniform(-5, 5),
+                    ),
+                )
+                for _ in range(random.randint(1, 3))
+            )
+        
+        fe.identities.append(scan)
+    
+    return fe
+
+
+class TestIdentityTable(object):
+    
+    
+    @pytest.fixture(autouse = True)
+    def features(self):
+        
+        random.seed(1)
+        lipids = [lipproc.str2lipid(name) for name in names]
+        self.features = [random_feature(lipids) for _ in range(300)]
+        self.table = identities.IdentityTable(self.features)
+    
+    
+    def test_feature_strings(self):
+        
+        best = self.table.feature_strings_best()
+        all_ = self.table.feature_strings_all()
+        
+        for i, fe in enumerate(self.features):
+            
+            assert best[i] == fe.identities_str_best()
+            assert all_[i] == fe.identities_str_all()
+    
+    
+    def test_top(self):
+        
+        top = self.table.top(n = 2)
+        features = self.table.feature[top]
+        
+        assert np.all(np.diff(features) >= 0)
+        assert np.all(np.bincount(features) <= 2)
+        
+        for i in top:
+            
+            # the best of the feature is never left out
+            fe = self.table.feature[i]
+            
+            assert (
+                self.table.score_pct[i] <=
+                self.table.score_pct[self.table.feature == fe].max()
+            )
+        
+        best = self.table.top(n = 1)
+        
+        for i in best:
+            
+            fe = self.table.feature[i]
+            
+            assert (
+                self.table.score_pct[i] ==
+                self.table.score_pct[self.table.feature == fe].max()
+            )
+    
+    
+    def test_export(self, tmpdir):
+        
+        fname = os.path.join(str(tmpdir), 'ids.tsv')
+        self.table.export(fname, rows = self.table.top(n = 1))
+        
+        with open(fname, 'r') as fp:
+            
+            lines = fp.read().split('\n')
+        
+        assert lines[0].split('\t')[:3] == ['feature', 'scan', 'fraction']
+        assert len(lines) == len(self.table.top(n = 1)) + 1
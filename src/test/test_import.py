@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://www.ebi.ac.uk/~denes
+#
+
+import os
+import sys
+import tempfile
+import subprocess
+
+import pytest
+
+
+# heavy dependencies which should be imported only when used
+LAZY_MODULES = ('bs4', 'matplotlib', 'pandas', 'pyopenms')
+# upper bound of the cumulative import time in seconds,
+# with the dependencies above loaded it was several seconds
+IMPORT_TIME_LIMIT = 3.
+
+IMPORT_SCRIPT = """
+import sys
+import threading
+import %s
+print(','.join(m for m in %r if m in sys.modules))
+print(sum(t.name == 'lipyd-log-writer' for t in threading.enumerate()))
+print(int('db' in vars(sys.modules.get('lipyd.mass', sys))))
+"""
+
+
+def run_import(module):
+    """
+    Imports ``module`` in a new interpreter with ``-X importtime``,
+    with an empty home directory, hence without any cache.
+    Returns the heavy modules loaded, the number of log writer threads,
+    whether the mass database has been built and the cumulative import
+    times in microseconds by module.
+    """
+    
+    with tempfile.TemporaryDirectory() as home:
+        
+        proc = subprocess.run(
+            [
+                sys.executable,
+                '-X', 'importtime',
+                '-c', IMPORT_SCRIPT % (module, LAZY_MODULES),
+            ],
+            stdout = subprocess.PIPE,
+            stderr = subprocess.PIPE,
+            universal_newlines = True,
+            cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env = dict(os.environ, HOME = home),
+        )
+    
+    if proc.returncode:
+        
+        error = proc.stderr.strip().split('\n')[-1]
+        
+        if error.startswith('ModuleNotFoundError'):
+            
+            pytest.skip('Could not import `%s`: %s' % (module, error))
+        
+        pytest.fail('Could not import `%s`: %s' % (module, error))
+    
+    loaded, writers, mass_db = proc.stdout.split('\n')[-4:-1]
+    
+    times = {}
+    
+    for line in proc.stderr.split('\n'):
+        
+        if line.startswith('import time:') and '|' in line:
+            
+            _self, cumulative, name = line[12:].split('|')
+            
+            if cumulative.strip().isdigit():
+                
+                times[name.strip()] = int(cumulative)
+    
+    return (
+        [m for m in loaded.split(',') if m],
+        int(writers),
+        bool(int(mass_db)),
+        times,
+    )
+
+
+class TestImport(object):
+    
+    @pytest.mark.parametrize('module', ['lipyd', 'lipyd.ms2', 'lipyd.sample'])
+    def test_lazy_imports(self, module):
+        
+        loaded, writers, mass_db, times = run_import(module)
+        
+        assert not loaded
+        assert not mass_db
+        assert times[module] < IMPORT_TIME_LIMIT * 1e6
+    
+    def test_no_log_writer_at_import(self):
+        
+        loaded, writers, mass_db, times = run_import('lipyd')
+        
+        assert writers == 0
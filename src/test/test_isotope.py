@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://www.ebi.ac.uk/~denes
+#
+
+import numpy as np
+
+import lipyd.isotope as isotope
+import lipyd.formula as formula
+
+
+class TestIsotope(object):
+    """ """
+    
+    def test_pattern(self):
+        """ """
+        
+        mzs, abundances = isotope.pattern('C6H12O6', 3)
+        
+        assert len(mzs) == 3
+        assert abs(mzs[0] - 180.06339) < 0.0001
+        assert abs(mzs[1] - mzs[0] - 1.0034) < 0.001
+        # relative abundances as calculated by OpenMS
+        assert np.allclose(
+            abundances / abundances.sum(),
+            [0.92346, 0.06331, 0.01323],
+            atol = 0.001,
+        )
+    
+    def test_patterns(self):
+        """ """
+        
+        formulas = ['C40H80NO8P', 'H2O', 'C']
+        mzs, abundances = isotope.patterns(formulas, 4, charge = 1)
+        
+        assert mzs.shape == (3, 4)
+        
+        for i, f in enumerate(formulas):
+            
+            _mzs, _abundances = isotope.pattern(f, 4, charge = 1)
+            
+            assert np.allclose(mzs[i,:len(_mzs)], _mzs)
+            assert np.allclose(abundances[i,:len(_abundances)], _abundances)
+    
+    def test_isotope_mass(self):
+        """ """
+        
+        water = formula.Formula('H2O')
+        water_1 = formula.Formula('H2O', isotope = 1)
+        
+        assert abs(water_1.mass - water.mass - 1.005) < 0.002
+        assert (
+            abs(water_1.mass - isotope.isotope_mass('H2O', 1)) < 0.0000001
+        )
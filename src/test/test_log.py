@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://denes.omnipathdb.org/
+#
+
+import os
+
+import lipyd.log as log
+
+
+class TestLog(object):
+    
+    def test_bad_format(self, tmpdir):
+        
+        logger = log.Logger('test.log', logdir = str(tmpdir))
+        logger._ensure_writer()
+        # too many arguments for the format string
+        logger.msg('Message %s.', 1, 2)
+        logger.msg('Next message.')
+        logger.flush()
+        
+        assert logger._writer_running()
+        
+        with open(os.path.join(str(tmpdir), 'test.log')) as fp:
+            
+            content = fp.read()
+        
+        assert 'Message %s.' in content
+        assert 'Next message.' in content
+        
+        logger.close()
+    
+    def test_restart_writer(self, tmpdir):
+        
+        logger = log.Logger('test.log', logdir = str(tmpdir))
+        logger._ensure_writer()
+        # the thread ends but the logger still refers to it
+        logger._queue.put(None)
+        logger._writer.join()
+        
+        assert not logger._writer_running()
+        
+        logger._ensure_writer()
+        logger.msg('After restart.')
+        logger.flush()
+        
+        assert logger._writer_running()
+        
+        with open(os.path.join(str(tmpdir), 'test.log')) as fp:
+            
+            assert 'After restart.' in fp.read()
+        
+        logger.close()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://www.ebi.ac.uk/~denes
+#
+
+import pytest
+
+import numpy as np
+
+import lipyd.lookup as lookup
+
+
+class TestLookup(object):
+    """ """
+    
+    a = np.array([100.0, 100.001, 100.0015, 200.0, 200.0, 300.0])
+    
+    def test_findall(self):
+        """ """
+        
+        # above the value in increasing, below in decreasing order
+        assert lookup.findall(self.a, 100.0008, 10) == [1, 2, 0]
+        assert lookup.findall(self.a, 200.0, 1) == [3, 4]
+        assert lookup.findall(self.a, 250.0, 1) == []
+        assert lookup.findall(self.a, 300.0001, 1) == [5]
+        assert lookup.findall(np.array([]), 100.0) == []
+    
+    def test_find(self):
+        """ """
+        
+        assert lookup.find(self.a, 100.0008, 10) == 1
+        assert lookup.find(self.a, 200.0, 1) == 3
+        assert lookup.find(self.a, 250.0, 1) is None
+        assert lookup.find(self.a, 350.0, np.inf) == 5
+        assert lookup.find(self.a, 50.0, np.inf) == 0
+        assert lookup.find(np.array([]), 100.0, np.inf) is None
+    
+    def test_findall_many(self):
+        """ """
+        
+        ms = np.array([100.0008, 250.0, 200.0, 300.0001])
+        
+        offsets, indices = lookup.findall_many(self.a, ms, 10)
+        
+        assert list(offsets) == [0, 3, 3, 5, 6]
+        assert list(indices) == [0, 1, 2, 3, 4, 5]
+        
+        # tolerance for each value
+        offsets, indices = lookup.findall_many(
+            self.a, ms, np.array([1, 1, 1, 10]),
+        )
+        
+        assert list(np.diff(offsets)) == [0, 0, 2, 1]
+    
+    def test_findall_each(self):
+        """ """
+        
+        ms = np.array([100.0008, 250.0, 200.0, 300.0001])
+        
+        assert lookup.findall_each(self.a, ms, 10) == [
+            lookup.findall(self.a, m, 10) for m in ms
+        ]
+        assert lookup.findall_each(self.a, ms, np.array([1, 1, 1, 10])) == [
+            [], [], [3, 4], [5],
+        ]
+    
+    def test_find_many(self):
+        """ """
+        
+        ms = np.array([100.0008, 240.0, 200.0, 350.0])
+        
+        assert list(lookup.find_many(self.a, ms, 10)) == [1, -1, 3, -1]
+        assert list(lookup.find_many(self.a, ms, np.inf)) == [1, 4, 3, 5]
+    
+    def test_scalar_and_many(self):
+        """ """
+        
+        np.random.seed(1)
+        a = np.sort(np.random.uniform(100, 1000, 2000))
+        ms = np.random.uniform(90, 1010, 500)
+        
+        offsets, indices = lookup.findall_many(a, ms, 50)
+        closest = lookup.find_many(a, ms, 50)
+        
+        for i, m in enumerate(ms):
+            
+            assert (
+                sorted(lookup.findall(a, m, 50)) ==
+                list(indices[offsets[i]:offsets[i + 1]])
+            )
+            
+            c = lookup.find(a, m, 50)
+            
+            assert (-1 if c is None else c) == closest[i]
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://www.ebi.ac.uk/~denes
+#
+
+import os
+
+import pytest
+import numpy as np
+
+import lipyd.mgf as mgf
+import lipyd.common as common
+
+
+def example_reader(mgfname, **kwargs):
+    
+    return mgf.MgfReader(
+        os.path.join(common.ROOT, 'data', 'ms2_examples', mgfname),
+        charge = None,
+        **kwargs
+    )
+
+
+class TestPrecursorIndex(object):
+    
+    
+    @pytest.mark.parametrize('rt_within_range', [False, True])
+    def test_lookup(self, rt_within_range):
+        
+        readers = [
+            example_reader('neg_examples.mgf', label = 'neg'),
+            example_reader('pos_examples.mgf', label = 'pos'),
+            example_reader(
+                'neg_examples.mgf',
+                label = 'neg_drift',
+                drift = 1.00001,
+                tolerance = 5,
+            ),
+        ]
+        
+        for reader in readers:
+            
+            reader.ms2_rt_within_range = rt_within_range
+        
+        index = mgf.PrecursorIndex(readers)
+        
+        assert len(index) == sum(len(reader) for reader in readers)
+        assert index.labels == ['neg', 'pos', 'neg_drift']
+        
+        for mz, rt in readers[0].mgfindex[::7,[0,2]]:
+            
+            files, rows, rtdiff = index.lookup(mz, rt = rt + .3)
+            
+            for ifile, reader in enumerate(readers):
+                
+                idx, rtd = reader.lookup(mz, rt = rt + .3)
+                
+                assert list(rows[files == ifile]) == list(idx)
+                assert np.allclose(rtdiff[files == ifile], rtd)
+            
+            assert list(files) == sorted(files)
+    
+    
+    def test_join(self):
+        
+        readers = [
+            example_reader('neg_examples.mgf', label = 'neg'),
+            example_reader('pos_examples.mgf', label = 'pos'),
+        ]
+        index = mgf.PrecursorIndex(readers)
+        
+        mzs = np.concatenate((
+            readers[1].mgfindex[::5,0].astype(float),
+            [5000.0],
+            readers[0].mgfindex[::5,0].astype(float),
+        ))
+        rts = [None] + [10.0] * (len(mzs) - 1)
+        
+        matches = index.join(mzs, rts)
+        
+        assert len(matches.bounds) == len(mzs) + 1
+        assert np.all(np.diff(matches.feature) >= 0)
+        
+        for i, (mz, rt) in enumerate(zip(mzs, rts)):
+            
+            files, rows, rtdiff = matches.of_feature(i)
+            files_l, rows_l, rtdiff_l = index.lookup(mz, rt = rt)
+            
+            assert list(files) == list(files_l)
+            assert list(rows) == list(rows_l)
+            assert np.allclose(rtdiff, rtdiff_l, equal_nan = True)
+    
+    def test_lookup_empty(self):
+        
+        index = mgf.PrecursorIndex([example_reader('neg_examples.mgf')])
+        
+        files, rows, rtdiff = index.lookup(5000.0)
+        
+        assert len(files) == len(rows) == len(rtdiff) == 0
@@ -19,6 +19,7 @@
 
 import pytest
 
+import os
 import itertools
 import numpy as np
 import lipyd.moldb
@@ -129,3 +130,44 @@ class TestMoldb(object):
         )
         
         assert lyp_cer1p in list(result)
+    
+    def test_mz_from_names(self):
+        """ """
+        
+        names = ['PC(36:2)', 'PC(18:1/18:1)', 'PE(34:1)', 'XY(1:1)']
+        adducts = ['[M+H]+', '[M-H]-']
+        
+        mzs = self.mda.mz_from_names(names, adducts)
+        
+        assert mzs.shape == (4, 2)
+        assert np.all(np.isnan(mzs[3]))
+        assert np.allclose(mzs[0], mzs[1])
+        
+        for i, name in ((0, names[0]), (2, names[2])):
+            
+            for j, adduct in enumerate(adducts):
+                
+                assert abs(
+                    mzs[i,j] -
+                    self.mda.mz_from_name(adduct, name = name)
+                ) < 1e-9
+    
+    def test_shared(self, tmpdir):
+        
+        fname = self.mda.share(os.path.join(str(tmpdir), 'moldb.shm'))
+        mda = lipyd.moldb.MoleculeDatabaseAggregator.attach(fname)
+        
+        assert not mda.masses.flags.writeable
+        assert np.array_equal(mda.masses, self.mda.masses)
+        assert mda.data[1000] == self.mda.data[1000]
+        assert set(mda.names) == set(self.mda.names)
+        
+        result = mda.adduct_lookup(728.605042778354, ionmode = 'pos')
+        expected = self.mda.adduct_lookup(728.605042778354, ionmode = 'pos')
+        
+        assert list(result['[M+H]+'][1]) == list(expected['[M+H]+'][1])
+        assert np.array_equal(
+            mda.mass_from_names(['PC(36:2)', 'XY(1:1)']),
+            self.mda.mass_from_names(['PC(36:2)', 'XY(1:1)']),
+            equal_nan = True,
+        )
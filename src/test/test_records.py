@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://www.ebi.ac.uk/~denes
+#
+
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+import lipyd.lipproc as lipproc
+import lipyd.records as records
+import lipyd.shared as shared
+
+
+def _records():
+    
+    chains = (
+        lipproc.Chain(c = 18, u = 1, attr = lipproc.ChainAttr(sph = 'd')),
+        lipproc.Chain(c = 16, u = 0),
+    )
+    
+    return [
+        lipproc.LipidRecord(
+            lab = lipproc.LipidLabel(
+                db_id = None,
+                db = 'lipyd.lipid',
+                names = ('Cer(d34:1)',),
+                formula = 'C34H67NO3',
+            ),
+            hg = lipproc.Headgroup(main = 'Cer'),
+            chainsum = lipproc.sum_chains(chains),
+            chains = (),
+        ),
+        lipproc.LipidRecord(
+            lab = lipproc.LipidLabel(
+                db_id = 'SLM:000000001',
+                db = 'SwissLipids',
+                names = 'Ceramide (d18:1/16:0)',
+                formula = 'C34H67NO3',
+            ),
+            hg = lipproc.Headgroup(main = 'Cer'),
+            chainsum = lipproc.sum_chains(chains),
+            chains = chains,
+        ),
+        lipproc.LipidRecord(
+            lab = lipproc.LipidLabel(
+                db_id = 'LMFA00000001',
+                db = 'LipidMaps',
+                names = (),
+                formula = 'C2H4O2',
+            ),
+            hg = None,
+            chainsum = None,
+            chains = (),
+        ),
+    ]
+
+
+class TestRecords(object):
+    
+    def test_roundtrip(self):
+        
+        recs = _records()
+        store = records.RecordStore(recs)
+        
+        assert len(store) == 3
+        assert list(store) == recs
+        assert store[1].summary_str() == recs[1].summary_str()
+        assert store[-1] == recs[-1]
+        assert store.db_at(2) == 'LipidMaps'
+    
+    def test_take(self):
+        
+        recs = _records()
+        store = records.RecordStore(recs)
+        
+        reordered = store.take(np.array([2, 0, 1]))
+        
+        assert list(reordered) == [recs[2], recs[0], recs[1]]
+        
+        selected = store[np.array([1, 2])]
+        
+        assert selected.dtype == object
+        assert selected[0] == recs[1]
+    
+    def test_indices(self):
+        
+        recs = _records()
+        store = records.RecordStore(recs)
+        
+        assert list(store[1:]) == recs[1:]
+        assert list(store[::-2]) == recs[::-2]
+        assert list(store[[-1, 0]]) == [recs[-1], recs[0]]
+        assert list(store[np.array([True, False, True])]) == [
+            recs[0],
+            recs[2],
+        ]
+        assert len(store[[]]) == 0
+        assert list(store.take(slice(2, 0, -1))) == [recs[2], recs[1]]
+        
+        for idx in ([3], [-4], [True, False], [0.5]):
+            
+            with pytest.raises(IndexError):
+                
+                store[idx]
+    
+    def test_pickle(self):
+        
+        store = records.RecordStore(_records())
+        store2 = pickle.loads(pickle.dumps(store))
+        
+        assert list(store2) == list(store)
+    
+    def test_concatenate(self):
+        
+        recs = _records()
+        store1 = records.RecordStore(recs[:2])
+        store2 = records.RecordStore(recs[2:] + recs[:1]).take([1, 0])
+        
+        store = records.RecordStore.concatenate([store1, store2])
+        
+        assert list(store) == recs[:2] + [recs[0], recs[2]]
+        assert store.chain_start[-1] == len(recs[1].chains)
+    
+    def test_shared(self, tmpdir):
+        
+        recs = _records()
+        store = records.RecordStore(recs)
+        fname = shared.save(
+            os.path.join(str(tmpdir), 'records.shm'),
+            store.arrays(prefix = 'data_'),
+            store.values,
+        )
+        
+        arrays, values = shared.load(fname)
+        store2 = records.RecordStore.from_arrays(
+            arrays,
+            values,
+            prefix = 'data_',
+        )
+        
+        assert not store2.db.flags.writeable
+        assert list(store2) == recs
+        assert list(store2.take([2, 0])) == [recs[2], recs[0]]
+        assert list(
+            records.RecordStore.concatenate([store2, store])
+        ) == recs + recs
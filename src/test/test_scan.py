@@ -20,6 +20,9 @@
 import pytest
 
 import os
+import itertools
+import pickle
+import numpy as np
 
 import lipyd.mgf as mgf
 import lipyd.fragdb as fragdb
@@ -2621,6 +2624,43 @@ specimens = [
 ]
 
 
+def identify_per_record(scan, ms1_records = None):
+    """
+    Identifies a scan record by record, without ``ms2.identify_batch``,
+    as a reference for the batch identification.
+    """
+    
+    result = {}
+    
+    for add, rec, precursor_details in scan.iterrecords(
+        ms1_records = ms1_records,
+    ):
+        
+        if rec.hg is None:
+            
+            continue
+        
+        rec_str = rec.summary_str()
+        
+        if rec_str not in result and rec.hg in ms2.idmethods[scan.ionmode]:
+            
+            method = ms2.idmethods[scan.ionmode][rec.hg]
+            
+            result[rec_str] = tuple(
+                method(
+                    record = rec,
+                    scan = scan,
+                    adduct = (
+                        None if add in {'[M+H]+', '[M-H]-'} else add
+                    ),
+                    adduct_str = add,
+                    precursor_details = precursor_details,
+                ).identify()
+            )
+    
+    return result
+
+
 class TestScan(object):
     """ """
     
@@ -2704,3 +2744,475 @@ class TestScan(object):
                     highest_for_name < highest_score
                 )
             )
+    
+    @pytest.mark.parametrize(
+        'mgfname, ionmode, scan_id',
+        [('neg_examples.mgf', 'neg', 1596), ('pos_examples.mgf', 'pos', 2397)]
+    )
+    def test_annot_index(self, mgfname, ionmode, scan_id):
+        """ """
+        
+        mgfpath = os.path.join(common.ROOT, 'data', 'ms2_examples', mgfname)
+        scan = ms2.Scan.from_mgf(mgfpath, scan_id, ionmode)
+        
+        for frag_type, chain_type, c, u in (
+            (None, 'FA', None, None),
+            (None, 'Sph', None, None),
+            ({'FA-H', 'FA-H2O-H'}, None, 16, 0),
+            (None, (False, {'FA'}), None, None),
+            (None, None, 18, {1, 2}),
+        ):
+            
+            expected = [
+                i for i in range(len(scan))
+                if scan.chain_fragment_type_is(
+                    i,
+                    frag_type = frag_type,
+                    chain_type = chain_type,
+                    c = c,
+                    u = u,
+                )
+            ]
+            
+            assert list(scan.fragments_by_chain_type(
+                frag_type = frag_type,
+                chain_type = chain_type,
+                c = c,
+                u = u,
+            )) == expected
+            
+            for head in (1, 3, 10):
+                
+                assert scan.chain_among_most_abundant(
+                    head,
+                    frag_type = frag_type,
+                    chain_type = chain_type,
+                    c = c,
+                    u = u,
+                ) == any(i < head for i in expected)
+    
+    @pytest.mark.parametrize(
+        'mgfname, ionmode, scan_id',
+        [('neg_examples.mgf', 'neg', 1596), ('pos_examples.mgf', 'pos', 2397)]
+    )
+    def test_top_mzs(self, mgfname, ionmode, scan_id):
+        """ """
+        
+        mgfpath = os.path.join(common.ROOT, 'data', 'ms2_examples', mgfname)
+        scan = ms2.Scan.from_mgf(mgfpath, scan_id, ionmode)
+        
+        for n in (1, 2, 5):
+            
+            for i in range(len(scan)):
+                
+                assert scan.mz_among_most_abundant(scan.mzs[i], n = n) == (
+                    i < n or
+                    any(
+                        abs(scan.mzs[i] - scan.mzs[j]) <=
+                        scan.mzs[i] * scan.tolerance * 1e-6
+                        for j in range(n)
+                    )
+                )
+    
+    def test_fragment_combinations(self):
+        """ """
+        
+        frags = [
+            [ms2.ChainFragment(c, u, 'FA-H', 'FA', i, 1.0) for c, u in cus]
+            for i, cus in enumerate((
+                ((16, 0), (18, 1), (18, 2), (16, 0)),
+                ((18, 1), (16, 0), (20, 4)),
+                ((16, 0), (18, 2), (18, 1)),
+            ))
+        ]
+        
+        for n in (0, 1, 2, 3):
+            
+            for c, u in ((0, 0), (34, 1), (36, 3), (52, 3), (54, 6)):
+                
+                assert list(ms2.fragment_combinations(frags[:n], c, u)) == [
+                    frag_comb
+                    for frag_comb in itertools.product(*frags[:n])
+                    if (
+                        sum(frag.c for frag in frag_comb) == c and
+                        sum(frag.u for frag in frag_comb) == u
+                    )
+                ]
+    
+    def test_identify_batch(self):
+        """ """
+        
+        scans = [
+            ms2.Scan.from_mgf(
+                os.path.join(common.ROOT, 'data', 'ms2_examples', mgfname),
+                scan_id,
+                ionmode,
+            )
+            for mgfname, ionmode, scan_id in (
+                ('neg_examples.mgf', 'neg', 1596),
+                ('pos_examples.mgf', 'pos', 2397),
+                ('neg_examples.mgf', 'neg', 1573),
+            )
+        ]
+        
+        result = ms2.identify_batch(scans)
+        
+        assert len(result) == len(scans)
+        assert any(any(identities.values()) for identities in result)
+        
+        for scan, identities in zip(scans, result):
+            
+            reference = identify_per_record(scan)
+            
+            assert identities == reference
+            assert list(identities.keys()) == list(reference.keys())
+        
+        # records of another scan
+        result = ms2.identify_batch(scans[:1], scans[2].ms1_records)
+        reference = identify_per_record(scans[0], scans[2].ms1_records)
+        
+        assert result == [reference]
+        assert result == ms2.identify_batch(
+            [scans[0]],
+            [scans[2].ms1_records],
+        )
+    
+    def test_constraint_positions(self):
+        """ """
+        
+        scan = ms2.Scan.from_mgf(
+            os.path.join(
+                common.ROOT, 'data', 'ms2_examples', 'neg_examples.mgf'
+            ),
+            1596,
+            'neg',
+        )
+        rec = next(
+            rec
+            for add, rec, precursor_details in scan.iterrecords()
+            if rec.hg is not None and rec.chainsum
+        )
+        frag_type = next(
+            frag_type
+            for frag_type in fragdb.get_db('neg').constraints
+            if scan.positions_for_frag_type(rec, frag_type)
+        )
+        
+        try:
+            
+            # a new database with other constraints
+            fragdb.init_db('neg')
+            fragdb.get_db('neg').constraints[frag_type] = ()
+            
+            assert not scan.positions_for_frag_type(rec, frag_type)
+            
+        finally:
+            
+            fragdb.init_db('neg')
+        
+        assert scan.positions_for_frag_type(rec, frag_type)
+    
+    @pytest.mark.parametrize(
+        'mgfname, ionmode, scan_id, adduct',
+        [
+            ('neg_examples.mgf', 'neg', 1596, '[M+HCOO]-'),
+            ('pos_examples.mgf', 'pos', 2397, '[M+NH4]+'),
+        ]
+    )
+    def test_adduct_annot(self, mgfname, ionmode, scan_id, adduct):
+        """ """
+        
+        mgfpath = os.path.join(common.ROOT, 'data', 'ms2_examples', mgfname)
+        scan = ms2.Scan.from_mgf(mgfpath, scan_id, ionmode)
+        
+        scan.adduct(adduct)
+        fake_precursor = scan.adducts[adduct]['fake_precursor']
+        
+        assert fake_precursor != scan.precursor
+        assert (
+            list(scan.adduct_annot(adduct)) ==
+            list(scan.get_annot(fake_precursor))
+        )
+    
+    def test_feature_precursor_index(self):
+        """ """
+        
+        mgfpath = os.path.join(
+            common.ROOT, 'data', 'ms2_examples', 'neg_examples.mgf'
+        )
+        reader = mgf.MgfReader(mgfpath, charge = None)
+        resources = {'a': mgfpath, 'b': [reader]}
+        index = ms2.precursor_index(resources)
+        mz, rt = reader.mgfindex[reader.mgfindex[:,3] == 1596][0,[0,2]]
+        
+        fe = ms2.MS2Feature(
+            mz = mz,
+            ionmode = 'neg',
+            resources = resources,
+            rt = rt,
+            precursor_index = index,
+        )
+        
+        scans = [
+            (sc.scan_id, sc.sample_id, sc.deltart)
+            for sc in fe.iterscans()
+        ]
+        # scans by looking up each resource separately
+        scans_resources = [
+            (sc.scan_id, sc.sample_id, sc.deltart)
+            for resource, res_type, sample_id in fe.iterresources()
+            for sc in fe.mgf_iterscans(resource, sample_id)
+        ]
+        
+        assert scans
+        assert scans == scans_resources
+        
+        fe_join = ms2.MS2Feature(
+            mz = mz,
+            ionmode = 'neg',
+            resources = resources,
+            rt = rt,
+            precursor_index = index,
+            precursor_matches = index.join([mz], [rt]).of_feature(0),
+        )
+        
+        assert [
+            (sc.scan_id, sc.sample_id, sc.deltart)
+            for sc in fe_join.iterscans()
+        ] == scans
+        assert fe.has_scan_within_rt_range()
+        
+        closest = fe.closest_scan(only_samples = {'b'})
+        
+        assert closest.sample_id == 'b'
+        assert closest.scan_id == 1596
+    
+    def test_preprocess_peaks(self):
+        """ """
+        
+        mzs = np.array([
+            200.0, 184.0733, 185.0767, 300.0, 300.001, 100.0, 201.0034,
+        ])
+        intensities = np.array([
+            50.0, 1000.0, 200.0, 30.0, 40.0, 5.0, 10.0,
+        ])
+        
+        def kept(**kwargs):
+            
+            return list(
+                mzs[
+                    ms2.preprocess_peaks(
+                        mzs,
+                        intensities,
+                        ms2.ScanPreprocessing(**kwargs),
+                        tolerance = 20,
+                    )
+                ]
+            )
+        
+        assert kept() == list(mzs)
+        assert kept(min_intensity = 30) == [
+            200.0, 184.0733, 185.0767, 300.0, 300.001,
+        ]
+        assert kept(min_relative_intensity = .1) == [184.0733, 185.0767]
+        assert kept(top_n = 3) == [200.0, 184.0733, 185.0767]
+        assert kept(deisotope = True) == [
+            200.0, 184.0733, 300.0, 300.001, 100.0,
+        ]
+        assert kept(deduplicate_tolerance = 10) == [
+            200.0, 184.0733, 185.0767, 300.001, 100.0, 201.0034,
+        ]
+    
+    def test_scan_preprocessing(self):
+        """ """
+        
+        mgfpath = os.path.join(
+            common.ROOT, 'data', 'ms2_examples', 'neg_examples.mgf'
+        )
+        scan = ms2.Scan.from_mgf(mgfpath, 1596, 'neg')
+        scan_top = ms2.Scan.from_mgf(
+            mgfpath,
+            1596,
+            'neg',
+            preprocessing = {'top_n': 10},
+        )
+        
+        assert not scan.scan_details.preprocessing
+        assert scan_top.scan_details.preprocessing.top_n == 10
+        assert len(scan_top) == 10
+        assert len(scan_top.annot) == 10
+        assert set(scan_top.mzs) == set(scan.mzs[:10])
+    
+    def test_cluster_scans(self):
+        """ """
+        
+        mgfpath = os.path.join(
+            common.ROOT, 'data', 'ms2_examples', 'neg_examples.mgf'
+        )
+        scans = [
+            ms2.Scan.from_mgf(mgfpath, scan_id, 'neg', rt = rt)
+            for scan_id, rt in ((1596, 10.0), (1596, 10.2), (1573, 10.0))
+        ]
+        # slightly different intensities
+        scans[1].intensities = scans[1].intensities * np.linspace(
+            .9, 1.1, len(scans[1])
+        )
+        
+        vectors = ms2.spectrum_vectors(scans)
+        
+        assert vectors.shape[0] == 3
+        assert np.allclose(vectors.multiply(vectors).sum(axis = 1), 1)
+        assert list(ms2.cluster_scans(scans)) == [0, 0, 2]
+        assert list(ms2.cluster_scans(scans, rt_tolerance = .1)) == [0, 1, 2]
+        assert list(ms2.cluster_scans(scans[2:])) == [0]
+    
+    def test_feature_cluster_duplicates(self):
+        """ """
+        
+        mgfpath = os.path.join(
+            common.ROOT, 'data', 'ms2_examples', 'neg_examples.mgf'
+        )
+        reader = mgf.MgfReader(mgfpath, charge = None)
+        mz, rt = reader.mgfindex[reader.mgfindex[:,3] == 1596][0,[0,2]]
+        
+        features = [
+            ms2.MS2Feature(
+                mz = mz,
+                ionmode = 'neg',
+                resources = {'a': mgfpath, 'b': mgfpath},
+                rt = rt,
+                cluster_duplicates = cluster_duplicates,
+            )
+            for cluster_duplicates in (False, True)
+        ]
+        
+        for fe in features:
+            
+            fe.build_scans()
+            fe.identify()
+        
+        assert features[0].identities == features[1].identities
+        
+        for identities in features[1].identities:
+            
+            for idents in identities.values():
+                
+                for ident in idents:
+                    
+                    details = ident.scan_details
+                    
+                    assert (
+                        details.representative is None or
+                        details.representative[0] != details.sample_id
+                    )
+        
+        assert any(
+            sc.scan_details.representative is not None
+            for sc in features[1].scans
+        )
+    
+    def test_feature_result(self):
+        """ """
+        
+        mgfpath = os.path.join(
+            common.ROOT, 'data', 'ms2_examples', 'neg_examples.mgf'
+        )
+        reader = mgf.MgfReader(mgfpath, charge = None)
+        mz, rt = reader.mgfindex[reader.mgfindex[:,3] == 1596][0,[0,2]]
+        
+        fe = ms2.MS2Feature(
+            mz = mz,
+            ionmode = 'neg',
+            resources = {'a': mgfpath},
+            rt = rt,
+        )
+        fe.main()
+        result = fe.result()
+        
+        assert not hasattr(result, 'scans')
+        assert not hasattr(result, 'ms1_records')
+        assert len(result.scan_refs) == len(fe.scans)
+        assert result.identities_str_all() == fe.identities_str_all()
+        assert result.identity_summary() == fe.identity_summary()
+        assert result.best_scan_ref()[:3] == (
+            mgfpath,
+            fe.scan_refs[0][1],
+            'a',
+        )
+        
+        scan = result.load_scan(ms1_records = fe.ms1_records)
+        
+        assert scan.scan_id == fe.scans[0].scan_id
+        assert scan.sample_id == fe.scans[0].sample_id == 'a'
+        assert scan.add_precursor_details == fe.scans[0].add_precursor_details
+        assert list(scan.mzs) == list(fe.scans[0].mzs)
+        assert scan.identify() == fe.scans[0].identify()
+        
+        restored = pickle.loads(pickle.dumps(result))
+        
+        assert restored.identities_str_all() == fe.identities_str_all()
+    
+    def test_feature_result_charge(self):
+        """ """
+        
+        mgfpath = os.path.join(
+            common.ROOT, 'data', 'ms2_examples', 'neg_examples.mgf'
+        )
+        # the charge filter changes the rows of the MGF index
+        reader = mgf.MgfReader(mgfpath, charge = 1)
+        mz, rt = reader.mgfindex[reader.mgfindex[:,3] == 2160][0,[0,2]]
+        
+        assert (
+            mgf.MgfReader(mgfpath, charge = None).mgfindex[10,3] !=
+            reader.mgfindex[10,3]
+        )
+        
+        fe = ms2.MS2Feature(
+            mz = mz,
+            ionmode = 'neg',
+            resources = {'a': reader},
+            rt = rt,
+        )
+        fe.main()
+        result = fe.result()
+        
+        assert len(result.scan_refs)
+        
+        for i, sc in enumerate(fe.scans):
+            
+            scan = result.load_scan(i)
+            
+            assert scan.scan_id == sc.scan_id
+            assert scan.rt == sc.rt
+            assert list(scan.mzs) == list(sc.mzs)
+    
+    def test_feature_input_digest(self):
+        """ """
+        
+        mgfpath = os.path.join(
+            common.ROOT, 'data', 'ms2_examples', 'neg_examples.mgf'
+        )
+        
+        def digest(rt, **kwargs):
+            
+            return ms2.MS2Feature(
+                mz = 728.5694,
+                ionmode = 'neg',
+                resources = {'a': mgfpath},
+                rt = rt,
+                **kwargs
+            ).input_digest()
+        
+        assert digest(10.0) == digest(10.0)
+        assert digest(10.0) != digest(10.1)
+        assert digest(10.0) != digest(10.0, check_rt = False)
+        
+        def signature(**kwargs):
+            
+            return ms2.resources_signature(
+                {'a': mgf.MgfReader(mgfpath, charge = None, **kwargs)}
+            )
+        
+        assert signature(drift = 1.0) == signature(drift = 1.0)
+        assert signature(drift = 1.0) != signature(drift = 1.000002)
+        assert signature(tolerance = 10.) != signature(tolerance = 5.)
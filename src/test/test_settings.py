@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://www.ebi.ac.uk/~denes
+#
+
+
+import types
+
+import pytest
+
+import lipyd.settings as settings
+
+
+class TestSettings(object):
+    """ """
+    
+    @pytest.fixture(autouse = True)
+    def auto_inject_fixture(self):
+        """ """
+        
+        yield
+        settings.reset('ms2_tolerance')
+    
+    def test_frozen(self):
+        """ """
+        
+        ad2ex = settings.frozen('ad2ex')
+        
+        assert ad2ex is settings.frozen('ad2ex')
+        assert isinstance(ad2ex, types.MappingProxyType)
+        assert ad2ex == settings.get('ad2ex')
+        assert isinstance(settings.frozen('datadirs'), tuple)
+        assert isinstance(
+            settings.frozen('adducts_default')['neg'][1],
+            frozenset,
+        )
+        
+        with pytest.raises(TypeError):
+            
+            ad2ex[1]['pos']['[M+H]+'] = 'add_h'
+        
+        assert settings.frozen('no_such_parameter') is None
+    
+    def test_versions(self):
+        """ """
+        
+        snapshot = settings.snapshot()
+        version = settings.version
+        ad2ex = settings.frozen('ad2ex')
+        
+        assert snapshot.current
+        assert snapshot.ad2ex is ad2ex
+        assert snapshot['ms2_tolerance'] == settings.get('ms2_tolerance')
+        
+        settings.setup(ms2_tolerance = 123)
+        
+        assert settings.version == version + 1
+        assert not snapshot.current
+        assert snapshot.ms2_tolerance == 123
+        assert settings.frozen('ad2ex') is not ad2ex
+        assert settings.frozen('ad2ex') == ad2ex
+        
+        settings.reset('ms2_tolerance')
+        
+        assert settings.version == version + 2
+        assert snapshot.ms2_tolerance == settings.get_default('ms2_tolerance')
+        assert 'ms2_tolerance' in snapshot
+        
+        with pytest.raises(KeyError):
+            
+            snapshot['no_such_parameter']
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://denes.omnipathdb.org/
+#
+
+import os
+import sys
+import subprocess
+
+import pytest
+import numpy as np
+
+import lipyd.common as common
+import lipyd.mgf as mgf
+import lipyd.moldb as moldb
+import lipyd.ms2 as ms2
+import lipyd.shard as shard
+
+
+class EmptyDatabase(object):
+    """
+    A database without records, only the autogenerated metabolites
+    are used with this.
+    """
+    
+    def __init__(self, **kwargs):
+        
+        pass
+    
+    def __iter__(self):
+        
+        return iter(())
+
+
+class TestShard(object):
+    
+    
+    def test_assign_shards(self):
+        
+        mzs = np.array([700.5, 300.2, 500.1, 800.3, 400.4, 600.6, 200.7])
+        shards = shard.assign_shards(mzs, 3)
+        
+        assert np.bincount(shards).tolist() == [3, 2, 2]
+        
+        # contiguous m/z ranges
+        for i in range(2):
+            
+            assert mzs[shards == i].max() < mzs[shards == i + 1].min()
+    
+    def test_job_resources(self):
+        
+        mgfpath = os.path.join(
+            common.ROOT, 'data', 'ms2_examples', 'neg_examples.mgf'
+        )
+        reader = mgf.MgfReader(
+            mgfpath,
+            charge = None,
+            drift = 1.000002,
+            tolerance = 7.,
+            rt_tolerance = .5,
+        )
+        
+        job = shard.make_jobs(
+            np.array([700.5, 300.2]),
+            'neg',
+            {('A', 1): reader, ('A', 2): mgfpath},
+            1,
+            database_args = {},
+        )[0]
+        
+        assert 'adducts_default' in job['settings']
+        assert 'ex2ad' in job['settings']
+        
+        resources = shard._readers(job['resources'])
+        reader2 = resources[('A', 1)][0]
+        
+        assert isinstance(reader2, mgf.MgfReader)
+        assert reader2.fname == os.path.abspath(mgfpath)
+        assert (reader2.drift, reader2.tolerance, reader2.rt_tolerance) == (
+            1.000002, 7., .5
+        )
+        assert resources[('A', 2)] == [os.path.abspath(mgfpath)]
+    
+    def test_shards_processes(self, tmpdir):
+        
+        mgfpath = os.path.join(
+            common.ROOT, 'data', 'ms2_examples', 'neg_examples.mgf'
+        )
+        reader = mgf.MgfReader(mgfpath, charge = None)
+        mzs = reader.mgfindex[:24,0].astype(np.float64)
+        rts = np.array(
+            [np.nan if rt is None else rt for rt in reader.mgfindex[:24,2]]
+        )
+        resources = {('A', 1): mgfpath}
+        database_args = {'resources': {'empty': (EmptyDatabase, {})}}
+        
+        jobs = shard.save_jobs(
+            shard.make_jobs(
+                mzs,
+                'neg',
+                resources,
+                3,
+                rts = rts,
+                database_args = database_args,
+            ),
+            os.path.join(str(tmpdir), 'test'),
+        )
+        
+        src = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        
+        for job in jobs:
+            
+            subprocess.check_call(
+                [sys.executable, '-m', 'lipyd.shard', job],
+                cwd = src,
+                stdout = subprocess.DEVNULL,
+                stderr = subprocess.DEVNULL,
+            )
+        
+        records, ms2_identities = shard.merge_results(
+            [shard.result_fname(job) for job in jobs],
+            mzs = mzs,
+        )
+        
+        assert len(ms2_identities) == len(mzs)
+        
+        # the same in one process
+        db = getattr(moldb, 'db', None)
+        moldb.init_db(**database_args)
+        
+        try:
+            
+            expected = ms2.analyse_features(
+                mzs,
+                'neg',
+                resources,
+                rts = rts,
+                ms1_records = moldb.adduct_lookup_many(mzs, ionmode = 'neg'),
+            )
+            
+        finally:
+            
+            if db is None:
+                
+                delattr(moldb, 'db')
+                
+            else:
+                
+                moldb.db = db
+        
+        # the order of equally scored identities depends on hashing
+        # which is different in each process
+        assert [
+            sorted(fe.identities_str_all().split(';'))
+            for fe in ms2_identities
+        ] == [
+            sorted(fe.identities_str_all().split(';'))
+            for fe in expected
+        ]
+        assert any(fe.identities for fe in expected)
+        
+        with pytest.raises(RuntimeError):
+            
+            shard.merge_results([shard.result_fname(jobs[0])])
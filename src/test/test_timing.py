@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#
+#  This file is part of the `lipyd` python module
+#
+#  Copyright (c) 2015-2019 - EMBL
+#
+#  File author(s):
+#  Dénes Türei (turei.denes@gmail.com)
+#  Igor Bulanov
+#
+#  Distributed under the GNU GPLv3 License.
+#  See accompanying file LICENSE.txt or copy at
+#      http://www.gnu.org/licenses/gpl-3.0.html
+#
+#  Website: http://www.ebi.ac.uk/~denes
+#
+
+
+import json
+
+import pytest
+
+import lipyd.settings as settings
+import lipyd.timing as timing
+
+
+class TestTiming(object):
+    """ """
+    
+    @pytest.fixture(autouse = True)
+    def auto_inject_fixture(self):
+        """ """
+        
+        timing.reset()
+        timing.enable()
+        yield
+        timing.disable()
+        timing.reset()
+    
+    def test_timed(self):
+        """ """
+        
+        class Identifier(object):
+            
+            @timing.timed('identify', per_class = True)
+            def identify(self):
+                
+                for i in range(3):
+                    
+                    yield i
+        
+        @timing.timed('stage')
+        def stage():
+            
+            return 1
+        
+        assert stage() == 1
+        assert list(Identifier().identify()) == [0, 1, 2]
+        
+        timing.disable()
+        stage()
+        
+        stages = timing.report()['stages']
+        
+        assert stages['stage']['calls'] == 1
+        assert stages['identify.Identifier']['calls'] == 1
+    
+    def test_setting(self):
+        """ """
+        
+        @timing.timed('stage')
+        def stage():
+            
+            return 1
+        
+        timing.disable()
+        settings.setup(timing = True)
+        
+        assert timing.is_enabled()
+        
+        stage()
+        settings.setup(timing = False)
+        stage()
+        
+        assert not timing.is_enabled()
+        assert timing.report()['stages']['stage']['calls'] == 1
+    
+    def test_export(self, tmpdir):
+        """ """
+        
+        with timing.timer('block'):
+            
+            timing.count('items', 5)
+        
+        path = str(tmpdir.join('timing.json'))
+        timing.export(path)
+        
+        with open(path, 'r') as fp:
+            
+            result = json.load(fp)
+        
+        assert result['stages']['block']['calls'] == 1
+        assert result['counters']['items'] == 5